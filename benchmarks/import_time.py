@@ -0,0 +1,68 @@
+"""Замер времени запуска: сколько занимает импорт модулей moneyscope в новом интерпретаторе.
+
+Каждый модуль импортируется в отдельном процессе несколько раз, печатается медиана и список
+тяжёлых библиотек, загруженных при импорте. Запуск из корня репозитория:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 20 moneyscope.views
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+MODULES = ["moneyscope.main", "moneyscope.views", "moneyscope.services", "moneyscope.reports", "moneyscope.utils"]
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "openpyxl", "requests"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> Dict:
+    """Импортирует модуль repeat раз в новых процессах и возвращает медиану времени импорта"""
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+    timings: List[float] = []
+    loaded: List[str] = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded = result["loaded"]
+    return {"module": module, "median_ms": round(statistics.median(timings) * 1000, 1), "heavy_loaded": loaded}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="вывести результат в формате JSON")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=4))
+        return
+    for result in results:
+        heavy = ", ".join(result["heavy_loaded"]) or "—"
+        print(f"{result['module']:<24} {result['median_ms']:>8.1f} мс   загружены: {heavy}")
+
+
+if __name__ == "__main__":
+    main()
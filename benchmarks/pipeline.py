@@ -0,0 +1,191 @@
+"""Замер основных этапов обработки на синтетических выгрузках от 10^4 до 10^7 строк.
+
+Для каждого размера генерируется синтетическая выгрузка (moneyscope.synthetic) и замеряются
+read_operations, get_main_page, top_3_cashback_categories, spending_by_category и get_top_transactions.
+Результаты (медиана нескольких повторов) сравниваются с базовой линией в JSON-файле: если этап стал
+медленнее базовой линии больше чем на --threshold, скрипт завершается с кодом 1.
+С --check отсутствие базовой линии тоже считается ошибкой. Запуск из корня репозитория:
+
+    python benchmarks/pipeline.py --save-baseline
+    python benchmarks/pipeline.py --check
+    python benchmarks/pipeline.py --sizes 10000 10000000 --threshold 0.5
+
+Сгенерированные выгрузки сохраняются в --data-dir и переиспользуются при следующих запусках.
+XLSX пишется только для размеров не больше --xlsx-max-rows (запись и разбор XLSX медленные,
+а лист вмещает около миллиона строк); для остальных размеров данные читаются из Parquet.
+Курсы валют и цены акций не запрашиваются: в замер попадает только обработка данных.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = ROOT_DIR / "benchmarks" / "baseline.json"
+DEFAULT_DATA_DIR = ROOT_DIR / "benchmarks" / "data"
+
+# Отчёты, логи и настройки — во временной папке; пустые настройки отключают запросы котировок
+WORK_DIR = Path(tempfile.mkdtemp(prefix="moneyscope_bench_"))
+(WORK_DIR / "user_settings.json").write_text('{"user_currencies": [], "user_stocks": []}', encoding="utf-8")
+os.environ.update(
+    REPORT_FILES_DIR=str(WORK_DIR / "reports"),
+    LOG_FILES_DIR=str(WORK_DIR / "log"),
+    USER_SETTINGS_PATH=str(WORK_DIR / "user_settings.json"),
+)
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from moneyscope.memo import clear_memo  # noqa: E402
+from moneyscope.reports import flush_reports, spending_by_category  # noqa: E402
+from moneyscope.services import top_3_cashback_categories  # noqa: E402
+from moneyscope.synthetic import XLSX_MAX_ROWS, load_synthetic, write_synthetic  # noqa: E402
+from moneyscope.utils import OperationsSnapshot, get_top_transactions, read_operations  # noqa: E402
+from moneyscope.views import get_main_page  # noqa: E402
+
+# Момент «сейчас» для главной страницы и отчётов: конец периода синтетической выгрузки
+NOW = "2021-12-31 16:44:00"
+
+
+def timed(func: Callable[[], Any], repeat: int) -> float:
+    """Медиана времени выполнения func в секундах. Перед каждым повтором кэши результатов очищаются"""
+    timings: List[float] = []
+    for _ in range(repeat):
+        clear_memo()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def dataset(data_dir: Path, rows: int, suffix: str, seed: int) -> Path:
+    """Путь к синтетической выгрузке; файл генерируется, если его ещё нет"""
+    path = data_dir / f"operations_{rows}_{seed}{suffix}"
+    if not path.is_file():
+        print(f"Генерация {path.name}...", file=sys.stderr)
+        write_synthetic(path, rows, seed)
+    return path
+
+
+def run_size(rows: int, args: argparse.Namespace) -> Dict[str, float]:
+    """Замеры всех этапов для одного размера данных"""
+    results: Dict[str, float] = {}
+    data_dir = Path(args.data_dir)
+
+    if rows <= min(args.xlsx_max_rows, XLSX_MAX_ROWS):
+        xlsx = dataset(data_dir, rows, ".xlsx", args.seed)
+        # Разбор XLSX долгий и стабильный по времени, поэтому замеряется один раз
+        results["read_operations_xlsx"] = timed(lambda: read_operations(xlsx, use_cache=False), 1)
+        read_operations(xlsx)
+        results["read_operations_cached"] = timed(lambda: read_operations(xlsx), args.repeat)
+
+    parquet = dataset(data_dir, rows, ".parquet", args.seed)
+    results["load_parquet"] = timed(lambda: load_synthetic(parquet), args.repeat)
+    operations = load_synthetic(parquet)
+
+    started = time.perf_counter()
+    snapshot = OperationsSnapshot(operations, version=1, mtime_ns=None)
+    results["snapshot"] = time.perf_counter() - started
+
+    results["get_main_page"] = timed(lambda: get_main_page(NOW, snapshot, deadline=None), args.repeat)
+    results["top_3_cashback_categories"] = timed(lambda: top_3_cashback_categories(snapshot, 2021, 12), args.repeat)
+    results["spending_by_category"] = timed(
+        lambda: spending_by_category(snapshot, "Супермаркеты", "31.12.2021"), args.repeat
+    )
+    results["get_top_transactions"] = timed(lambda: get_top_transactions(operations), args.repeat)
+    flush_reports()
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float, min_delta: float
+) -> List[str]:
+    """Этапы, которые стали медленнее базовой линии больше чем в (1 + threshold) раз.
+    Разница меньше min_delta секунд считается шумом"""
+    regressions = []
+    for size, stages in results.items():
+        for stage, seconds in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            if seconds > base * (1 + threshold) and seconds - base > min_delta:
+                regressions.append(f"{size} строк, {stage}: {base * 1000:.1f} мс -> {seconds * 1000:.1f} мс")
+    return regressions
+
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.is_file():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        baseline: Dict[str, Any] = json.load(f)
+    return baseline
+
+
+def save_baseline(path: Path, results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Any]]) -> None:
+    """Сохраняет результаты как базовую линию; замеры других размеров из старой базовой линии сохраняются"""
+    sizes = dict(baseline["results"]) if baseline else {}
+    sizes.update(results)
+    data = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpu": platform.processor()},
+        "results": sizes,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="число строк выгрузки")
+    parser.add_argument("--repeat", type=int, default=3, help="число повторов каждого замера")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help="папка для синтетических выгрузок")
+    parser.add_argument(
+        "--xlsx-max-rows", type=int, default=100_000, help="наибольший размер, для которого пишется XLSX"
+    )
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="JSON-файл базовой линии")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как базовую линию")
+    parser.add_argument("--check", action="store_true", help="завершиться с ошибкой, если базовой линии нет")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление, доля (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="разница в секундах, которая считается шумом")
+    parser.add_argument("--json", action="store_true", help="вывести результат в формате JSON")
+    args = parser.parse_args()
+
+    results = {str(rows): run_size(rows, args) for rows in args.sizes}
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=4))
+    else:
+        for size, stages in results.items():
+            for stage, seconds in stages.items():
+                print(f"{size:>10} строк   {stage:<28} {seconds * 1000:>10.1f} мс")
+
+    baseline_path = Path(args.baseline)
+    baseline = load_baseline(baseline_path)
+    if args.check and baseline is None and not args.save_baseline:
+        print(f"Базовая линия {baseline_path} не найдена", file=sys.stderr)
+        sys.exit(1)
+    if args.save_baseline:
+        save_baseline(baseline_path, results, baseline)
+        print(f"Базовая линия сохранена в {baseline_path}", file=sys.stderr)
+        return
+    if baseline is None:
+        print(f"Базовая линия {baseline_path} не найдена, сравнение пропущено", file=sys.stderr)
+        return
+
+    regressions = compare(results, baseline["results"], args.threshold, args.min_delta)
+    if regressions:
+        print("Замедление относительно базовой линии:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        sys.exit(1)
+    print("Замедлений относительно базовой линии нет", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
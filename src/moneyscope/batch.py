@@ -0,0 +1,291 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from moneyscope.logger_config import logger
+
+# Время на обработку одного пользователя по умолчанию, в секундах
+DEFAULT_JOB_TIMEOUT = 300.0
+
+# Статусы заданий в файле прогресса
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+
+def load_manifest(path: Union[str, Path]) -> List[Dict[str, str]]:
+    """Читает манифест пакетной обработки: JSON-список или CSV с полями operations, settings, output
+    и необязательным id. Относительные пути считаются от папки манифеста.
+    Если id не задан, им служит папка результатов"""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            entries: List[Dict[str, Any]] = list(csv.DictReader(f))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+
+    jobs = []
+    for number, entry in enumerate(entries, start=1):
+        missing = [field for field in ("operations", "settings", "output") if not entry.get(field)]
+        if missing:
+            raise ValueError(f"В записи {number} манифеста нет полей: {', '.join(missing)}")
+        job = {field: str(path.parent / entry[field]) for field in ("operations", "settings", "output")}
+        job["id"] = str(entry.get("id") or job["output"])
+        jobs.append(job)
+
+    ids = [job["id"] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("В манифесте повторяются id (или папки результатов) заданий")
+    return jobs
+
+
+def load_progress(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Последний результат каждого задания из файла прогресса (по одной JSON-записи на строку).
+    Недописанная последняя строка (процесс прервали во время записи) пропускается"""
+    progress: Dict[str, Dict[str, Any]] = {}
+    if not path.is_file():
+        return progress
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            progress[record["id"]] = record
+    return progress
+
+
+@contextmanager
+def _job_paths(settings: Path, output: Path) -> Iterator[None]:
+    """Подставляет настройки и папку отчётов задания вместо путей из переменных окружения.
+    Процесс-обработчик выполняет задания по одному, поэтому подмена не затрагивает другие задания"""
+    import moneyscope.reports
+    import moneyscope.utils
+
+    saved = moneyscope.utils.user_settings_path, moneyscope.reports.report_files_dir
+    moneyscope.utils.user_settings_path = settings
+    moneyscope.reports.report_files_dir = output
+    try:
+        yield
+    finally:
+        moneyscope.utils.user_settings_path, moneyscope.reports.report_files_dir = saved
+
+
+def run_job(job: Dict[str, str], time_str: str) -> Dict[str, Any]:
+    """Обрабатывает одного пользователя: Главная страница, топ-3 кешбэка за месяц даты time_str
+    и траты по всем категориям за три месяца до неё. Результаты пишутся в папку output задания.
+    Возвращает запись для файла прогресса. Время задания ограничивает run_batch"""
+    from moneyscope.memo import clear_memo
+    from moneyscope.reports import flush_reports, spending_by_category_cube
+    from moneyscope.services import top_3_cashback_categories
+    from moneyscope.utils import OperationsSnapshot, in_reporting_currency, read_operations, write_text_atomic
+    from moneyscope.views import get_main_page
+
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"id": job["id"], "rows": 0}
+    output = Path(job["output"])
+    try:
+        with _job_paths(Path(job["settings"]), output):
+            date_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+            # Выгрузка читается один раз за ночь: кэш Parquet рядом с ней не нужен,
+            # а папка выгрузок может быть доступна только для чтения
+            operations = read_operations(Path(job["operations"]), use_cache=False)
+            if operations.empty:
+                raise ValueError(f"Не удалось прочитать операции из {job['operations']}")
+            snapshot = OperationsSnapshot(in_reporting_currency(operations), version=1, mtime_ns=None)
+            record["rows"] = len(snapshot)
+
+            output.mkdir(parents=True, exist_ok=True)
+            # Ночной пакет не ограничивает сборку страницы сроком: нужны все разделы
+            write_text_atomic(output / "main_page.json", get_main_page(time_str, snapshot, deadline=None))
+            write_text_atomic(
+                output / "cashback.json", top_3_cashback_categories(snapshot, date_time.year, date_time.month)
+            )
+            # Отчёт по категориям сохраняет декоратор save_report_to_file в папку задания
+            spending_by_category_cube(snapshot, [date_time.strftime("%d.%m.%Y")])
+            flush_reports()
+        record["status"] = STATUS_OK
+    except Exception as e:
+        record["status"] = STATUS_FAILED
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        # Результаты заданий не нужны следующим заданиям процесса и только занимают память
+        clear_memo()
+
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    if record["status"] != STATUS_OK:
+        logger.error("Задание %s завершилось с ошибкой: %s", job["id"], record["error"])
+    return record
+
+
+class _Worker:
+    """Процесс-обработчик, выполняющий задания по одному.
+    Задание, не уложившееся в срок, останавливается вместе с процессом, а вместо него запускается новый:
+    исключение внутри задания могли бы перехватить обработчики ошибок отчётов"""
+
+    def __init__(self, context: Any) -> None:
+        self._context = context
+        self._pool = ProcessPoolExecutor(1, context)
+        self.started = 0.0
+
+    def submit(self, job: Dict[str, str], time_str: str) -> Future:
+        self.started = time.monotonic()
+        return self._pool.submit(run_job, job, time_str)
+
+    def recycle(self) -> None:
+        """Останавливает процесс (с зависшим заданием или упавший) и запускает новый"""
+        # Публичный способ остановить процессы пула (terminate_workers) появился только в Python 3.14
+        processes = list((self._pool._processes or {}).values())
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = ProcessPoolExecutor(1, self._context)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
+
+
+def run_batch(
+    manifest: Union[str, Path],
+    time_str: str,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = DEFAULT_JOB_TIMEOUT,
+    progress_path: Optional[Union[str, Path]] = None,
+) -> Dict[str, Any]:
+    """Обрабатывает всех пользователей из манифеста в пуле процессов (по умолчанию — по числу ядер).
+    Результат каждого задания дописывается в файл прогресса (по умолчанию рядом с манифестом),
+    поэтому повторный запуск пропускает уже обработанных пользователей и повторяет только неудачные задания.
+    Срок timeout отсчитывается с передачи задания процессу; по его истечении процесс останавливается,
+    а задание получает статус timeout.
+    Возвращает сводку: сколько заданий выполнено, пропущено и завершилось ошибкой, время и скорость обработки"""
+    datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+    jobs = load_manifest(manifest)
+    progress_file = Path(progress_path or str(manifest) + ".progress.jsonl")
+    done = {job_id for job_id, record in load_progress(progress_file).items() if record.get("status") == STATUS_OK}
+    pending = [job for job in jobs if job["id"] not in done]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+    logger.info("Пакетная обработка: %s заданий, %s уже выполнено, процессов: %s", len(jobs), len(done), workers)
+
+    started = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    progress_file.parent.mkdir(parents=True, exist_ok=True)
+    # spawn: процессы-обработчики не наследуют фоновые потоки (логирование, запись отчётов) родителя
+    context = multiprocessing.get_context("spawn")
+    queue = deque(pending)
+    idle = [_Worker(context) for _ in range(workers)]
+    pool = list(idle)
+    running: Dict[Future, Tuple[_Worker, Dict[str, str]]] = {}
+    with open(progress_file, "a", encoding="utf-8") as progress:
+
+        def finish(record: Dict[str, Any]) -> None:
+            results.append(record)
+            progress.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.flush()
+
+        try:
+            while queue or running:
+                while queue and idle:
+                    worker = idle.pop()
+                    job = queue.popleft()
+                    running[worker.submit(job, time_str)] = (worker, job)
+
+                wait_for = None
+                if timeout:
+                    wait_for = max(0.0, min(busy.started for busy, _ in running.values()) + timeout - time.monotonic())
+                finished, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    worker, job = running.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        # Процесс-обработчик упал (например, из-за нехватки памяти): задание повторится при перезапуске
+                        record = {
+                            "id": job["id"],
+                            "rows": 0,
+                            "status": STATUS_FAILED,
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                        worker.recycle()
+                    finish(record)
+                    idle.append(worker)
+
+                now = time.monotonic()
+                for future, (worker, job) in list(running.items()):
+                    if timeout and now - worker.started >= timeout:
+                        del running[future]
+                        worker.recycle()
+                        logger.error(
+                            "Задание %s не уложилось в %s с, процесс-обработчик перезапущен", job["id"], timeout
+                        )
+                        finish(
+                            {
+                                "id": job["id"],
+                                "rows": 0,
+                                "status": STATUS_TIMEOUT,
+                                "error": f"Превышено время обработки: {timeout} с",
+                                "seconds": round(now - worker.started, 3),
+                            }
+                        )
+                        idle.append(worker)
+        finally:
+            for worker in pool:
+                worker.shutdown()
+
+    elapsed = time.perf_counter() - started
+    failures = [record for record in results if record["status"] != STATUS_OK]
+    rows = sum(record["rows"] for record in results)
+    summary = {
+        "jobs": len(jobs),
+        "skipped": len(jobs) - len(pending),
+        "processed": len(results),
+        "succeeded": len(results) - len(failures),
+        "failed": sum(record["status"] == STATUS_FAILED for record in failures),
+        "timed_out": sum(record["status"] == STATUS_TIMEOUT for record in failures),
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "jobs_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "rows_per_second": round(rows / elapsed) if elapsed else 0,
+        "failures": [{"id": record["id"], "error": record["error"]} for record in failures],
+    }
+    logger.info(
+        "Пакетная обработка завершена: выполнено %s, с ошибкой %s, за %.1f с",
+        summary["succeeded"],
+        len(failures),
+        elapsed,
+    )
+    return summary
+
+
+def main() -> None:
+    """Запуск: python -m moneyscope.batch manifest.json --time "2021-12-31 16:44:00" """
+    parser = argparse.ArgumentParser(description="Пакетная обработка выгрузок многих пользователей")
+    parser.add_argument("manifest", help="JSON или CSV с полями operations, settings, output (и необязательным id)")
+    parser.add_argument(
+        "--time", default=None, help="дата и время отчётов, YYYY-MM-DD HH:MM:SS (по умолчанию — сейчас)"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_JOB_TIMEOUT, help="время на задание, в секундах")
+    parser.add_argument("--progress", default=None, help="файл прогресса (по умолчанию <manifest>.progress.jsonl)")
+    args = parser.parse_args()
+
+    time_str = args.time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    summary = run_batch(args.manifest, time_str, args.workers, args.timeout, args.progress)
+    print(json.dumps(summary, ensure_ascii=False, indent=4))
+    sys.exit(1 if summary["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
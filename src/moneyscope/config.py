@@ -0,0 +1,53 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Время жизни котировки в кэше по умолчанию, в секундах
+DEFAULT_QUOTE_CACHE_TTL = 60.0
+
+# Endpoint исторических котировок FMP по умолчанию
+DEFAULT_FMP_HISTORY_URL = "https://financialmodelingprep.com/api/v3/historical-price-full/"
+
+
+def _flag(value: Optional[str]) -> bool:
+    """Значение переменной окружения как флаг: 1, true, yes, on — включено"""
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class Config:
+    """Настройки приложения из переменных окружения и файла .env.
+    Файл .env читается один раз при создании объекта, модули получают общий объект через get_config()"""
+
+    def __init__(self) -> None:
+        load_dotenv()
+        self.data_path = Path(str(os.getenv("DATA_PATH")))
+        self.user_settings_path = Path(str(os.getenv("USER_SETTINGS_PATH")))
+        self.report_files_dir = Path(str(os.getenv("REPORT_FILES_DIR")))
+        self.log_files_dir = Path(str(os.getenv("LOG_FILES_DIR")))
+        self.fmp_api_url = os.getenv("FMP_API_URL")
+        self.fmp_api_key = os.getenv("FMP_API_KEY")
+        self.fmp_history_url = os.getenv("FMP_HISTORY_URL") or DEFAULT_FMP_HISTORY_URL
+        self.quote_cache_path = os.getenv("QUOTE_CACHE_PATH")
+        self.quote_cache_ttl = float(os.getenv("QUOTE_CACHE_TTL") or DEFAULT_QUOTE_CACHE_TTL)
+        self.rate_table_path = os.getenv("RATE_TABLE_PATH")
+        self.shared_operations_dir = os.getenv("SHARED_OPERATIONS_DIR")
+        self.reporting_currency = (os.getenv("REPORTING_CURRENCY") or "").strip().upper() or None
+        self.metrics = _flag(os.getenv("METRICS"))
+        self.metrics_memory = _flag(os.getenv("METRICS_MEMORY"))
+        self.metrics_file = os.getenv("METRICS_FILE")
+
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """Возвращает общий для процесса объект настроек (создаётся при первом обращении)"""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config()
+        return _config
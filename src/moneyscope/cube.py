@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from moneyscope.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+CUBE_KEYS = ["month", "category", "last_digits"]
+CUBE_MEASURES = ["spent", "spent_cashback", "spent_count", "cashback", "cashback_count", "count"]
+
+
+def aggregate_operations(operations: pd.DataFrame) -> pd.DataFrame:
+    """Сворачивает операции в агрегаты по (месяц, категория, последние 4 цифры карты):
+    spent — сумма расходов (положительное число), spent_cashback — кешбэк по расходам с картой,
+    spent_count — число расходов, cashback и cashback_count — сумма и число положительных кешбэков,
+    count — общее число операций. Операции без карты попадают в ключ с пустым last_digits"""
+    if operations.empty:
+        return pd.DataFrame(columns=CUBE_KEYS + CUBE_MEASURES).set_index(CUBE_KEYS)
+
+    amount = operations["Сумма операции"]
+    cashback = operations["Кэшбэк"].fillna(0)
+    card = operations["Номер карты"].astype("object")
+    has_card = card.notna()
+    is_spending = (amount < 0) & has_card
+
+    frame = pd.DataFrame(
+        {
+            "month": operations["Дата операции"].dt.to_period("M"),
+            "category": operations["Категория"].astype("object"),
+            "last_digits": card.str[-4:].where(has_card, ""),
+            "spent": (-amount).where(is_spending, 0.0),
+            "spent_cashback": cashback.where(is_spending, 0.0),
+            "spent_count": is_spending.astype("int64"),
+            "cashback": cashback.where(cashback > 0, 0.0),
+            "cashback_count": (cashback > 0).astype("int64"),
+            "count": 1,
+        }
+    )
+    return frame.groupby(CUBE_KEYS, dropna=False, sort=False).sum()
+
+
+class AggregateCube:
+    """Материализованные агрегаты операций по (месяц, категория, последние 4 цифры карты).
+    Строится один раз при загрузке и дополняется новыми операциями за время,
+    пропорциональное размеру прироста и самого куба, а не всей истории"""
+
+    def __init__(self, operations: Optional[pd.DataFrame] = None) -> None:
+        self.data = aggregate_operations(pd.DataFrame() if operations is None else operations)
+
+    def update(self, operations: pd.DataFrame) -> "AggregateCube":
+        """Добавляет в куб агрегаты новых операций"""
+        if operations.empty:
+            return self
+        partial = aggregate_operations(operations)
+        self.data = partial if self.data.empty else self.data.add(partial, fill_value=0)
+        return self
+
+    def copy(self) -> "AggregateCube":
+        cube = AggregateCube()
+        cube.data = self.data.copy()
+        return cube
+
+    def _months(self, months: Iterable[pd.Period]) -> pd.DataFrame:
+        if self.data.empty:
+            return self.data
+        month_level = self.data.index.get_level_values("month")
+        return self.data[month_level.isin(list(months))]
+
+    def card_totals(self, months: Iterable[pd.Period]) -> list:
+        """Те же данные, что и utils.aggregate_card_data, но по целым месяцам из куба.
+        Суммы округляются до копеек, как в aggregate_card_data"""
+        data = self._months(months)
+        data = data[(data.index.get_level_values("last_digits") != "") & (data["spent_count"] > 0)]
+        if data.empty:
+            return []
+
+        grouped = data.groupby(level="last_digits")[["spent", "spent_cashback"]].sum().sort_index()
+        return [
+            {
+                "last_digits": last_digits,
+                "total_spent": round(float(spent), 2),
+                "cashback": round(float(spent_cashback), 2),
+            }
+            for last_digits, spent, spent_cashback in zip(grouped.index, grouped["spent"], grouped["spent_cashback"])
+        ]
+
+    def cashback_by_category(self, months: Iterable[pd.Period]) -> pd.Series:
+        """Сумма положительного кешбэка по категориям за заданные месяцы"""
+        data = self._months(months)
+        data = data[data["cashback_count"] > 0]
+        return data.groupby(level="category")["cashback"].sum()
+
+    def cashback_count(self, months: Iterable[pd.Period]) -> int:
+        """Число операций с положительным кешбэком за заданные месяцы"""
+        return int(self._months(months)["cashback_count"].sum())
+
+
+def whole_months(start: pd.Timestamp, end: pd.Timestamp) -> Optional[pd.PeriodIndex]:
+    """Если интервал [start, end] состоит из целых месяцев, возвращает их список, иначе None.
+    Конец считается концом месяца, если следующая за ним секунда — начало месяца"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    next_second = end.floor("s") + pd.Timedelta(seconds=1)
+    if start != start.normalize() or start.day != 1:
+        return None
+    if next_second != next_second.normalize() or next_second.day != 1 or next_second <= start:
+        return None
+    return pd.period_range(start, end, freq="M")
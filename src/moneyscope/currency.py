@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from moneyscope.config import get_config
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.metrics import instrument
+from moneyscope.quotes import DEFAULT_TIMEOUT
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import requests
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+    pa = lazy_import("pyarrow")
+    pq = lazy_import("pyarrow.parquet")
+    requests = lazy_import("requests")
+
+# Валюта, к которой хранятся все курсы таблицы
+BASE_CURRENCY = "RUB"
+
+# Денежные столбцы и столбцы с их валютой. Кэшбэк и сумма с округлением начисляются в валюте платежа
+CURRENCY_COLUMNS = {
+    "Сумма операции": "Валюта операции",
+    "Сумма платежа": "Валюта платежа",
+    "Кэшбэк": "Валюта платежа",
+    "Сумма операции с округлением": "Валюта платежа",
+}
+
+# На сколько дней раньше первой нужной даты запрашивать курсы: в выходные и праздники торгов нет,
+# и для операции в эти дни нужен курс последнего рабочего дня
+RATE_LOOKBACK_DAYS = 7
+
+RATE_TABLE_VERSION = 1
+RATE_TABLE_METADATA_KEY = b"moneyscope_rates"
+
+# Интервал дат одной валюты, за который курсы уже запрошены
+Span = Tuple["pd.Timestamp", "pd.Timestamp"]
+
+
+class RateHistoryClient:
+    """Клиент исторических курсов financialmodelingprep.com (endpoint historical-price-full).
+    Курсы нескольких валют за один интервал дат запрашиваются одним мультисимвольным запросом"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+        batch_size: int = 5,
+    ) -> None:
+        config = get_config()
+        self.base_url = base_url if base_url is not None else config.fmp_history_url
+        self.api_key = api_key if api_key is not None else config.fmp_api_key
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = requests.Session()
+
+    def _request(self, symbols: List[str], start: pd.Timestamp, end: pd.Timestamp) -> List[dict]:
+        response = self.session.get(
+            f"{self.base_url}{','.join(symbols)}",
+            params={"from": f"{start:%Y-%m-%d}", "to": f"{end:%Y-%m-%d}", "apikey": self.api_key},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json() or {}
+        # На запрос одного символа API отвечает одним объектом, на запрос нескольких — списком объектов
+        return data.get("historicalStockList", [data]) if isinstance(data, dict) else []
+
+    @instrument("rates_fetch")
+    def fetch(self, currencies: List[str], start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """Дневные курсы валют к рублю за интервал [start, end]: столбцы date, currency, rate.
+        Ошибки запроса пробрасываются, чтобы таблица не считала непокрытые даты загруженными"""
+        rows = []
+        for i in range(0, len(currencies), self.batch_size):
+            symbols = [currency + BASE_CURRENCY for currency in currencies[i : i + self.batch_size]]
+            for item in self._request(symbols, start, end):
+                symbol = item.get("symbol", symbols[0] if len(symbols) == 1 else None)
+                if symbol not in symbols:
+                    continue
+                for day in item.get("historical") or []:
+                    if day.get("date") and day.get("close") is not None:
+                        rows.append((day["date"], symbol[: -len(BASE_CURRENCY)], float(day["close"])))
+
+        rates = pd.DataFrame(rows, columns=["date", "currency", "rate"])
+        rates["date"] = pd.to_datetime(rates["date"], format="%Y-%m-%d").astype("datetime64[ns]")
+        return rates
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _empty_rates() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "date": pd.Series(dtype="datetime64[ns]"),
+            "currency": pd.Series(dtype=str),
+            "rate": pd.Series(dtype="float64"),
+        }
+    )
+
+
+class RateTable:
+    """Локальная таблица дневных курсов валют к рублю.
+    Для каждой валюты хранится интервал дат, за который курсы уже запрошены, поэтому у API
+    запрашиваются только даты вне этого интервала. Если задан path, таблица сохраняется в Parquet-файл
+    и загружается при создании, так что без сети пересчёт работает по уже загруженным курсам"""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, client: Optional[RateHistoryClient] = None) -> None:
+        self.path = Path(path) if path else None
+        self._client = client
+        self._lock = threading.Lock()
+        self._rates = _empty_rates()
+        self._coverage: Dict[str, Span] = {}
+        # Номер изменения таблицы: растёт при каждой загрузке курсов, входит в ключи кэшей пересчитанных данных
+        self.revision = 0
+        self._load()
+
+    @property
+    def client(self) -> RateHistoryClient:
+        if self._client is None:
+            self._client = RateHistoryClient()
+        return self._client
+
+    @property
+    def rates(self) -> pd.DataFrame:
+        return self._rates.copy()
+
+    @property
+    def coverage(self) -> Dict[str, Span]:
+        return dict(self._coverage)
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.is_file():
+            return
+        try:
+            metadata = json.loads((pq.read_schema(self.path).metadata or {}).get(RATE_TABLE_METADATA_KEY, b"{}"))
+            if metadata.get("version") != RATE_TABLE_VERSION:
+                return
+            rates = pd.read_parquet(self.path)
+            rates["date"] = rates["date"].astype("datetime64[ns]")
+            rates["currency"] = rates["currency"].astype(str)
+            self._rates = rates
+            self._coverage = {
+                currency: (pd.Timestamp(start), pd.Timestamp(end))
+                for currency, (start, end) in metadata["coverage"].items()
+            }
+            self.revision += 1
+            logger.info("Загружено %s курсов валют из таблицы %s", len(rates), self.path)
+        except Exception as e:
+            logger.warning("Не удалось прочитать таблицу курсов %s: %s", self.path, e)
+
+    def _save(self) -> None:
+        """Атомарно сохраняет таблицу: сначала во временный файл, затем переименование"""
+        if self.path is None:
+            return
+        metadata = {
+            "version": RATE_TABLE_VERSION,
+            "coverage": {
+                currency: [f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}"] for currency, (start, end) in self._coverage.items()
+            },
+        }
+        table = pa.Table.from_pandas(self._rates, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), RATE_TABLE_METADATA_KEY: json.dumps(metadata).encode()}
+        )
+        # utils импортирует этот модуль, поэтому помощник записи импортируется при вызове
+        from moneyscope.utils import write_atomic
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(self.path, lambda tmp_file: pq.write_table(table, tmp_file))
+        except OSError as e:
+            logger.warning("Не удалось сохранить таблицу курсов %s: %s", self.path, e)
+
+    def missing(self, needed: Dict[str, Span]) -> Dict[Span, List[str]]:
+        """Интервалы дат, которых нет в таблице, и валюты, для которых они нужны.
+        Непокрытые даты одной валюты лежат до или после уже загруженного интервала"""
+        today = pd.Timestamp.today().normalize()
+        gaps: Dict[Span, List[str]] = {}
+        for currency, (start, end) in needed.items():
+            start = start.normalize() - pd.Timedelta(days=RATE_LOOKBACK_DAYS)
+            end = min(end.normalize(), today)
+            if start > end:
+                continue
+            covered = self._coverage.get(currency)
+            if covered is None:
+                spans = [(start, end)]
+            else:
+                spans = [(start, covered[0] - pd.Timedelta(days=1)), (covered[1] + pd.Timedelta(days=1), end)]
+            for span in spans:
+                if span[0] <= span[1]:
+                    gaps.setdefault(span, []).append(currency)
+        return gaps
+
+    def add(self, rates: pd.DataFrame, currencies: List[str], start: pd.Timestamp, end: pd.Timestamp) -> None:
+        """Добавляет курсы и отмечает интервал [start, end] как загруженный для валют currencies"""
+        with self._lock:
+            combined = pd.concat([self._rates, rates], ignore_index=True) if len(self._rates) else rates
+            self._rates = combined.drop_duplicates(["currency", "date"], keep="last").sort_values(
+                "date", kind="stable", ignore_index=True
+            )
+            for currency in currencies:
+                covered = self._coverage.get(currency)
+                if covered is not None:
+                    start, end = min(start, covered[0]), max(end, covered[1])
+                self._coverage[currency] = (start, end)
+            self.revision += 1
+
+    def ensure(self, needed: Dict[str, Span]) -> None:
+        """Догружает курсы за даты, которых нет в таблице. Если API недоступен, таблица остаётся прежней"""
+        loaded = False
+        for (start, end), currencies in self.missing(needed).items():
+            try:
+                rates = self.client.fetch(currencies, start, end)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("Не удалось получить курсы %s за %s–%s: %s", ", ".join(currencies), start, end, e)
+                continue
+            self.add(rates, currencies, start, end)
+            loaded = True
+            logger.info("Загружено %s курсов %s за %s–%s", len(rates), ", ".join(currencies), start, end)
+        if loaded:
+            self._save()
+
+    def rates_to_base(self, dates: pd.Series, currencies: Any) -> np.ndarray:
+        """Курс к рублю на дату каждой строки: последний известный на эту дату (as-of),
+        а для дат раньше первого известного курса — ближайший следующий.
+        Курсы подставляются одним as-of join по отсортированным датам с ключом — кодом валюты.
+        Для рубля курс 1, для строк без курса и без даты — NaN"""
+        categorical = pd.Categorical(currencies)
+        categories = categorical.categories.astype(str)
+        codes = categorical.codes.astype("int64")
+        base = categories.get_indexer(pd.Index([BASE_CURRENCY]))[0]
+        result = np.where((codes == base) & (codes >= 0), 1.0, np.nan)
+        wanted = (codes != base) & (codes >= 0) & dates.notna().to_numpy()
+        rates = self._rates
+        if not wanted.any() or rates.empty:
+            return result
+
+        right = pd.DataFrame(
+            {"date": rates["date"], "code": categories.get_indexer(pd.Index(rates["currency"])), "rate": rates["rate"]}
+        )
+        right = right[right["code"] >= 0]
+        left = pd.DataFrame(
+            {
+                "date": dates.to_numpy()[wanted].astype("datetime64[ns]"),
+                "code": codes[wanted],
+                "_row": np.flatnonzero(wanted),
+            }
+        )
+        if not left["date"].is_monotonic_increasing:
+            left = left.sort_values("date", kind="stable", ignore_index=True)
+        for direction in ("backward", "forward"):
+            merged = pd.merge_asof(left, right, on="date", by="code", direction=direction)
+            found = merged["rate"].notna().to_numpy()
+            result[merged["_row"].to_numpy()[found]] = merged["rate"].to_numpy()[found]
+            left = left[~found]
+            if left.empty:
+                break
+        return result
+
+
+@instrument("currency_normalize")
+def normalize_currency(
+    df: pd.DataFrame, reporting_currency: str = BASE_CURRENCY, table: Optional[RateTable] = None
+) -> pd.DataFrame:
+    """Пересчитывает денежные столбцы CURRENCY_COLUMNS в валюту отчётов по курсу на дату операции.
+    Недостающие в таблице курсы догружаются одним запросом на интервал дат.
+    Пересчитанные строки получают валюту отчётов, поэтому повторный пересчёт ничего не меняет.
+    Строки, для которых курс неизвестен (например, без сети), остаются в исходной валюте"""
+    columns = {
+        amount: currency for amount, currency in CURRENCY_COLUMNS.items() if {amount, currency} <= set(df.columns)
+    }
+    if df.empty or not columns or "Дата операции" not in df.columns:
+        return df
+
+    # Валюты сравниваются по кодам категорий, а не построчно как строки
+    dates = df["Дата операции"].reset_index(drop=True)
+    currency_columns = {column: pd.Categorical(df[column]) for column in sorted(set(columns.values()))}
+    rows = {}
+    for column, values in currency_columns.items():
+        reporting_code = values.categories.astype(str).get_indexer(pd.Index([reporting_currency]))[0]
+        rows[column] = np.flatnonzero((values.codes != reporting_code) & (values.codes >= 0))
+    if not any(len(positions) for positions in rows.values()):
+        return df
+
+    table = table if table is not None else get_rate_table()
+    # Интервал дат, за который нужен курс каждой валюты, включая валюту отчётов
+    date_values = dates.to_numpy().astype("datetime64[ns]")
+    spans: Dict[str, Span] = {}
+    converted = np.zeros(len(dates), dtype=bool)
+    for column, positions in rows.items():
+        converted[positions] = True
+        codes = currency_columns[column].codes[positions]
+        for code, currency in enumerate(currency_columns[column].categories.astype(str)):
+            _widen_span(spans, currency, date_values[positions[codes == code]])
+    _widen_span(spans, reporting_currency, date_values[converted])
+    if spans:
+        table.ensure(spans)
+
+    df = df.copy()
+    for column, values in currency_columns.items():
+        positions = rows[column]
+        if not len(positions):
+            continue
+        selected_dates = dates.iloc[positions].reset_index(drop=True)
+        reporting = pd.Categorical.from_codes(
+            np.zeros(len(positions), dtype="int8"), dtype=pd.CategoricalDtype([reporting_currency])
+        )
+        factors = table.rates_to_base(selected_dates, values[positions]) / table.rates_to_base(
+            selected_dates, reporting
+        )
+        known = ~np.isnan(factors)
+        for amount, currency_column in columns.items():
+            if currency_column == column:
+                amounts = df[amount].to_numpy(dtype="float64", copy=True)
+                amounts[positions[known]] *= factors[known]
+                df[amount] = amounts
+
+        unknown = int((~known).sum())
+        if unknown:
+            logger.warning("Нет курса для %s операций, столбец %s оставлен в исходной валюте", unknown, column)
+        values = values.add_categories([reporting_currency]) if reporting_currency not in values.categories else values
+        codes = values.codes.copy()
+        codes[positions[known]] = values.categories.get_indexer(pd.Index([reporting_currency]))[0]
+        df[column] = pd.Categorical.from_codes(codes, values.categories).remove_unused_categories()
+    return df
+
+
+def conversion_factor(
+    currency: str, date: Any, reporting_currency: str, table: Optional[RateTable] = None
+) -> Optional[float]:
+    """Множитель пересчёта суммы в валюте currency в reporting_currency по курсу на дату date,
+    так же, как в normalize_currency. Недостающие курсы догружаются. Если курс неизвестен, возвращает None"""
+    if currency == reporting_currency:
+        return 1.0
+    table = table if table is not None else get_rate_table()
+    moment = pd.Timestamp(date)
+    table.ensure({code: (moment, moment) for code in (currency, reporting_currency) if code != BASE_CURRENCY})
+    dates = pd.Series([moment], dtype="datetime64[ns]")
+    factor = table.rates_to_base(dates, [currency])[0] / table.rates_to_base(dates, [reporting_currency])[0]
+    return None if np.isnan(factor) else float(factor)
+
+
+def _widen_span(spans: Dict[str, Span], currency: str, dates: np.ndarray) -> None:
+    """Расширяет интервал дат, за который нужен курс валюты, до дат dates"""
+    dates = dates[~np.isnat(dates)]
+    if currency == BASE_CURRENCY or not len(dates):
+        return
+    start, end = pd.Timestamp(dates.min()), pd.Timestamp(dates.max())
+    if currency in spans:
+        start, end = min(start, spans[currency][0]), max(end, spans[currency][1])
+    spans[currency] = (start, end)
+
+
+_rate_table: Optional[RateTable] = None
+_rate_table_lock = threading.Lock()
+
+
+def get_rate_table() -> RateTable:
+    """Возвращает общую для процесса таблицу курсов. Файл таблицы задаётся переменной RATE_TABLE_PATH"""
+    global _rate_table
+    with _rate_table_lock:
+        if _rate_table is None:
+            _rate_table = RateTable(get_config().rate_table_path)
+        return _rate_table
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Union
+
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.utils import _file_fingerprint, _file_hash, apply_operations_schema, read_operations, write_atomic
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+# Столбцы, по которым операция однозначно узнаётся в разных выгрузках
+KEY_COLUMNS = ["Дата операции", "Номер карты", "Сумма операции", "Описание"]
+KEY_COLUMN = "_key"
+MANIFEST_NAME = "manifest.json"
+
+
+def transaction_keys(df: pd.DataFrame) -> np.ndarray:
+    """Вычисляет стабильный 64-битный ключ операции по времени, карте, сумме и описанию.
+    Одинаковые операции внутри одной выгрузки различаются порядковым номером повтора,
+    поэтому настоящие дубликаты не схлопываются, а пересечения между выгрузками узнаются"""
+    key_frame = df[KEY_COLUMNS].copy()
+    key_frame["_occurrence"] = key_frame.groupby(KEY_COLUMNS, dropna=False, sort=False).cumcount()
+    return pd.util.hash_pandas_object(key_frame, index=False).to_numpy()
+
+
+def _collect_sources(sources: Union[str, Path, Iterable[Union[str, Path]]]) -> List[Path]:
+    """Раскрывает папку или список путей в упорядоченный список XLSX-файлов"""
+    if isinstance(sources, (str, Path)):
+        sources = [sources]
+
+    files: List[Path] = []
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            files.extend(sorted(source.glob("*.xlsx")))
+        else:
+            files.append(source)
+    return files
+
+
+def _load_manifest(store_dir: Path) -> Dict[str, Any]:
+    """Читает манифест хранилища: какие выгрузки уже учтены и из каких частей оно состоит"""
+    manifest_file = store_dir / MANIFEST_NAME
+    if not manifest_file.is_file():
+        return {"sources": {}, "parts": []}
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        manifest: Dict[str, Any] = json.load(f)
+    return manifest
+
+
+def _save_manifest(store_dir: Path, manifest: Dict[str, Any]) -> None:
+    """Атомарно сохраняет манифест хранилища"""
+
+    def write(tmp_file: Path) -> None:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+    write_atomic(store_dir / MANIFEST_NAME, write)
+
+
+def _known_keys(store_dir: Path, parts: List[str]) -> np.ndarray:
+    """Загружает ключи всех уже сохранённых операций (читается только столбец ключей)"""
+    if not parts:
+        return np.array([], dtype=np.uint64)
+    keys = [pd.read_parquet(store_dir / part, columns=[KEY_COLUMN])[KEY_COLUMN].to_numpy() for part in parts]
+    return np.concatenate(keys)
+
+
+def ingest_operations(sources: Union[str, Path, Iterable[Union[str, Path]]], store_dir: Union[str, Path]) -> dict:
+    """Добавляет в постоянное хранилище операций новые строки из папки или списка выгрузок.
+    Выгрузки, не изменившиеся с прошлого запуска (по размеру, времени изменения и хешу), не разбираются.
+    Из изменившихся и новых выгрузок в хранилище дописываются только операции с неизвестным ключом,
+    каждая порция — отдельным Parquet-файлом, поэтому время обновления зависит от размера прироста.
+    Возвращает сводку: сколько файлов разобрано и пропущено, сколько строк добавлено"""
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(store_dir)
+
+    summary = {"files_parsed": 0, "files_skipped": 0, "rows_added": 0}
+    known_keys = None
+
+    for source in _collect_sources(sources):
+        source_id = str(source.resolve())
+        try:
+            fingerprint = _file_fingerprint(source)
+        except OSError as e:
+            logger.error("Выгрузка %s недоступна: %s", source, e)
+            continue
+
+        # Быстрая проверка по размеру и времени изменения, затем по хешу содержимого
+        seen = manifest["sources"].get(source_id)
+        if seen and seen["size"] == fingerprint["size"]:
+            if seen["mtime_ns"] == fingerprint["mtime_ns"] or seen["sha256"] == _file_hash(source):
+                summary["files_skipped"] += 1
+                continue
+
+        df = read_operations(source)
+        if df.empty:
+            logger.warning("Выгрузка %s не содержит операций и пропущена", source)
+            continue
+        summary["files_parsed"] += 1
+
+        # Ключи уже сохранённых операций загружаем один раз и дополняем по мере добавления
+        if known_keys is None:
+            known_keys = _known_keys(store_dir, manifest["parts"])
+
+        keys = transaction_keys(df)
+        is_new = ~np.isin(keys, known_keys)
+        new_rows = df[is_new].assign(**{KEY_COLUMN: keys[is_new]})
+
+        if not new_rows.empty:
+            part_name = f"part-{len(manifest['parts']):05d}.parquet"
+            write_atomic(store_dir / part_name, lambda tmp_file: new_rows.to_parquet(tmp_file, index=False))
+            manifest["parts"].append(part_name)
+            known_keys = np.concatenate([known_keys, keys[is_new]])
+            summary["rows_added"] += len(new_rows)
+
+        manifest["sources"][source_id] = {**fingerprint, "sha256": _file_hash(source)}
+        _save_manifest(store_dir, manifest)
+        logger.info("Из выгрузки %s добавлено %s новых операций из %s", source, len(new_rows), len(df))
+
+    return summary
+
+
+def load_store(store_dir: Union[str, Path]) -> pd.DataFrame:
+    """Загружает все операции из хранилища в один DataFrame (без служебного столбца ключей)"""
+    store_dir = Path(store_dir)
+    try:
+        parts = _load_manifest(store_dir)["parts"]
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat([pd.read_parquet(store_dir / part) for part in parts], ignore_index=True)
+        # Категории в разных частях различаются, поэтому после объединения схему применяем заново
+        return apply_operations_schema(df.drop(columns=[KEY_COLUMN]))
+    except Exception as e:
+        logger.error("Ошибка при чтении хранилища %s: %s", store_dir, e)
+        return pd.DataFrame()
@@ -0,0 +1,29 @@
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """Заместитель модуля: настоящий модуль импортируется при первом обращении к его атрибуту.
+    Позволяет не загружать тяжёлые библиотеки (pandas, numpy, pyarrow) при импорте moneyscope"""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "загружен" if self._module is not None else "не загружен"
+        return f"<ленивый модуль {self._name}, {state}>"
+
+
+def lazy_import(name: str) -> Any:
+    """Возвращает заместитель модуля name, который импортирует его при первом использовании"""
+    return LazyModule(name)
@@ -1,31 +1,133 @@
+import atexit
+import io
 import logging
-import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Any, Optional
 
-from dotenv import load_dotenv
+from moneyscope.config import get_config
+
+# Сколько строк большого объекта (DataFrame, список) попадает в отладочный лог
+PAYLOAD_PREVIEW_ROWS = 5
+
+
+class LazyRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler, который создаёт папку и файл логов только при первой записи, а не при импорте"""
+
+    def __init__(self, filename: Path, **kwargs: Any) -> None:
+        super().__init__(filename, delay=True, **kwargs)
+
+    def _open(self) -> io.TextIOWrapper:
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)  # Создаём директорию, если её нет
+        return super()._open()
 
-# Загружаем переменные окружения из .env файла
-load_dotenv()
 
 # Установка пути для логов
-log_directory = Path(str(os.getenv("LOG_FILES_DIR")))
-log_directory.mkdir(exist_ok=True)  # Создаём директорию, если её нет
+log_directory = get_config().log_files_dir
 log_file = log_directory / "moneyscope.log"
 
 # Создаём логгер
 logger = logging.getLogger("main_logger")
 logger.propagate = False  # Отключаем передачу логов родительским логгерам
 
+# Записи логов складываются в очередь, а в файл их пишет фоновый поток: запись на диск не задерживает запросы
+log_queue: queue.Queue = queue.Queue()
+log_listener: Optional[QueueListener] = None
+
 # Проверяем, добавлены ли уже обработчики
-if not any(isinstance(handler, RotatingFileHandler) for handler in logger.handlers):
-    rotating_handler = RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=5)
+if not any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+    rotating_handler = LazyRotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=5)
 
     # Настройка уровня логирования и форматирования
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(module)s:%(funcName)s] - %(message)s")
 
     rotating_handler.setFormatter(formatter)
 
-    # Добавляем только rotating handler
+    # Добавляем только обработчик очереди, файловый обработчик работает в потоке QueueListener
     logger.setLevel(logging.INFO)
-    logger.addHandler(rotating_handler)
+    logger.addHandler(QueueHandler(log_queue))
+    log_listener = QueueListener(log_queue, rotating_handler, respect_handler_level=True)
+    log_listener.start()
+
+
+def flush_logs() -> None:
+    """Дожидается, пока фоновый поток запишет все поставленные в очередь записи"""
+    log_queue.join()
+
+
+def stop_logging() -> None:
+    """Записывает оставшиеся записи и останавливает фоновый поток. Вызывается и при выходе из программы"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+atexit.register(stop_logging)
+
+
+class PayloadPreview:
+    """Отложенное описание большого объекта для лога: размер и первые строки.
+    Строка строится только при форматировании записи, и её длина не зависит от размера данных"""
+
+    def __init__(self, payload: Any, rows: int = PAYLOAD_PREVIEW_ROWS) -> None:
+        self.payload = payload
+        self.rows = rows
+
+    def __str__(self) -> str:
+        payload = self.payload
+        if hasattr(payload, "shape") and hasattr(payload, "head"):
+            return f"{type(payload).__name__} {payload.shape}, первые строки:\n{payload.head(self.rows)}"
+        if isinstance(payload, (list, tuple)):
+            return f"{type(payload).__name__} из {len(payload)} элементов: {list(payload[: self.rows])}"
+        return str(payload)
+
+
+class PayloadLogger:
+    """Отладочный канал для больших объектов (DataFrame, списки операций).
+    Запись делается только на уровне DEBUG, для доли sample_rate вызовов и не чаще max_per_second раз в секунду;
+    в лог попадают размер объекта и первые строки. Включается так:
+    logging.getLogger("main_logger.payload").setLevel(logging.DEBUG)"""
+
+    def __init__(
+        self, name: str = "main_logger.payload", sample_rate: float = 1.0, max_per_second: float = 1.0
+    ) -> None:
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.dropped = 0
+        self._tokens = max(1.0, max_per_second)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _allow(self) -> bool:
+        """Выборка и ограничение частоты: ведро токенов, пополняемое max_per_second токенами в секунду"""
+        if random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            capacity = max(1.0, self.max_per_second)
+            self._tokens = min(capacity, self._tokens + (now - self._updated) * self.max_per_second)
+            self._updated = now
+            if self._tokens < 1:
+                self.dropped += 1
+                return False
+            self._tokens -= 1
+            return True
+
+    def log(self, message: str, payload: Any, stacklevel: int = 2) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG) or not self._allow():
+            return
+        self.logger.debug("%s: %s", message, PayloadPreview(payload), stacklevel=stacklevel)
+
+
+payload_logger = PayloadLogger()
+
+
+def log_payload(message: str, payload: Any) -> None:
+    """Записывает описание большого объекта в отладочный канал payload_logger"""
+    payload_logger.log(message, payload, stacklevel=3)
@@ -1,16 +1,20 @@
-from moneyscope.reports import spending_by_category
+from moneyscope.metrics import metrics_enabled, write_prometheus
+from moneyscope.reports import flush_reports, spending_by_category
 from moneyscope.services import top_3_cashback_categories
-from moneyscope.utils import read_operations
+from moneyscope.utils import get_operations_store, in_reporting_currency
 from moneyscope.views import get_main_page
 
 
 def main() -> None:
     """Основная функция для тестирования остальных"""
-    print(get_main_page("2021-12-31 16:44:00"))
-    ops = read_operations()
-    ops_dict = ops.to_dict(orient="records")
-    print(top_3_cashback_categories(ops_dict, 2021, 12))
-    print(spending_by_category(ops, "Супермаркеты", "31.12.2021"))
+    # Суммы пересчитываются в валюту отчётов, если она задана переменной REPORTING_CURRENCY
+    snapshot = in_reporting_currency(get_operations_store())
+    print(get_main_page("2021-12-31 16:44:00", snapshot))
+    print(top_3_cashback_categories(snapshot, 2021, 12))
+    print(spending_by_category(snapshot, "Супермаркеты", "31.12.2021"))
+    flush_reports()
+    if metrics_enabled():
+        write_prometheus()
     return None
 
 
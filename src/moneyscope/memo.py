@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import sys
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Tuple
+
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.utils import OperationsSnapshot, OperationsStore
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+# Размер кэша по умолчанию для каждой мемоизированной функции (число хранимых результатов)
+DEFAULT_MAXSIZE = 128
+
+# Объём кэша по умолчанию для каждой мемоизированной функции, в байтах
+DEFAULT_MAXBYTES = 64 * 1024 * 1024
+
+# Все мемоизированные функции: имя -> кэш, для общей статистики
+_caches: Dict[str, "MemoCache"] = {}
+
+
+def data_fingerprint(data: Any) -> Optional[Hashable]:
+    """Отпечаток данных операций для ключа кэша: у хранилища — номер его текущего снимка,
+    у снимка — его номер (снимок не меняется), валюта пересчёта и номер изменения таблицы курсов.
+    Отпечаток не зависит от объёма данных.
+    Для DataFrame, списков записей и итераторов порций возвращает None: хеш содержимого
+    стоит столько же, сколько сам расчёт, поэтому такие вызовы не кэшируются.
+    Чтобы результаты по DataFrame кэшировались, его оборачивают в OperationsSnapshot"""
+    if isinstance(data, OperationsStore):
+        data = data.snapshot()
+    if isinstance(data, OperationsSnapshot):
+        return ("snapshot", data.uid, data.currency, data.rates_revision)
+    return None
+
+
+def _result_size(value: Any) -> int:
+    """Примерный объём результата в памяти, в байтах"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_result_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_result_size(key) + _result_size(item) for key, item in value.items())
+    return sys.getsizeof(value)
+
+
+def _copy_result(value: Any) -> Any:
+    """Копия результата, чтобы изменения у вызывающего кода не портили кэш.
+    Срез DataFrame копируется целиком и больше не держит в памяти исходные операции"""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy_result(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _copy_result(item) for key, item in value.items()}
+    return value
+
+
+class MemoCache:
+    """LRU-кэш результатов одной функции со статистикой попаданий и промахов.
+    Ограничен и числом результатов, и их суммарным объёмом; результат больше maxbytes не сохраняется"""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, maxbytes: int = DEFAULT_MAXBYTES) -> None:
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = _result_size(value)
+        if size > self.maxbytes:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.maxsize or self.bytes > self.maxbytes:
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.skipped = self.bytes = 0
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "bytes": self.bytes,
+                "maxbytes": self.maxbytes,
+            }
+
+
+def memoize(
+    maxsize: int = DEFAULT_MAXSIZE,
+    key_args: Optional[Callable[..., Optional[Hashable]]] = None,
+    maxbytes: int = DEFAULT_MAXBYTES,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Декоратор мемоизации функций отчётов и сервисов, у которых первый аргумент — данные операций.
+    Ключ кэша — отпечаток данных (data_fingerprint) и остальные аргументы, сопоставленные с сигнатурой функции:
+    вызовы с позиционными и именованными аргументами (и с явно переданными значениями по умолчанию)
+    получают один ключ. Когда операции меняются,
+    меняется отпечаток, поэтому старые результаты больше не находятся и вытесняются по LRU.
+    Кэш хранит копии результатов и ограничен maxsize результатами и maxbytes байтами.
+    key_args получает остальные аргументы вызова по именам и возвращает их хешируемый ключ или None, если вызов
+    кэшировать нельзя (например, результат зависит от текущей даты).
+    У обёрнутой функции есть методы cache_info() и cache_clear()"""
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        cache = MemoCache(maxsize, maxbytes)
+        _caches[func.__qualname__] = cache
+        signature = inspect.signature(func)
+        data_name = next(iter(signature.parameters))
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                # Аргументы сопоставляются с сигнатурой, данные берутся по позиции или по имени
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                rest = dict(bound.arguments)
+                fingerprint = data_fingerprint(rest.pop(data_name))
+                arguments = key_args(**rest) if key_args else tuple(rest.items())
+                key = None if fingerprint is None or arguments is None else (fingerprint, arguments)
+                if key is not None:
+                    hash(key)
+            except Exception as e:
+                logger.warning("Не удалось построить ключ кэша для %s: %s", func.__name__, e)
+                key = None
+
+            if key is None:
+                with cache._lock:
+                    cache.skipped += 1
+                return func(*args, **kwargs)
+
+            found, value = cache.get(key)
+            if found:
+                return _copy_result(value)
+            value = func(*args, **kwargs)
+            cache.put(key, _copy_result(value))
+            return value
+
+        setattr(wrapper, "cache_info", cache.info)
+        setattr(wrapper, "cache_clear", cache.clear)
+        return wrapper
+
+    return decorator
+
+
+def memo_stats() -> Dict[str, Dict[str, int]]:
+    """Статистика всех мемоизированных функций: имя функции -> попадания, промахи, размер кэша"""
+    return {name: cache.info() for name, cache in _caches.items()}
+
+
+def clear_memo() -> None:
+    """Очищает кэши всех мемоизированных функций"""
+    for cache in _caches.values():
+        cache.clear()
@@ -0,0 +1,203 @@
+import functools
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union, cast
+
+from moneyscope.config import get_config
+
+# Границы корзин гистограммы длительности этапов, в секундах
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Выключатели замеров: при выключенных замерах обёртка этапа сводится к одной проверке флага
+_enabled = get_config().metrics
+_trace_memory = get_config().metrics_memory
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable_metrics(enabled: bool = True, trace_memory: Optional[bool] = None) -> None:
+    """Включает или выключает замеры этапов. trace_memory включает замер пиковой памяти через tracemalloc:
+    он заметно замедляет выделение памяти, поэтому по умолчанию выключен"""
+    global _enabled, _trace_memory
+    _enabled = enabled
+    if trace_memory is not None:
+        _trace_memory = trace_memory
+    if _enabled and _trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif tracemalloc.is_tracing() and not (_enabled and _trace_memory):
+        tracemalloc.stop()
+
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+
+def _rows(value: Any) -> Optional[int]:
+    """Число строк у DataFrame, снимка операций, списка или словаря; для остальных значений — None"""
+    if isinstance(value, (str, bytes)):
+        return None
+    if hasattr(value, "shape") and hasattr(value, "columns"):
+        return int(value.shape[0])
+    if isinstance(value, (list, tuple, dict)) or type(value).__name__ == "OperationsSnapshot":
+        return len(value)
+    return None
+
+
+def _new_stage() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "errors": 0,
+        "seconds_total": 0.0,
+        "seconds_max": 0.0,
+        "seconds_last": 0.0,
+        "rows_in_total": 0,
+        "rows_out_total": 0,
+        "peak_memory_bytes_max": 0,
+        "buckets": [0] * len(DURATION_BUCKETS),
+    }
+
+
+def _record(stage: str, seconds: float, rows_in: Optional[int], rows_out: Optional[int], peak: int, ok: bool) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(stage, _new_stage())
+        stats["calls"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["seconds_total"] += seconds
+        stats["seconds_max"] = max(stats["seconds_max"], seconds)
+        stats["seconds_last"] = seconds
+        stats["rows_in_total"] += rows_in or 0
+        stats["rows_out_total"] += rows_out or 0
+        stats["peak_memory_bytes_max"] = max(stats["peak_memory_bytes_max"], peak)
+        for position, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                stats["buckets"][position] += 1
+
+
+def _memory_enter() -> Optional[List[int]]:
+    """Начало замера памяти этапа: [память в начале, пик вложенных этапов].
+    tracemalloc общий для процесса, поэтому вложенные этапы передают свой пик внешнему через стек потока"""
+    if not tracemalloc.is_tracing():
+        return None
+    stack = getattr(_local, "memory_stack", None)
+    if stack is None:
+        stack = _local.memory_stack = []
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    frame = [current, 0]
+    stack.append(frame)
+    return frame
+
+
+def _memory_exit(frame: Optional[List[int]]) -> int:
+    """Пиковый прирост памяти этапа относительно его начала, в байтах"""
+    if frame is None or not tracemalloc.is_tracing():
+        return 0
+    stack = _local.memory_stack
+    stack.pop()
+    peak = max(tracemalloc.get_traced_memory()[1], frame[1])
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+    return max(0, peak - frame[0])
+
+
+def instrument(stage: Optional[str] = None) -> Callable[[F], F]:
+    """Декоратор замера этапа: время выполнения, число строк на входе (первый аргумент) и на выходе,
+    пиковый прирост памяти. Если замеры выключены, функция вызывается напрямую"""
+
+    def decorator(func: F) -> F:
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            rows_in = _rows(args[0]) if args else None
+            frame = _memory_enter() if _trace_memory else None
+            started = time.perf_counter()
+            ok = False
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                seconds = time.perf_counter() - started
+                peak = _memory_exit(frame)
+                _record(name, seconds, rows_in, _rows(result) if ok else None, peak, ok)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    """Накопленные замеры по этапам: число вызовов и ошибок, суммарное, максимальное и последнее время,
+    суммы строк на входе и выходе, максимальный пиковый прирост памяти"""
+    with _stats_lock:
+        return {
+            stage: {key: value for key, value in stats.items() if key != "buckets"} for stage, stats in _stats.items()
+        }
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def prometheus_text() -> str:
+    """Замеры в текстовом формате Prometheus"""
+    with _stats_lock:
+        stats = {stage: dict(values, buckets=list(values["buckets"])) for stage, values in _stats.items()}
+
+    lines = [
+        "# HELP moneyscope_stage_duration_seconds Время выполнения этапа",
+        "# TYPE moneyscope_stage_duration_seconds histogram",
+    ]
+    for stage, values in sorted(stats.items()):
+        for bound, count in zip(DURATION_BUCKETS, values["buckets"]):
+            lines.append(f'moneyscope_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'moneyscope_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {values["calls"]}')
+        lines.append(f'moneyscope_stage_duration_seconds_sum{{stage="{stage}"}} {values["seconds_total"]:.6f}')
+        lines.append(f'moneyscope_stage_duration_seconds_count{{stage="{stage}"}} {values["calls"]}')
+
+    metrics = [
+        ("errors_total", "counter", "Число вызовов этапа, завершившихся исключением", "errors"),
+        ("rows_in_total", "counter", "Сумма строк на входе этапа", "rows_in_total"),
+        ("rows_out_total", "counter", "Сумма строк на выходе этапа", "rows_out_total"),
+        ("duration_seconds_max", "gauge", "Максимальное время выполнения этапа", "seconds_max"),
+        ("peak_memory_bytes", "gauge", "Максимальный пиковый прирост памяти этапа", "peak_memory_bytes_max"),
+    ]
+    for metric, metric_type, description, key in metrics:
+        lines.append(f"# HELP moneyscope_stage_{metric} {description}")
+        lines.append(f"# TYPE moneyscope_stage_{metric} {metric_type}")
+        for stage, values in sorted(stats.items()):
+            lines.append(f'moneyscope_stage_{metric}{{stage="{stage}"}} {values[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: Optional[Union[str, Path]] = None) -> Optional[Path]:
+    """Атомарно записывает замеры в файл в формате Prometheus (например, для textfile collector).
+    По умолчанию используется путь из переменной METRICS_FILE; если он не задан, ничего не делает"""
+    target = path or get_config().metrics_file
+    if not target:
+        return None
+    # utils импортирует этот модуль, поэтому помощник записи импортируется при вызове
+    from moneyscope.utils import write_text_atomic
+
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    write_text_atomic(target, prometheus_text())
+    return target
+
+
+if _enabled and _trace_memory:
+    tracemalloc.start()
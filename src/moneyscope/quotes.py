@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from moneyscope.config import DEFAULT_QUOTE_CACHE_TTL, get_config
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.metrics import instrument
+
+if TYPE_CHECKING:
+    import requests
+else:
+    requests = lazy_import("requests")
+
+# Таймауты по умолчанию: на установку соединения и на чтение ответа, в секундах
+DEFAULT_TIMEOUT = (3.05, 5.0)
+
+# Время жизни котировки в кэше и сколько ещё после него устаревшая котировка может отдаваться, в секундах
+DEFAULT_TTL = DEFAULT_QUOTE_CACHE_TTL
+DEFAULT_MAX_STALE = 24 * 60 * 60.0
+
+
+class QuoteClient:
+    """Клиент котировок financialmodelingprep.com.
+    Использует одну сессию с пулом keep-alive соединений и ограниченный пул потоков.
+    Символы запрашиваются пачками через мультисимвольный endpoint (quote/AAPL,MSFT,...),
+    а символы, которых не оказалось в ответе, дозапрашиваются по одному параллельно.
+    У каждого запроса есть таймаут, поэтому один медленный символ не задерживает остальные дольше него"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+        max_workers: int = 8,
+        batch_size: int = 50,
+    ) -> None:
+        from requests.adapters import HTTPAdapter
+
+        config = get_config()
+        self.base_url = base_url if base_url is not None else config.fmp_api_url
+        self.api_key = api_key if api_key is not None else config.fmp_api_key
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quotes")
+
+    def _request(self, symbols: List[str]) -> Dict[str, float]:
+        """Один запрос к API за котировками нескольких символов"""
+        response = self.session.get(
+            f"{self.base_url}{','.join(symbols)}", params={"apikey": self.api_key}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        prices = {}
+        for item in data or []:
+            # В ответе на запрос одного символа поле symbol может отсутствовать
+            symbol = item.get("symbol", symbols[0] if len(symbols) == 1 else None)
+            if symbol in symbols and item.get("price") is not None:
+                prices[symbol] = item["price"]
+        return prices
+
+    def _request_safely(self, symbols: List[str]) -> Dict[str, float]:
+        try:
+            return self._request(symbols)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Не удалось получить котировки %s: %s", ", ".join(symbols), e)
+            return {}
+
+    @instrument("quotes_fetch")
+    def fetch(self, symbols: List[str]) -> Dict[str, float]:
+        """Возвращает словарь символ -> цена. Символы без котировки в словарь не попадают"""
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+
+        batches = [symbols[i : i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
+        prices: Dict[str, float] = {}
+        for batch_prices in self._executor.map(self._request_safely, batches):
+            prices.update(batch_prices)
+
+        # Если мультисимвольный запрос вернул не всё, дозапрашиваем недостающие символы по одному
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing and (len(symbols) > 1):
+            for symbol_prices in self._executor.map(self._request_safely, [[symbol] for symbol in missing]):
+                prices.update(symbol_prices)
+
+        return prices
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class QuoteCache:
+    """Кэш котировок перед клиентом QuoteClient.
+    Свежие котировки (моложе ttl) отдаются из кэша. Устаревшие, но не старше ttl + max_stale,
+    отдаются сразу, а в фоне запрашиваются заново. Одновременные промахи по одному символу
+    объединяются в один запрос. Если задан path, содержимое кэша сохраняется в JSON-файл
+    и загружается при создании, так что перезапущенный процесс стартует с прогретым кэшем"""
+
+    def __init__(
+        self,
+        client: QuoteClient,
+        ttl: float = DEFAULT_TTL,
+        max_stale: float = DEFAULT_MAX_STALE,
+        path: Optional[Union[str, Path]] = None,
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.path = Path(path) if path else None
+
+        self._lock = threading.Lock()
+        # Символ -> (цена, время получения по time.time())
+        self._entries: Dict[str, Tuple[float, float]] = {}
+        # Символ -> Future запроса, который сейчас выполняется
+        self._inflight: Dict[str, Future] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._entries = {
+                symbol: (float(entry["price"]), float(entry["fetched_at"])) for symbol, entry in data.items()
+            }
+            logger.info("Загружено %s котировок из кэша %s", len(self._entries), self.path)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Не удалось прочитать кэш котировок %s: %s", self.path, e)
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            data = {
+                symbol: {"price": price, "fetched_at": fetched_at}
+                for symbol, (price, fetched_at) in self._entries.items()
+            }
+
+        # utils импортирует этот модуль, поэтому помощник записи импортируется при вызове
+        from moneyscope.utils import write_text_atomic
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_text_atomic(self.path, json.dumps(data))
+        except OSError as e:
+            logger.warning("Не удалось сохранить кэш котировок %s: %s", self.path, e)
+
+    def _refresh(self, symbols: List[str], futures: Dict[str, Future]) -> None:
+        """Запрашивает символы, за которые отвечает этот поток, и завершает их Future"""
+        prices: Dict[str, float] = {}
+        try:
+            prices = self.client.fetch(symbols)
+        finally:
+            fetched_at = time.time()
+            with self._lock:
+                for symbol, price in prices.items():
+                    self._entries[symbol] = (price, fetched_at)
+                for symbol in symbols:
+                    self._inflight.pop(symbol, None)
+            for symbol in symbols:
+                futures[symbol].set_result(prices.get(symbol))
+            if prices:
+                self._save()
+
+    def _start(self, symbols: List[str]) -> Dict[str, Future]:
+        """Регистрирует запросы по символам, которые ещё никто не запрашивает. Вызывается под блокировкой"""
+        futures: Dict[str, Future] = {}
+        for symbol in symbols:
+            if symbol not in self._inflight:
+                futures[symbol] = self._inflight[symbol] = Future()
+        return futures
+
+    def get(self, symbols: List[str]) -> Dict[str, float]:
+        """Возвращает словарь символ -> цена. Символы без котировки в словарь не попадают"""
+        symbols = list(dict.fromkeys(symbols))
+        now = time.time()
+        result: Dict[str, float] = {}
+        missing: List[str] = []
+        stale: List[str] = []
+
+        with self._lock:
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+                if entry is None or now - entry[1] > self.ttl + self.max_stale:
+                    missing.append(symbol)
+                    continue
+                result[symbol] = entry[0]
+                if now - entry[1] > self.ttl:
+                    stale.append(symbol)
+
+            # Устаревшие котировки обновляем в фоне, промахи запрашиваем сами или ждём чужой запрос
+            background = self._start(stale)
+            own = self._start(missing)
+            waiting = {symbol: self._inflight[symbol] for symbol in missing if symbol not in own}
+
+        if background:
+            threading.Thread(target=self._refresh, args=(list(background), background), daemon=True).start()
+        if own:
+            self._refresh(list(own), own)
+
+        for symbol in missing:
+            price = (own.get(symbol) or waiting[symbol]).result()
+            if price is not None:
+                result[symbol] = price
+
+        return {symbol: result[symbol] for symbol in symbols if symbol in result}
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Дожидается завершения запросов, которые выполняются в фоне"""
+        with self._lock:
+            futures = list(self._inflight.values())
+        wait(futures, timeout=timeout)
+
+
+_quote_client: Optional[QuoteClient] = None
+_quote_client_lock = threading.Lock()
+_quote_cache: Optional[QuoteCache] = None
+
+
+def get_quote_client() -> QuoteClient:
+    """Возвращает общий для процесса клиент котировок (создаётся при первом обращении)"""
+    global _quote_client
+    with _quote_client_lock:
+        if _quote_client is None:
+            _quote_client = QuoteClient()
+        return _quote_client
+
+
+def get_quote_cache() -> QuoteCache:
+    """Возвращает общий для процесса кэш котировок.
+    Время жизни задаётся переменной QUOTE_CACHE_TTL (в секундах), файл кэша — переменной QUOTE_CACHE_PATH"""
+    global _quote_cache
+    client = get_quote_client()
+    with _quote_client_lock:
+        if _quote_cache is None:
+            config = get_config()
+            _quote_cache = QuoteCache(client, ttl=config.quote_cache_ttl, path=config.quote_cache_path)
+        return _quote_cache
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import atexit
+import queue
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.utils import write_atomic
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+# Сколько строк отчёта сериализуется за раз: большой отчёт пишется порциями, а не одной огромной строкой
+WRITE_CHUNK_ROWS = 50_000
+
+# Формат по расширению файла отчёта
+FORMAT_BY_SUFFIX = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".parquet": "parquet"}
+
+
+def _chunks(report: pd.DataFrame) -> list:
+    return [report.iloc[start : start + WRITE_CHUNK_ROWS] for start in range(0, len(report), WRITE_CHUNK_ROWS)]
+
+
+def _records_json(chunk: pd.DataFrame, lines: bool) -> str:
+    text: str = chunk.to_json(orient="records", date_format="iso", date_unit="s", force_ascii=False, lines=lines)
+    return text
+
+
+def _write_json(report: pd.DataFrame, path: Path) -> None:
+    """Компактный JSON-массив записей, без отступов"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for position, chunk in enumerate(_chunks(report)):
+            if position:
+                f.write(",")
+            f.write(_records_json(chunk, lines=False)[1:-1])
+        f.write("]")
+
+
+def _write_ndjson(report: pd.DataFrame, path: Path) -> None:
+    """По одной JSON-записи на строку"""
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in _chunks(report):
+            f.write(_records_json(chunk, lines=True).rstrip("\n") + "\n")
+
+
+def _write_csv(report: pd.DataFrame, path: Path) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for position, chunk in enumerate(_chunks(report) or [report]):
+            chunk.to_csv(f, index=False, header=position == 0, date_format="%Y-%m-%dT%H:%M:%S")
+
+
+def _write_parquet(report: pd.DataFrame, path: Path) -> None:
+    report.to_parquet(path, index=False, row_group_size=WRITE_CHUNK_ROWS)
+
+
+REPORT_FORMATS: Dict[str, Callable[[pd.DataFrame, Path], None]] = {
+    "json": _write_json,
+    "ndjson": _write_ndjson,
+    "csv": _write_csv,
+    "parquet": _write_parquet,
+}
+
+
+def report_format(filename: str, fmt: Optional[str] = None) -> str:
+    """Формат отчёта: явно заданный или по расширению файла (по умолчанию json)"""
+    fmt = fmt or FORMAT_BY_SUFFIX.get(Path(filename).suffix.lower(), "json")
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчёта: {fmt}. Доступны: {', '.join(REPORT_FORMATS)}")
+    return fmt
+
+
+def write_report(report: pd.DataFrame, path: Path, fmt: str) -> None:
+    """Атомарно записывает отчёт: во временный файл рядом с целевым, затем переименование"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, lambda tmp_file: REPORT_FORMATS[fmt](report, tmp_file))
+
+
+class ReportWriter:
+    """Фоновая запись отчётов: вызывающий код только ставит отчёт в очередь,
+    а сериализация и запись на диск выполняются в отдельном потоке.
+    flush() дожидается записи всех поставленных отчётов, close() дополнительно останавливает поток"""
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.errors = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="report_writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item: Optional[Tuple[Any, Path, str]] = self._queue.get()
+            try:
+                if item is None:
+                    return
+                report, path, fmt = item
+                write_report(report, path, fmt)
+                logger.info("Отчёт сохранён в файл %s", path)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Ошибка при сохранении отчёта: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, report: pd.DataFrame, path: Path, fmt: str) -> None:
+        """Ставит отчёт в очередь на запись. Отчёт копируется, чтобы его можно было менять после вызова"""
+        self._ensure_started()
+        self._queue.put((report.copy(), path, fmt))
+
+    def flush(self) -> None:
+        """Дожидается записи всех отчётов, поставленных в очередь"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Записывает оставшиеся отчёты и останавливает фоновый поток"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join()
+
+
+_report_writer = ReportWriter()
+
+
+def submit_report(report: pd.DataFrame, path: Path, fmt: str) -> None:
+    """Ставит отчёт в очередь общего фонового потока записи"""
+    _report_writer.submit(report, path, fmt)
+
+
+def flush_reports() -> None:
+    """Дожидается записи на диск всех отчётов, сохранённых декоратором save_report_to_file"""
+    _report_writer.flush()
+
+
+def close_reports() -> None:
+    """Записывает оставшиеся отчёты и останавливает фоновый поток записи. Вызывается и при выходе из программы"""
+    _report_writer.close()
+
+
+atexit.register(close_reports)
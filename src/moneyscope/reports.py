@@ -1,39 +1,55 @@
+from __future__ import annotations
+
 import functools
-import os
 from datetime import datetime
-from pathlib import Path
-from typing import Any, Callable, Optional
-
-import pandas as pd
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Union
 
+from moneyscope.config import get_config
+from moneyscope.lazy import lazy_import
 from moneyscope.logger_config import logger
-
-load_dotenv()
-report_files_dir = Path(str(os.getenv("REPORT_FILES_DIR")))
-
-
-def save_report_to_file(filename: Optional[str] = "") -> Callable[..., Any]:
+from moneyscope.memo import memoize
+from moneyscope.metrics import instrument
+from moneyscope.report_writer import close_reports, flush_reports, report_format, submit_report  # noqa: F401
+from moneyscope.utils import (
+    OperationsSnapshot,
+    OperationsStore,
+    iter_chunks,
+    resolve_operations,
+    select_operations,
+    sort_operations,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+report_files_dir = get_config().report_files_dir
+
+
+def save_report_to_file(filename: Optional[str] = "", fmt: Optional[str] = None) -> Callable[..., Any]:
     """Декоратор для сохранения отчёта в файл.
     Файлы сохраняются в папке, путь к которой хранится в переменной REPORT_FILES_DIR.
-    Если в декоратор не передавать наименование файла, он подставит имя функции с расширением json
+    Если в декоратор не передавать наименование файла, он подставит имя функции с расширением json.
+    Формат (json, ndjson, csv, parquet) задаётся параметром fmt или определяется по расширению файла.
+    Отчёт записывается в фоновом потоке, дождаться записи можно через flush_reports()
     """
 
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        report_name = filename or func.__name__ + ".json"
+        report_fmt = report_format(report_name, fmt)
+
         @functools.wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
             # Выполняем функцию и получаем результат
             result = func(*args, **kwargs)
 
-            # Записываем результат в файл в формате JSON
-            nonlocal filename
-            if not filename:
-                filename = func.__name__ + ".json"
-            report_file = report_files_dir / filename
-
-            result.to_json(
-                report_file, orient="records", date_format="iso", date_unit="s", force_ascii=False, indent=4
-            )
+            # Если функция вернула отчёт вместе с дополнительными данными, сохраняем только отчёт.
+            # Запись идёт в фоне и не задерживает вызывающий код
+            report = result[0] if isinstance(result, tuple) else result
+            submit_report(report, report_files_dir / report_name, report_fmt)
             return result
 
         return wrapper
@@ -41,39 +57,153 @@ def save_report_to_file(filename: Optional[str] = "") -> Callable[..., Any]:
     return decorator
 
 
+def _spending_key(category: str, date_string: Optional[str] = "") -> Optional[tuple]:
+    """Ключ кэша spending_by_category: без даты результат зависит от текущего дня и не кэшируется"""
+    return (category, date_string) if date_string else None
+
+
+@instrument("spending_by_category")
 @save_report_to_file("spending_by_category.json")
-def spending_by_category(transactions: pd.DataFrame, category: str, date_string: Optional[str] = "") -> pd.DataFrame:
+@memoize(key_args=_spending_key)
+def spending_by_category(
+    transactions: Union[pd.DataFrame, Iterable[pd.DataFrame], OperationsStore, OperationsSnapshot],
+    category: str,
+    date_string: Optional[str] = "",
+) -> pd.DataFrame:
     """Функция возвращает траты по заданной категории за последние три месяца от переданной даты,
-    либо от текущей, если дата не передана"""
+    либо от текущей, если дата не передана.
+    Принимает DataFrame, итератор порций из utils.iter_operations, хранилище операций или его снимок"""
 
     try:
         # Если дата не передана, используем текущую дату
         if not date_string:
             end_date = datetime.now()
-            logger.info(f"Дата не передана, используется текущая дата: {end_date}")
+            logger.info("Дата не передана, используется текущая дата: %s", end_date)
         else:
             end_date = pd.to_datetime(date_string, format="%d.%m.%Y")
-            logger.info(f"Используемая дата: {end_date}")
+            logger.info("Используемая дата: %s", end_date)
 
         # Вычисляем дату три месяца назад
         start_date = end_date - pd.DateOffset(months=3)
-        logger.info(f"Начало периода: {start_date}, конец периода: {end_date}")
+        logger.info("Начало периода: %s, конец периода: %s", start_date, end_date)
 
         # Увеличиваем конечную дату на один день минус одна секунда, чтобы включить конец последнего дня
         end_date = end_date + pd.DateOffset(days=1) - pd.Timedelta(seconds=1)
 
-        # Фильтрация данных по категории и дате
-        filtered_transactions = transactions[
-            (transactions["Категория"] == category)
-            & (transactions["Дата операции"] >= start_date)
-            & (transactions["Дата операции"] <= end_date)
-        ]
+        # Фильтрация данных по категории и дате: у хранилища и снимка — по индексу,
+        # у итератора — по порциям
+        if isinstance(transactions, (OperationsStore, OperationsSnapshot)):
+            filtered_transactions = select_operations(transactions, start_date, end_date, category)
+        else:
+            parts = [select_operations(chunk, start_date, end_date, category) for chunk in iter_chunks(transactions)]
+            if not parts:
+                return pd.DataFrame()
+            filtered_transactions = parts[0] if len(parts) == 1 else pd.concat(parts)
 
-        logger.info(f"Найдено {len(filtered_transactions)} транзакций по категории '{category}' за указанный период")
+        logger.info(
+            "Найдено %s транзакций по категории '%s' за указанный период", len(filtered_transactions), category
+        )
 
         # Возвращаем отфильтрованные данные
         return filtered_transactions
     except Exception as e:
         # Логгируем любые ошибки, которые могут возникнуть
-        logger.error(f"Ошибка в функции spending_by_category: {str(e)}")
+        logger.error("Ошибка в функции spending_by_category: %s", e)
         return pd.DataFrame()  # Возвращаем пустой DataFrame в случае ошибки
+
+
+def _report_periods(end_dates: Iterable[Any]) -> tuple:
+    """Границы трёхмесячных периодов так же, как в spending_by_category: [конец - 3 месяца, конец дня].
+    Даты могут быть строками в формате ДД.ММ.ГГГГ или объектами даты"""
+    end_dates = list(end_dates)
+    if all(isinstance(end_date, str) for end_date in end_dates):
+        end_index = pd.DatetimeIndex(pd.to_datetime(end_dates, format="%d.%m.%Y"))
+    else:
+        end_index = pd.DatetimeIndex(end_dates)
+    start_index = end_index - pd.DateOffset(months=3)
+    return start_index, end_index, end_index + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+
+
+def _cube_key(
+    end_dates: Iterable[Any], categories: Optional[Iterable[str]] = None, return_slices: bool = False
+) -> Optional[tuple]:
+    """Ключ кэша spending_by_category_cube. Одноразовые итераторы в ключ не превращаются, такие вызовы не кэшируются"""
+    sequences = (list, tuple, pd.Index)
+    if not isinstance(end_dates, sequences) or not (categories is None or isinstance(categories, sequences)):
+        return None
+    return tuple(end_dates), None if categories is None else tuple(categories), return_slices
+
+
+@instrument("spending_by_category_cube")
+@save_report_to_file("spending_by_category_cube.json")
+@memoize(key_args=_cube_key)
+def spending_by_category_cube(
+    transactions: Union[pd.DataFrame, OperationsStore, OperationsSnapshot],
+    end_dates: Iterable[Any],
+    categories: Optional[Iterable[str]] = None,
+    return_slices: bool = False,
+) -> Union[pd.DataFrame, tuple]:
+    """Траты за три месяца до каждой из дат end_dates сразу по всем категориям (или по categories).
+    Операции один раз сортируются по категории и дате, по каждой категории считаются накопленные суммы,
+    а границы всех периодов находятся векторным двоичным поиском.
+    Возвращает таблицу со столбцами category, start_date, end_date, total_amount, operations_count.
+    При return_slices=True дополнительно возвращает словарь (категория, дата) -> строки операций периода"""
+    columns = ["category", "start_date", "end_date", "total_amount", "operations_count"]
+    try:
+        df = resolve_operations(transactions)
+        start_index, end_index, inclusive_end_index = _report_periods(end_dates)
+        df = df[df["Дата операции"].notna() & df["Категория"].notna()]
+
+        # Сортируем по категории, внутри категории — по дате
+        df = sort_operations(df).sort_values("Категория", kind="stable", ignore_index=True)
+        codes, uniques = pd.factorize(df["Категория"])
+        category_codes = {category: code for code, category in enumerate(uniques.tolist())}
+        categories = list(category_codes) if categories is None else list(categories)
+
+        dates = df["Дата операции"].to_numpy(dtype="datetime64[ns]")
+        amounts = np.nan_to_num(df["Сумма операции"].to_numpy(dtype="float64", na_value=np.nan))
+        cumulative = np.concatenate([[0.0], np.cumsum(amounts)])
+        block_bounds = np.searchsorted(codes, np.arange(len(uniques) + 1)) if len(df) else np.zeros(1, dtype=int)
+
+        starts = start_index.to_numpy(dtype="datetime64[ns]")
+        ends = inclusive_end_index.to_numpy(dtype="datetime64[ns]")
+
+        lows, highs = [], []
+        slices = {}
+        for category in categories:
+            if category in category_codes:
+                code = category_codes[category]
+                block_start, block_end = block_bounds[code], block_bounds[code + 1]
+                block_dates = dates[block_start:block_end]
+                lo = block_start + np.searchsorted(block_dates, starts, side="left")
+                hi = np.maximum(lo, block_start + np.searchsorted(block_dates, ends, side="right"))
+            else:
+                lo = hi = np.zeros(len(end_index), dtype=int)
+
+            lows.append(lo)
+            highs.append(hi)
+            if return_slices:
+                for position, end_date in enumerate(end_index):
+                    slices[(category, end_date)] = df.iloc[lo[position] : hi[position]]
+
+        lo = np.concatenate(lows) if lows else np.zeros(0, dtype=int)
+        hi = np.concatenate(highs) if highs else np.zeros(0, dtype=int)
+
+        # Сумма по периоду — разность накопленных сумм на его границах
+        report = pd.DataFrame(
+            {
+                "category": np.repeat(categories, len(end_index)),
+                "start_date": np.tile(start_index, len(categories)),
+                "end_date": np.tile(end_index, len(categories)),
+                "total_amount": (cumulative[hi] - cumulative[lo]).round(2),
+                "operations_count": hi - lo,
+            },
+            columns=columns,
+        )
+        logger.info("Отчёт по %s категориям и %s датам сформирован", len(categories), len(end_index))
+        return (report, slices) if return_slices else report
+
+    except Exception as e:
+        logger.error("Ошибка в функции spending_by_category_cube: %s", e)
+        report = pd.DataFrame(columns=columns)
+        return (report, {}) if return_slices else report
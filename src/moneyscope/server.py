@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Tuple, Union
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from moneyscope.logger_config import logger
+from moneyscope.reports import spending_by_category
+from moneyscope.services import top_3_cashback_categories
+from moneyscope.stream import LiveAggregates
+from moneyscope.utils import OperationsSnapshot, OperationsStore, get_operations_store, in_reporting_currency
+from moneyscope.views import MAIN_PAGE_DEADLINE, get_main_page
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Сколько потоков считают ответы: работа с pandas выполняется в них, а не в цикле событий
+DEFAULT_WORKERS = 4
+
+# Наибольший размер строки запроса и заголовков, в байтах
+MAX_REQUEST_LINE = 8192
+
+
+class RequestError(ValueError):
+    """Некорректные параметры запроса: клиент получает ответ 400"""
+
+
+def _json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, indent=4)
+
+
+def _report_json(report: pd.DataFrame) -> str:
+    """Отчёт в виде JSON-массива записей, так же, как он сохраняется в файл"""
+    text: str = report.to_json(orient="records", date_format="iso", date_unit="s", force_ascii=False)
+    return text
+
+
+def _param(params: Dict[str, str], name: str) -> str:
+    value = params.get(name)
+    if not value:
+        raise RequestError(f"Не передан параметр {name}")
+    return value
+
+
+def _int_param(params: Dict[str, str], name: str, low: int, high: int) -> int:
+    value = _param(params, name)
+    if not value.isdigit() or not low <= int(value) <= high:
+        raise RequestError(f"Параметр {name} должен быть целым числом от {low} до {high}")
+    return int(value)
+
+
+def _date_param(params: Dict[str, str], name: str, fmt: str) -> str:
+    value = params[name]
+    try:
+        datetime.strptime(value, fmt)
+    except ValueError:
+        raise RequestError(f"Параметр {name} должен быть в формате {fmt}") from None
+    return value
+
+
+class MoneyScopeService:
+    """Долгоживущий HTTP-сервис: операции загружаются один раз и держатся в памяти,
+    а Главная страница, топ кешбэка и траты по категории отдаются по запросу.
+
+    Эндпоинты (GET, ответ в JSON):
+    /main?time=YYYY-MM-DD HH:MM:SS — get_main_page (без time — текущий момент);
+    /cashback?year=2021&month=12 — top_3_cashback_categories;
+    /spending?category=Супермаркеты&date=31.12.2021 — spending_by_category (без date — от текущего дня);
+    /health — версия и размер снимка операций, число запросов.
+
+    Если передан live (агрегаты stream.LiveAggregates), Главная страница и топ кешбэка берутся из них
+    и учитывают операции, пришедшие из потока после загрузки снимка.
+
+    Расчёты выполняются в пуле потоков, цикл событий только принимает запросы.
+    Одинаковые запросы, пришедшие одновременно, объединяются: считается один, остальные ждут его результат"""
+
+    def __init__(
+        self,
+        operations: Optional[Union[OperationsStore, OperationsSnapshot]] = None,
+        max_workers: int = DEFAULT_WORKERS,
+        live: Optional[LiveAggregates] = None,
+    ) -> None:
+        self.operations = operations if operations is not None else get_operations_store()
+        self.live = live
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="moneyscope_server")
+        self.requests = 0
+        self.computed = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._routes: Dict[str, Callable[[Dict[str, str]], Tuple[Hashable, Callable[[OperationsSnapshot], str]]]] = {
+            "/main": self._main_page,
+            "/cashback": self._cashback,
+            "/spending": self._spending,
+        }
+
+    def _snapshot(self) -> OperationsSnapshot:
+        # Пересчитанный в валюту отчётов снимок запоминается у исходного, поэтому запросы его не пересчитывают
+        snapshot: OperationsSnapshot = in_reporting_currency(self.operations)
+        return snapshot
+
+    # Разбор параметров: каждый маршрут возвращает ключ запроса и функцию расчёта ответа по снимку
+
+    def _main_page(self, params: Dict[str, str]) -> Tuple[Hashable, Callable[[OperationsSnapshot], str]]:
+        if params.get("time"):
+            time_str = _date_param(params, "time", "%Y-%m-%d %H:%M:%S")
+        else:
+            time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return time_str, functools.partial(self._call_main_page, time_str)
+
+    def _call_main_page(self, time_str: str, snapshot: OperationsSnapshot) -> str:
+        if self.live is not None:
+            return self.live.main_page(time_str, deadline=MAIN_PAGE_DEADLINE)
+        return get_main_page(time_str, snapshot, deadline=MAIN_PAGE_DEADLINE)
+
+    def _cashback(self, params: Dict[str, str]) -> Tuple[Hashable, Callable[[OperationsSnapshot], str]]:
+        year = _int_param(params, "year", 1, 9999)
+        month = _int_param(params, "month", 1, 12)
+        if self.live is not None:
+            live = self.live
+            return (year, month), lambda snapshot: live.top_3_cashback(year, month)
+        return (year, month), lambda snapshot: top_3_cashback_categories(snapshot, year, month)
+
+    def _spending(self, params: Dict[str, str]) -> Tuple[Hashable, Callable[[OperationsSnapshot], str]]:
+        category = _param(params, "category")
+        date_string = _date_param(params, "date", "%d.%m.%Y") if params.get("date") else ""
+        # Без даты отчёт считается от текущего дня, поэтому день входит в ключ
+        key = (category, date_string or datetime.now().strftime("%d.%m.%Y"))
+        return key, lambda snapshot: _report_json(spending_by_category(snapshot, category, date_string))
+
+    async def _compute(self, compute: Callable[[OperationsSnapshot], str], snapshot: OperationsSnapshot) -> str:
+        self.computed += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, compute, snapshot)
+
+    async def _coalesced(
+        self, key: Hashable, compute: Callable[[OperationsSnapshot], str], snapshot: OperationsSnapshot
+    ) -> str:
+        """Ответ на запрос; если такой же запрос уже считается, ждёт его результат вместо нового расчёта"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._compute(compute, snapshot))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: если клиент отключился, общий расчёт для остальных не отменяется
+        return await asyncio.shield(future)
+
+    async def dispatch(self, method: str, target: str) -> Tuple[int, str]:
+        """Обрабатывает запрос без сетевого слоя: возвращает HTTP-статус и тело ответа в JSON"""
+        self.requests += 1
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, _json({"error": f"Метод {method} не поддерживается"})
+
+        try:
+            loop = asyncio.get_running_loop()
+            if url.path == "/health":
+                snapshot = await loop.run_in_executor(self.executor, self._snapshot)
+                return HTTPStatus.OK, _json(
+                    {
+                        "version": snapshot.version,
+                        "rows": len(snapshot),
+                        "requests": self.requests,
+                        "computed": self.computed,
+                        "coalesced": self.coalesced,
+                    }
+                )
+
+            route = self._routes.get(url.path)
+            if route is None:
+                return HTTPStatus.NOT_FOUND, _json({"error": f"Неизвестный адрес {url.path}"})
+            key, compute = route(params)
+
+            # Снимок берётся в пуле потоков: первая загрузка или проверка файла не блокируют цикл событий.
+            # Номер снимка входит в ключ, поэтому после обновления данных старый расчёт не переиспользуется
+            snapshot = await loop.run_in_executor(self.executor, self._snapshot)
+            return HTTPStatus.OK, await self._coalesced((url.path, key, snapshot.uid), compute, snapshot)
+        except RequestError as e:
+            return HTTPStatus.BAD_REQUEST, _json({"error": str(e)})
+        except Exception as e:
+            logger.error("Ошибка при обработке запроса %s: %s", target, e)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, _json({"error": "Внутренняя ошибка сервера"})
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """HTTP/1.1 с keep-alive: запросы одного соединения обрабатываются по очереди"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3 or len(request_line) > MAX_REQUEST_LINE:
+                    status, body = HTTPStatus.BAD_REQUEST.value, _json({"error": "Некорректный запрос"})
+                    version, keep_alive = "HTTP/1.1", False
+                else:
+                    method, target, version = parts
+                    # Тело запроса не используется, но его нужно дочитать, чтобы не сбить следующий запрос
+                    if int(headers.get("content-length") or 0):
+                        await reader.readexactly(int(headers["content-length"]))
+                    status, body = await self.dispatch(method, target)
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                payload = body.encode("utf-8")
+                head = (
+                    f"{version} {int(status)} {HTTPStatus(status).phrase}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning("Соединение закрыто с ошибкой: %s", e)
+        finally:
+            writer.close()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> Tuple[str, int]:
+        """Загружает операции и начинает принимать соединения. Возвращает адрес и порт сервера
+        (при port=0 порт выбирается свободный)"""
+        snapshot = await asyncio.get_running_loop().run_in_executor(self.executor, self._snapshot)
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_REQUEST_LINE)
+        address = self._server.sockets[0].getsockname()
+        logger.info("Сервер запущен на %s:%s, загружено %s операций", address[0], address[1], len(snapshot))
+        return address[0], address[1]
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        await self.start(host, port)
+        if self._server is not None:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """Прекращает приём соединений и останавливает пул потоков"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.executor.shutdown(wait=False)
+
+
+class ServiceClient:
+    """Клиент для проверки сервиса в том же процессе: запускает сервер на свободном локальном порту
+    и отправляет настоящие HTTP-запросы.
+
+    async with ServiceClient(MoneyScopeService(snapshot)) as client:
+        status, data = await client.get("/cashback?year=2021&month=12")"""
+
+    def __init__(self, service: MoneyScopeService) -> None:
+        self.service = service
+        self.host = DEFAULT_HOST
+        self.port = 0
+
+    async def __aenter__(self) -> "ServiceClient":
+        self.host, self.port = await self.service.start(DEFAULT_HOST, 0)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.service.close()
+
+    async def get(self, target: str) -> Tuple[int, Any]:
+        """GET-запрос по отдельному соединению: возвращает статус и разобранный JSON-ответ"""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            request = f"GET {quote(target, safe='/?=&')} HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\n\r\n"
+            writer.write(request.encode("utf-8"))
+            await writer.drain()
+            status_line = await reader.readline()
+            headers: Dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers["content-length"]))
+            return int(status_line.split()[1]), json.loads(body)
+        finally:
+            writer.close()
+
+
+def main() -> None:
+    """Запуск сервиса: python -m moneyscope.server --port 8080"""
+    parser = argparse.ArgumentParser(description="HTTP-сервис MoneyScope")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="число потоков для расчётов")
+    args = parser.parse_args()
+
+    service = MoneyScopeService(max_workers=args.workers)
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("Сервер остановлен")
+
+
+if __name__ == "__main__":
+    main()
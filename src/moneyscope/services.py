@@ -1,41 +1,130 @@
-import json
+from __future__ import annotations
 
-import pandas as pd
+import json
+from typing import TYPE_CHECKING, Iterable, Union
 
+from moneyscope.lazy import lazy_import
 from moneyscope.logger_config import logger
+from moneyscope.memo import memoize
+from moneyscope.metrics import instrument
+from moneyscope.utils import OperationsSnapshot, OperationsStore, iter_chunks
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+else:
+    pd = lazy_import("pandas")
+    pa = lazy_import("pyarrow")
+
+# Столбцы, которые нужны для расчёта кешбэка
+CASHBACK_COLUMNS = ["Дата операции", "Категория", "Кэшбэк"]
+
+
+def _top_3_from_cube(snapshot: OperationsSnapshot, year: int, month: int) -> str:
+    """Топ-3 категорий кешбэка по кубу агрегатов снимка"""
+    if not len(snapshot):
+        logger.warning("Операции отсутствуют.")
+        return json.dumps({"error": "Нет данных для анализа кешбэка"}, ensure_ascii=False, indent=4)
+
+    months = [pd.Period(year=year, month=month, freq="M")]
+    logger.info(
+        "Найдено %s операций с положительным кешбэком за указанный период", snapshot.cube.cashback_count(months)
+    )
+
+    cashback_by_category = snapshot.cube.cashback_by_category(months)
+    if cashback_by_category.empty:
+        logger.warning("Нет операций с положительным кешбэком за %s-%s", year, month)
+        return json.dumps({"error": f"Нет операций с кешбэком за {year}-{month}"}, ensure_ascii=False, indent=4)
+
+    result = cashback_by_category.nlargest(3).to_dict()
+    logger.info("Результат успешно преобразован в JSON")
+    return json.dumps(result, ensure_ascii=False, indent=4)
+
 
+def _columnar_frame(data: Union[pd.DataFrame, pa.Table, dict]) -> pd.DataFrame:
+    """Приводит колоночные данные к DataFrame только из нужных столбцов без копирования самих столбцов"""
+    if isinstance(data, pa.Table):
+        frame: pd.DataFrame = data.select(CASHBACK_COLUMNS).to_pandas()
+        return frame
+    if isinstance(data, dict):
+        return pd.DataFrame({column: data[column] for column in CASHBACK_COLUMNS}, copy=False)
+    return data
 
-def top_3_cashback_categories(data: list, year: int, month: int) -> str:
-    """Функция для анализа выгодности категорий повышенного кешбэка."""
+
+@instrument("top_3_cashback_categories")
+@memoize()
+def top_3_cashback_categories(
+    data: Union[list, pd.DataFrame, pa.Table, dict, Iterable[pd.DataFrame], OperationsStore, OperationsSnapshot],
+    year: int,
+    month: int,
+) -> str:
+    """Функция для анализа выгодности категорий повышенного кешбэка.
+    Принимает список словарей с операциями, колоночные данные (DataFrame, таблицу Arrow
+    или словарь массивов), итератор порций из utils.iter_operations, а также хранилище операций или его снимок.
+    Колоночные данные не копируются и не изменяются, а уже преобразованные в datetime даты не разбираются повторно"""
     try:
-        if not data:
-            logger.warning("Список пуст. Операции отсутствуют.")
-            return json.dumps({"error": "Нет данных для анализа кешбэка"}, ensure_ascii=False, indent=4)
+        if isinstance(data, OperationsStore):
+            data = data.snapshot()
+
+        if isinstance(data, list):
+            if not data:
+                logger.warning("Список пуст. Операции отсутствуют.")
+                return json.dumps({"error": "Нет данных для анализа кешбэка"}, ensure_ascii=False, indent=4)
+
+            # Преобразуем список словарей в DataFrame
+            chunks: Iterable[pd.DataFrame] = [pd.DataFrame(data)]
+        elif isinstance(data, OperationsSnapshot):
+            # У снимка ответ берётся из куба агрегатов по месяцам, без обхода строк
+            return _top_3_from_cube(data, year, month)
+        elif isinstance(data, (pd.DataFrame, pa.Table, dict)):
+            chunks = [_columnar_frame(data)]
+        else:
+            chunks = iter_chunks(data)
+
+        month_start = pd.Timestamp(year, month, 1)
+        next_month_start = month_start + pd.DateOffset(months=1)
 
-        # Преобразуем список словарей в DataFrame
-        df = pd.DataFrame(data)
+        partials = []
+        found_count = 0
+        rows_count = 0
+        for df in chunks:
+            rows_count += len(df)
 
-        # Преобразуем столбец "Дата операции" в формат datetime с дефисами
-        df["Дата операции"] = pd.to_datetime(df["Дата операции"], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+            # Преобразуем столбец "Дата операции" в формат datetime с дефисами, если он ещё не преобразован.
+            # Результат хранится отдельно, чтобы не изменять переданные данные
+            dates = df["Дата операции"]
+            if not pd.api.types.is_datetime64_any_dtype(dates):
+                dates = pd.to_datetime(dates, format="%Y-%m-%d %H:%M:%S", errors="coerce")
 
-        # Убедимся, что преобразование прошло успешно
-        if df["Дата операции"].isnull().any():
-            logger.error("Некорректные даты в данных операций.")
-            return json.dumps({"error": "Некорректные данные в поле 'Дата операции'"}, ensure_ascii=False, indent=4)
+            # Убедимся, что преобразование прошло успешно
+            if dates.isnull().any():
+                logger.error("Некорректные даты в данных операций.")
+                return json.dumps(
+                    {"error": "Некорректные данные в поле 'Дата операции'"}, ensure_ascii=False, indent=4
+                )
+
+            # Фильтрация по месяцу (используем поле "Дата операции") и положительному кешбэку
+            cashback = df["Кэшбэк"]
+            mask = (dates >= month_start) & (dates < next_month_start) & (cashback > 0)
+            if not mask.any():
+                continue
+
+            found_count += int(mask.sum())
+            partials.append(cashback[mask].groupby(df["Категория"][mask], observed=True).sum())
+
+        if not rows_count:
+            logger.warning("Операции отсутствуют.")
+            return json.dumps({"error": "Нет данных для анализа кешбэка"}, ensure_ascii=False, indent=4)
 
-        # Фильтрация по году, месяцу (используем поле "Дата операции") и положительному кешбэку
-        filtered_df = df[
-            (df["Дата операции"].dt.year == year) & (df["Дата операции"].dt.month == month) & (df["Кэшбэк"] > 0)
-        ]
-        logger.info(f"Найдено {len(filtered_df)} операций с положительным кешбэком за указанный период")
+        logger.info("Найдено %s операций с положительным кешбэком за указанный период", found_count)
 
         # Проверка, есть ли данные после фильтрации
-        if filtered_df.empty:
-            logger.warning(f"Нет операций с положительным кешбэком за {year}-{month}")
+        if not partials:
+            logger.warning("Нет операций с положительным кешбэком за %s-%s", year, month)
             return json.dumps({"error": f"Нет операций с кешбэком за {year}-{month}"}, ensure_ascii=False, indent=4)
 
         # Суммируем кешбэк по категориям
-        cashback_by_category = filtered_df.groupby("Категория")["Кэшбэк"].sum().nlargest(3)
+        cashback_by_category = pd.concat(partials).groupby(level=0).sum().nlargest(3)
 
         # Преобразуем результат в JSON
         result = cashback_by_category.to_dict()
@@ -44,7 +133,7 @@ def top_3_cashback_categories(data: list, year: int, month: int) -> str:
 
     except Exception as e:
         # Логгируем любую ошибку
-        logger.error(f"Ошибка в функции top_3_cashback_categories: {str(e)}")
+        logger.error("Ошибка в функции top_3_cashback_categories: %s", e)
         return json.dumps(
             {"error": "Произошла ошибка при расчёте топ-3 категорий кэшбэка"}, ensure_ascii=False, indent=4
         )
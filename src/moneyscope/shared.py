@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from moneyscope.cube import CUBE_KEYS, AggregateCube
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.metrics import instrument
+from moneyscope.utils import OperationsSnapshot, OperationsStore, write_atomic, write_text_atomic
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+# Файл со счётчиком поколений: номер последнего опубликованного снимка
+GENERATION_FILE = "generation"
+
+# Выравнивание буферов столбцов в файле данных, в байтах
+ALIGNMENT = 64
+
+# Сколько последних поколений хранится: предыдущее нужно процессам, которые ещё не переключились
+KEEP_GENERATIONS = 2
+
+
+def _data_file(generation: int) -> str:
+    return f"operations.{generation}.bin"
+
+
+def _manifest_file(generation: int) -> str:
+    return f"operations.{generation}.json"
+
+
+def current_generation(directory: Union[str, Path]) -> Optional[int]:
+    """Номер последнего опубликованного поколения или None, если данные ещё не публиковались"""
+    try:
+        return int((Path(directory) / GENERATION_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class _Layout:
+    """Размещение буферов в файле данных: каждый буфер выровнен по ALIGNMENT байт"""
+
+    def __init__(self) -> None:
+        self.buffers: List[Tuple[int, np.ndarray]] = []
+        self.size = 0
+
+    def add(self, array: np.ndarray) -> int:
+        offset = -(-self.size // ALIGNMENT) * ALIGNMENT
+        self.buffers.append((offset, np.ascontiguousarray(array)))
+        self.size = offset + array.nbytes
+        return offset
+
+
+def _column_buffers(column: pd.Series) -> Tuple[Dict[str, Any], List[np.ndarray]]:
+    """Описание столбца для манифеста и его буферы фиксированной ширины.
+    Категории хранятся кодами, nullable-целые — значениями и маской пропусков,
+    текстовые столбцы без схемы публикуются как категории"""
+    dtype = column.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or dtype == object or pd.api.types.is_string_dtype(dtype):
+        values = column.array if isinstance(dtype, pd.CategoricalDtype) else pd.Categorical(column)
+        codes = np.asarray(values.codes)
+        return {"kind": "category", "categories": values.categories.tolist(), "dtype": codes.dtype.str}, [codes]
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and hasattr(column.array, "_mask"):
+        array: Any = column.array
+        return {"kind": "masked", "dtype": dtype.name}, [np.asarray(array._data), np.asarray(array._mask)]
+    values = column.to_numpy()
+    if values.dtype.hasobject:
+        raise TypeError(f"Столбец {column.name} типа {dtype} нельзя разместить в общей памяти")
+    return {"kind": "numpy", "dtype": values.dtype.str}, [values]
+
+
+def _frame_layout(frame: pd.DataFrame, layout: _Layout) -> Dict[str, Any]:
+    columns = []
+    for name in frame.columns:
+        description, arrays = _column_buffers(frame[name])
+        columns.append({"name": name, **description, "offsets": [layout.add(array) for array in arrays]})
+    return {"rows": len(frame), "columns": columns}
+
+
+def _attach_frame(data: np.ndarray, description: Dict[str, Any]) -> pd.DataFrame:
+    rows = description["rows"]
+    columns: Dict[str, Any] = {}
+    for column in description["columns"]:
+        kind, offsets = column["kind"], column["offsets"]
+        if kind == "category":
+            codes = np.frombuffer(data, dtype=column["dtype"], count=rows, offset=offsets[0])
+            dtype = pd.CategoricalDtype(pd.Index(column["categories"]))
+            columns[column["name"]] = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+        elif kind == "masked":
+            masked: Any = pd.api.types.pandas_dtype(column["dtype"])
+            values = np.frombuffer(data, dtype=masked.numpy_dtype, count=rows, offset=offsets[0])
+            mask = np.frombuffer(data, dtype="bool", count=rows, offset=offsets[1])
+            columns[column["name"]] = masked.construct_array_type()(values, mask)
+        else:
+            columns[column["name"]] = np.frombuffer(data, dtype=column["dtype"], count=rows, offset=offsets[0])
+    return pd.DataFrame(columns, copy=False)
+
+
+@instrument("shared_publish")
+def publish_operations(source: Union[OperationsSnapshot, pd.DataFrame], directory: Union[str, Path]) -> int:
+    """Раскладывает столбцы операций, позиции строк категорий и куб агрегатов по буферам одного файла
+    в directory и публикует его как новое поколение: файл данных и манифест пишутся под новыми именами,
+    затем атомарно заменяется счётчик поколений. Возвращает номер опубликованного поколения.
+    Для общей памяти без записи на диск directory располагают в tmpfs, например в /dev/shm"""
+    snapshot = source if isinstance(source, OperationsSnapshot) else OperationsSnapshot(source, 0, None)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    generation = (current_generation(directory) or 0) + 1
+
+    layout = _Layout()
+    operations = _frame_layout(snapshot.operations, layout)
+    positions = [
+        [category, layout.add(np.asarray(rows, dtype="int64")), len(rows)]
+        for category, rows in (snapshot.index.category_positions.items() if snapshot.index else [])
+    ]
+    # Куб небольшой: его строки — месяцы, категории и карты, а не операции
+    cube_frame = snapshot.cube.data.reset_index()
+    cube_frame["month"] = cube_frame["month"].dt.to_timestamp()
+    cube = _frame_layout(cube_frame, layout)
+
+    def write(tmp_file: Path) -> None:
+        # Пустой файл нельзя отобразить в память, поэтому файл данных не короче одного блока
+        data = np.memmap(tmp_file, dtype="uint8", mode="w+", shape=max(layout.size, ALIGNMENT))
+        for offset, array in layout.buffers:
+            data[offset : offset + array.nbytes] = array.view("uint8").reshape(-1)
+        data.flush()
+        del data
+
+    data_path = directory / _data_file(generation)
+    write_atomic(data_path, write)
+
+    manifest = {
+        "generation": generation,
+        "data": data_path.name,
+        "operations": operations,
+        "category_positions": positions,
+        "cube": cube,
+    }
+    write_text_atomic(directory / _manifest_file(generation), json.dumps(manifest, ensure_ascii=False))
+    write_text_atomic(directory / GENERATION_FILE, str(generation))
+
+    # Процессы, которые уже отобразили старые файлы в память, продолжают их читать и после удаления
+    for old in range(generation - KEEP_GENERATIONS, 0, -1):
+        if not (directory / _manifest_file(old)).exists():
+            break
+        (directory / _manifest_file(old)).unlink(missing_ok=True)
+        (directory / _data_file(old)).unlink(missing_ok=True)
+
+    logger.info("Опубликовано поколение %s: %s строк, %s байт в %s", generation, len(snapshot), layout.size, directory)
+    return generation
+
+
+@instrument("shared_attach")
+def attach_snapshot(directory: Union[str, Path], generation: Optional[int] = None) -> OperationsSnapshot:
+    """Подключается к опубликованному поколению (по умолчанию к последнему) без копирования:
+    столбцы операций и позиции строк категорий ссылаются на файл, отображённый в память только для чтения.
+    Номер поколения становится версией снимка"""
+    directory = Path(directory)
+    generation = generation if generation is not None else current_generation(directory)
+    if generation is None:
+        raise FileNotFoundError(f"В {directory} нет опубликованных операций")
+
+    with open(directory / _manifest_file(generation), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    data = np.memmap(directory / manifest["data"], dtype="uint8", mode="r")
+
+    operations = _attach_frame(data, manifest["operations"])
+    positions = {
+        category: np.frombuffer(data, dtype="int64", count=count, offset=offset)
+        for category, offset, count in manifest["category_positions"]
+    }
+    cube_frame = _attach_frame(data, manifest["cube"])
+    cube = AggregateCube()
+    if len(cube_frame):
+        cube_frame["month"] = cube_frame["month"].dt.to_period("M")
+        cube_frame["category"] = cube_frame["category"].astype("str")
+        cube_frame["last_digits"] = cube_frame["last_digits"].astype("str")
+        cube.data = cube_frame.set_index(CUBE_KEYS)
+    return OperationsSnapshot(operations, generation, generation, cube, positions)
+
+
+def attach_operations(directory: Union[str, Path], generation: Optional[int] = None) -> Tuple[int, pd.DataFrame]:
+    """Номер поколения и DataFrame операций из общих буферов, без копирования"""
+    snapshot = attach_snapshot(directory, generation)
+    return snapshot.version, snapshot.operations
+
+
+class SharedOperationsStore(OperationsStore):
+    """Хранилище операций процесса-обработчика, подключённое к общим буферам.
+    Вместо времени изменения файла сверяется счётчик поколений: когда загрузчик публикует новое
+    поколение, процесс в фоне подключается к нему и атомарно подменяет снимок.
+    Операции и позиции строк категорий не копируются в память процесса, а небольшой куб агрегатов
+    не пересчитывается"""
+
+    def __init__(self, directory: Union[str, Path], check_interval: float = 1.0) -> None:
+        super().__init__(None, check_interval)
+        self.directory = Path(directory)
+
+    def _mtime_ns(self) -> Optional[int]:
+        return current_generation(self.directory)
+
+    def _load(self) -> OperationsSnapshot:
+        snapshot = attach_snapshot(self.directory)
+        logger.info("Подключено поколение %s общих операций: %s строк", snapshot.version, len(snapshot))
+        return snapshot
+
+
+def main() -> None:
+    """Запуск загрузчика: python -m moneyscope.shared /dev/shm/moneyscope --watch"""
+    parser = argparse.ArgumentParser(description="Публикация операций в общую память для процессов-обработчиков")
+    parser.add_argument("directory", help="папка для буферов (tmpfs, например /dev/shm/moneyscope)")
+    parser.add_argument("--data", default=None, help="файл операций (по умолчанию DATA_PATH)")
+    parser.add_argument("--watch", action="store_true", help="публиковать новое поколение при изменении файла")
+    parser.add_argument("--interval", type=float, default=1.0, help="период проверки файла, в секундах")
+    args = parser.parse_args()
+
+    # Хранилище само перечитывает изменившийся файл в фоне; публикуется каждый новый снимок
+    store = OperationsStore(Path(args.data) if args.data else None, check_interval=args.interval)
+    published = store.snapshot()
+    publish_operations(published, args.directory)
+    while args.watch:
+        time.sleep(args.interval)
+        snapshot = store.snapshot()
+        if snapshot is not published:
+            publish_operations(snapshot, args.directory)
+            published = snapshot
+
+
+if __name__ == "__main__":
+    main()
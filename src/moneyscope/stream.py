@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import sys
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from moneyscope.config import get_config
+from moneyscope.currency import CURRENCY_COLUMNS, RateTable, conversion_factor
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.utils import (
+    REQUIRED_COLUMNS,
+    OperationsSnapshot,
+    _prepare_operations,
+    get_currency_rates,
+    get_greeting,
+    get_operations_store,
+    get_stock_prices,
+    get_top_transactions,
+    in_reporting_currency,
+)
+from moneyscope.views import _collect_sections, get_main_page
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+# Сколько крупнейших операций месяца хранится для Главной страницы
+DEFAULT_TOP_N = 5
+
+# Числовые поля операции: пустое значение или NaN хранится как None
+_NUMBER_FIELDS = ("Сумма операции", "Сумма платежа", "Кэшбэк")
+
+Month = Tuple[int, int]
+
+
+def _number(value: Any, field: str) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Поле «{field}» должно быть числом, получено {value!r}") from None
+    return None if math.isnan(number) else number
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value == "":
+        return None
+    return str(value)
+
+
+def parse_operation(event: Union[str, bytes, Dict[str, Any]]) -> Dict[str, Any]:
+    """Проверяет операцию из потока (строку NDJSON или словарь) и приводит её поля к нужным типам.
+    Операция должна содержать те же обязательные столбцы, что и выгрузка для read_operations,
+    дата операции — в формате ДД.ММ.ГГГГ ЧЧ:ММ:СС. При ошибке выбрасывает ValueError"""
+    if isinstance(event, (str, bytes)):
+        try:
+            event = json.loads(event)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Некорректный JSON: {e}") from None
+    if not isinstance(event, dict):
+        raise ValueError("Операция должна быть JSON-объектом")
+
+    missing = REQUIRED_COLUMNS - set(event)
+    if missing:
+        raise ValueError(f"Отсутствуют обязательные столбцы: {', '.join(sorted(missing))}")
+    try:
+        date = datetime.strptime(str(event["Дата операции"]), "%d.%m.%Y %H:%M:%S")
+    except ValueError:
+        raise ValueError(f"Некорректная дата операции: {event['Дата операции']!r}") from None
+
+    operation = dict(event)
+    operation["Дата операции"] = date
+    for field in _NUMBER_FIELDS:
+        operation[field] = _number(event[field], field)
+    for field in ("Номер карты", "Категория", "Описание"):
+        operation[field] = _text(event[field])
+    return operation
+
+
+class LiveAggregates:
+    """Агрегаты Главной страницы, которые обновляются по каждой новой операции за O(1):
+    суммы расходов и кешбэка по картам за месяц (как в aggregate_card_data), топ-N операций месяца
+    по модулю суммы платежа (как в get_top_transactions) и кешбэк по категориям за месяц
+    (как в top_3_cashback_categories). Начальные значения берутся из снимка операций.
+    Суммы ведутся в валюте currency (по умолчанию REPORTING_CURRENCY), как у отчётов по снимку:
+    начальный снимок и каждая операция из потока пересчитываются по таблице курсов table.
+    Агрегаты покрывают месяц целиком, поэтому для момента раньше последней операции месяца
+    Главная страница считается по всем операциям (начальным и пришедшим из потока).
+    Объект потокобезопасен: операции можно добавлять из одного потока и читать данные из других"""
+
+    def __init__(
+        self,
+        snapshot: Optional[OperationsSnapshot] = None,
+        top_n: int = DEFAULT_TOP_N,
+        currency: Optional[str] = None,
+        table: Optional[RateTable] = None,
+    ) -> None:
+        self.top_n = top_n
+        self.currency = currency or get_config().reporting_currency
+        self._table = table
+        # (валюта, день) -> множитель пересчёта в currency; None — курс неизвестен
+        self._factors: Dict[Tuple[str, Any], Optional[float]] = {}
+        self.accepted = 0
+        self.rejected = 0
+        # (месяц, последние 4 цифры карты) -> [сумма расходов, кешбэк по расходам]
+        self._cards: Dict[Tuple[Month, str], List[float]] = {}
+        # (месяц, категория) -> сумма положительного кешбэка
+        self._cashback: Dict[Tuple[Month, str], float] = {}
+        # месяц -> куча из top_n элементов (модуль суммы, время, -номер, запись): наверху — наименьший
+        self._top: Dict[Month, List[Tuple[float, float, int, Dict[str, Any]]]] = {}
+        # месяц -> время последней операции месяца
+        self._latest: Dict[Month, datetime] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # Начальный снимок и операции из потока: по ним собирается снимок для моментов внутри месяца
+        self._initial = snapshot
+        self._operations: List[Dict[str, Any]] = []
+        self._snapshot: Optional[Tuple[int, OperationsSnapshot]] = None
+        if snapshot is not None and len(snapshot):
+            if self.currency:
+                snapshot = snapshot.in_currency(self.currency, self._table)
+                self._initial = snapshot
+            self._seed(snapshot)
+
+    def _seed(self, snapshot: OperationsSnapshot) -> None:
+        """Начальные значения: суммы — из куба агрегатов снимка, топ операций — одним проходом по месяцам"""
+        data = snapshot.cube.data
+        measures = [
+            data[column] for column in ("spent", "spent_cashback", "spent_count", "cashback", "cashback_count")
+        ]
+        rows: Any = zip(data.index, *measures)
+        for (month, category, last_digits), spent, spent_cashback, spent_count, cashback, cashback_count in rows:
+            key = (month.year, month.month)
+            if last_digits and spent_count > 0:
+                totals = self._cards.setdefault((key, last_digits), [0.0, 0.0])
+                totals[0] += float(spent)
+                totals[1] += float(spent_cashback)
+            if isinstance(category, str) and cashback_count > 0:
+                self._cashback[(key, category)] = self._cashback.get((key, category), 0.0) + float(cashback)
+
+        operations = snapshot.operations
+        operations["_month"] = operations["Дата операции"].dt.to_period("M")
+        latest: Any = operations.groupby("_month")["Дата операции"].max()
+        for month, date in latest.items():
+            self._latest[(month.year, month.month)] = date.to_pydatetime()
+        top: Any = get_top_transactions(operations, self.top_n, group_by="_month")
+        for month, records in top.items():
+            # Записи топа уже упорядочены, поэтому номер в пределах месяца сохраняет их порядок при равенстве
+            for position, record in enumerate(records):
+                record_date = datetime.strptime(record["date"], "%d.%m.%Y")
+                self._push((month.year, month.month), record, record["amount"], record_date, -position)
+
+    def _push(self, month: Month, record: Dict[str, Any], amount: Optional[float], date: datetime, order: int) -> None:
+        heap = self._top.setdefault(month, [])
+        item = (-1.0 if amount is None else abs(amount), date.timestamp(), order, record)
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, item)
+        elif item[:3] > heap[0][:3]:
+            heapq.heapreplace(heap, item)
+
+    def _convert(self, operation: Dict[str, Any]) -> Dict[str, Any]:
+        """Пересчитывает денежные поля операции в валюту currency по курсу на дату операции.
+        Поля без валюты или без известного курса остаются как есть"""
+        if not self.currency:
+            return operation
+        day = operation["Дата операции"].date()
+        for currency_column in set(CURRENCY_COLUMNS.values()):
+            source = _text(operation.get(currency_column))
+            if source is None or source == self.currency:
+                continue
+            if (source, day) not in self._factors:
+                factor = conversion_factor(source, day, self.currency, self._table)
+                if factor is None:
+                    logger.warning("Нет курса %s на %s, операции из потока остаются в исходной валюте", source, day)
+                self._factors[(source, day)] = factor
+            factor = self._factors[(source, day)]
+            if factor is None:
+                continue
+            for amount, column in CURRENCY_COLUMNS.items():
+                value = _number(operation.get(amount), amount) if column == currency_column else None
+                if value is not None:
+                    operation[amount] = value * factor
+            operation[currency_column] = self.currency
+        return operation
+
+    def add(self, event: Union[str, bytes, Dict[str, Any]]) -> bool:
+        """Добавляет одну операцию. Некорректная операция пропускается (и пишется в лог), тогда возвращает False"""
+        try:
+            operation = self._convert(parse_operation(event))
+        except ValueError as e:
+            self.rejected += 1
+            logger.warning("Операция из потока пропущена: %s", e)
+            return False
+
+        date: datetime = operation["Дата операции"]
+        month = (date.year, date.month)
+        amount = operation["Сумма операции"]
+        cashback = operation["Кэшбэк"]
+        card = operation["Номер карты"]
+        category = operation["Категория"]
+        record = {
+            "date": date.strftime("%d.%m.%Y"),
+            "amount": operation["Сумма платежа"],
+            "category": category,
+            "description": operation["Описание"],
+        }
+
+        with self._lock:
+            if card is not None and amount is not None and amount < 0:
+                totals = self._cards.setdefault((month, card[-4:]), [0.0, 0.0])
+                totals[0] -= amount
+                totals[1] += cashback or 0.0
+            if category is not None and cashback is not None and cashback > 0:
+                self._cashback[(month, category)] = self._cashback.get((month, category), 0.0) + cashback
+            # Новые операции ниже уже известных с той же суммой и временем, поэтому номер берётся со знаком минус
+            self._push(month, record, operation["Сумма платежа"], date, -(self.top_n + next(self._sequence)))
+            if month not in self._latest or date > self._latest[month]:
+                self._latest[month] = date
+            self._operations.append(operation)
+            self.accepted += 1
+        return True
+
+    def add_many(self, events: Iterable[Union[str, bytes, Dict[str, Any]]]) -> int:
+        """Добавляет операции по очереди; пустые строки пропускаются. Возвращает число принятых операций"""
+        accepted = 0
+        for event in events:
+            if isinstance(event, (str, bytes)) and not event.strip():
+                continue
+            accepted += self.add(event)
+        return accepted
+
+    def snapshot(self) -> OperationsSnapshot:
+        """Снимок всех операций: начального снимка и пришедших из потока.
+        Собирается заново, только если с прошлого вызова пришли новые операции"""
+        with self._lock:
+            count = len(self._operations)
+            if self._snapshot is not None and self._snapshot[0] == count:
+                return self._snapshot[1]
+            operations = self._operations[:count]
+
+        rows = _prepare_operations(pd.DataFrame(operations)) if operations else None
+        if self._initial is None:
+            snapshot = OperationsSnapshot(rows if rows is not None else pd.DataFrame(), version=count, mtime_ns=None)
+        else:
+            snapshot = self._initial if rows is None else self._initial.with_rows(rows)
+        with self._lock:
+            self._snapshot = (count, snapshot)
+        return snapshot
+
+    def card_totals(self, year: int, month: int) -> list:
+        """Суммы расходов и кешбэка по картам за месяц в формате aggregate_card_data"""
+        with self._lock:
+            totals = [(digits, values) for (key, digits), values in self._cards.items() if key == (year, month)]
+        return [
+            {"last_digits": digits, "total_spent": round(spent, 2), "cashback": round(cashback, 2)}
+            for digits, (spent, cashback) in sorted(totals)
+        ]
+
+    def top_transactions(self, year: int, month: int) -> list:
+        """Топ операций месяца по модулю суммы платежа в формате get_top_transactions"""
+        with self._lock:
+            heap = list(self._top.get((year, month), []))
+        return [dict(item[3]) for item in sorted(heap, key=lambda item: item[:3], reverse=True)]
+
+    def cashback_by_category(self, year: int, month: int) -> Dict[str, float]:
+        with self._lock:
+            return {
+                category: round(total, 2) for (key, category), total in self._cashback.items() if key == (year, month)
+            }
+
+    def top_3_cashback(self, year: int, month: int) -> str:
+        """Топ-3 категорий кешбэка за месяц, JSON-ответ как у top_3_cashback_categories"""
+        cashback = self.cashback_by_category(year, month)
+        if not cashback:
+            return json.dumps({"error": f"Нет операций с кешбэком за {year}-{month}"}, ensure_ascii=False, indent=4)
+        top = sorted(cashback.items(), key=lambda item: item[1], reverse=True)[:3]
+        return json.dumps(dict(top), ensure_ascii=False, indent=4)
+
+    def main_page(self, time_str: str, deadline: Optional[float] = None) -> str:
+        """Данные Главной страницы с начала месяца до time_str, как у get_main_page.
+        Если time_str не раньше последней операции месяца, ответ берётся из агрегатов без обхода операций;
+        иначе агрегаты включают более поздние операции, и страница считается get_main_page по снимку всех операций.
+        Курсы валют и цены акций запрашиваются так же, как в get_main_page"""
+        try:
+            date_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+        except ValueError as e:
+            logger.error("Ошибка в функции main_page: %s", e)
+            return json.dumps(
+                {"error": "Не удалось сформировать данные для главной страницы"}, ensure_ascii=False, indent=4
+            )
+
+        with self._lock:
+            latest = self._latest.get((date_time.year, date_time.month))
+        if latest is not None and date_time < latest:
+            return get_main_page(time_str, self.snapshot(), deadline)
+
+        cards = self.card_totals(date_time.year, date_time.month)
+        top_transactions = self.top_transactions(date_time.year, date_time.month)
+        if not top_transactions:
+            return json.dumps({"error": "Нет операций за указанный период"}, ensure_ascii=False, indent=4)
+
+        sections, late = _collect_sections(
+            {"currency_rates": get_currency_rates, "stock_prices": get_stock_prices}, deadline
+        )
+        result = {"greeting": get_greeting(), "cards": cards, "top_transactions": top_transactions, **sections}
+        if late:
+            result["partial_sections"] = late
+        return json.dumps(result, ensure_ascii=False, indent=4)
+
+    def stats(self) -> Dict[str, int]:
+        return {"accepted": self.accepted, "rejected": self.rejected}
+
+
+def frame_to_events(operations: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Операции DataFrame (как из read_operations) в виде событий потока: словарей с полями строки выгрузки"""
+    records: List[Dict[str, Any]] = (
+        operations.astype(object).where(operations.notna(), None).to_dict(orient="records")  # type: ignore[assignment]
+    )
+    for record in records:
+        record["Дата операции"] = record["Дата операции"].strftime("%d.%m.%Y %H:%M:%S")
+        if record.get("Дата платежа") is not None:
+            record["Дата платежа"] = record["Дата платежа"].strftime("%d.%m.%Y")
+    return records
+
+
+async def _read_events(live: LiveAggregates, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Читает операции NDJSON из одного соединения, пока клиент его не закроет"""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                live.add(line)
+    except (ConnectionError, ValueError) as e:
+        logger.warning("Соединение потока операций закрыто с ошибкой: %s", e)
+    finally:
+        writer.close()
+
+
+async def serve_stream(
+    live: LiveAggregates, socket_path: Optional[str] = None, host: str = "127.0.0.1", port: int = 0
+) -> asyncio.Server:
+    """Принимает операции NDJSON через Unix-сокет socket_path или локальный TCP-порт"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await _read_events(live, reader, writer)
+
+    if socket_path:
+        server = await asyncio.start_unix_server(handle, socket_path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    logger.info("Приём операций запущен: %s", socket_path or server.sockets[0].getsockname())
+    return server
+
+
+async def _serve(args: argparse.Namespace, live: LiveAggregates, snapshot: OperationsSnapshot) -> None:
+    from moneyscope.server import MoneyScopeService
+
+    stream_server = await serve_stream(live, args.socket, port=args.port or 0)
+    if args.http_port is None:
+        await stream_server.serve_forever()
+        return
+    service = MoneyScopeService(snapshot, live=live)
+    await service.start(port=args.http_port)
+    await stream_server.serve_forever()
+
+
+def main() -> None:
+    """Запуск: операции NDJSON из stdin (в конце печатается Главная страница) или из сокета"""
+    parser = argparse.ArgumentParser(description="Приём операций в реальном времени")
+    parser.add_argument("--socket", default=None, help="путь к Unix-сокету для приёма операций")
+    parser.add_argument("--port", type=int, default=None, help="локальный TCP-порт для приёма операций")
+    parser.add_argument("--http-port", type=int, default=None, help="порт HTTP-сервиса с актуальной Главной страницей")
+    parser.add_argument("--time", default=None, help="дата и время Главной страницы, YYYY-MM-DD HH:MM:SS")
+    parser.add_argument("--no-seed", action="store_true", help="не загружать операции из DATA_PATH")
+    args = parser.parse_args()
+
+    if args.no_seed:
+        snapshot = OperationsSnapshot(pd.DataFrame(), version=0, mtime_ns=None)
+    else:
+        snapshot = get_operations_store().snapshot()
+    # Все ответы сервиса, как и /spending, считаются в валюте отчётов
+    snapshot = in_reporting_currency(snapshot)
+    live = LiveAggregates(snapshot)
+
+    if args.socket or args.port:
+        try:
+            asyncio.run(_serve(args, live, snapshot))
+        except KeyboardInterrupt:
+            logger.info("Приём операций остановлен")
+        return
+
+    live.add_many(sys.stdin)
+    print(live.main_page(args.time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    print(json.dumps(live.stats(), ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
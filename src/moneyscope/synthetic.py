@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, Optional, Union
+
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import logger
+from moneyscope.utils import _prepare_operations
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+# Столбцы выгрузки банка в том порядке, в котором они идут в operations.xlsx
+EXPORT_COLUMNS = [
+    "Дата операции",
+    "Дата платежа",
+    "Номер карты",
+    "Статус",
+    "Сумма операции",
+    "Валюта операции",
+    "Сумма платежа",
+    "Валюта платежа",
+    "Кэшбэк",
+    "Категория",
+    "MCC",
+    "Описание",
+    "Бонусы (включая кэшбэк)",
+    "Округление на инвесткопилку",
+    "Сумма операции с округлением",
+]
+
+# Категории: доля операций, MCC, медиана модуля суммы, доля поступлений, доля операций с кэшбэком, описания.
+# Доли и медианы взяты из настоящей выгрузки data/operations.xlsx
+CATEGORIES = [
+    ("Супермаркеты", 0.339, 5411, 110.0, 0.0, 0.10, ("Колхоз", "Магнит", "SPAR", "Дикси", "Перекрёсток")),
+    ("Фастфуд", 0.193, 5814, 110.0, 0.0, 0.04, ("McDonald's", "Бургер Кинг", "Rumyanyj Khleb", "KFC")),
+    ("Транспорт", 0.057, 4121, 186.0, 0.0, 0.30, ("Яндекс Такси", "Метро Санкт-Петербург", "Московский транспорт")),
+    ("Переводы", 0.052, 6012, 500.0, 0.34, 0.0, ("Перевод на карту", "Пополнение счета", "Иван С.")),
+    ("Ж/д билеты", 0.037, 4112, 300.0, 0.05, 0.39, ("РЖД", "Московский метрополитен", "Метро Санкт-Петербург")),
+    ("Различные товары", 0.034, 5399, 350.0, 0.0, 0.10, ("Ozon.ru", "Wildberries", "AliExpress")),
+    ("Связь", 0.029, 4814, 300.0, 0.0, 0.05, ("МТС", "Билайн", "Ростелеком")),
+    ("Пополнения", 0.027, 6012, 7000.0, 1.0, 0.0, ("Перевод с карты", "Внесение наличных через банкомат")),
+    ("Аптеки", 0.023, 5912, 400.0, 0.0, 0.10, ("Апрель", "Аптека Вита", "Ригла")),
+    ("Каршеринг", 0.018, 7512, 300.0, 0.0, 0.10, ("Ситидрайв", "Яндекс Драйв", "Делимобиль")),
+    ("Рестораны", 0.017, 5812, 1200.0, 0.0, 0.10, ("Торро Гриль", "Теремок", "Шоколадница")),
+    ("Бонусы", 0.015, None, 390.0, 1.0, 0.0, ("Вознаграждение за операции покупок", "Проценты на остаток по счету")),
+    ("Наличные", 0.015, 6011, 3500.0, 0.0, 0.0, ("Снятие в банкомате Сбербанк", "Снятие в банкомате Тинькофф")),
+    ("Дом и ремонт", 0.015, 5200, 900.0, 0.0, 0.10, ("Леруа Мерлен", "OBI", "Петрович")),
+    ("Услуги банка", 0.014, None, 99.0, 0.0, 0.0, ("Плата за обслуживание", "Оповещение об операциях")),
+    ("Топливо", 0.011, 5541, 1500.0, 0.0, 0.20, ("Лукойл", "Газпромнефть", "Роснефть")),
+    ("Образование", 0.011, 8220, 2500.0, 0.0, 0.05, ("Skyeng", "Skillbox", "Яндекс Практикум")),
+    ("Одежда и обувь", 0.010, 5651, 2500.0, 0.0, 0.10, ("Uniqlo", "Спортмастер", "Zara")),
+    ("ЖКХ", 0.007, 4900, 3000.0, 0.0, 0.0, ("ЖКУ Квартира", "Мосэнергосбыт")),
+    ("Зарплата", 0.002, None, 26100.0, 1.0, 0.0, ('Пополнение. ООО "ФОРТУНА". Зарплата',)),
+    ("Другое", 0.034, 7299, 500.0, 0.0, 0.05, ("Прочие услуги", "Сервис")),
+    (None, 0.006, None, 300.0, 0.0, 0.0, ("Операция в других кредитных организациях",)),
+]
+
+# Номера карт и их доли; None — операции по счёту без карты
+CARDS = [("*7197", 0.721), ("*4556", 0.171), (None, 0.097), ("*5091", 0.008), ("*5441", 0.002), ("*1112", 0.001)]
+
+# Валюты операций, их доли и курс к рублю для пересчёта суммы платежа
+CURRENCIES = [
+    ("RUB", 0.9805, 1.0),
+    ("TRY", 0.011, 5.5),
+    ("EUR", 0.0043, 85.0),
+    ("CNY", 0.0027, 11.5),
+    ("USD", 0.0015, 75.0),
+]
+
+# Доля неуспешных операций и доля операций с округлением на инвесткопилку
+FAILED_SHARE = 0.0063
+ROUNDING_SHARE = 0.002
+
+# Сколько дней проходит от операции до платежа
+PAYMENT_DELAY_DAYS = ([0, 1, 2], [0.35, 0.5, 0.15])
+
+# Период операций синтетической выгрузки по умолчанию (как в настоящей выгрузке)
+DEFAULT_START = "2018-01-01 00:00:00"
+DEFAULT_END = "2021-12-31 23:59:59"
+
+# Больше строк XLSX-лист не вмещает (1 048 576 строк вместе с заголовком)
+XLSX_MAX_ROWS = 1_048_575
+
+# Сколько строк генерируется и записывается за раз
+GENERATE_CHUNK_ROWS = 1_000_000
+
+
+def _seconds(value: str) -> int:
+    return int(pd.Timestamp(value).value // 10**9)
+
+
+def _weights(table: list, position: int) -> np.ndarray:
+    weights = np.array([row[position] for row in table], dtype=float)
+    normalized: np.ndarray = weights / weights.sum()
+    return normalized
+
+
+def _format_dates(values: np.ndarray, with_time: bool) -> pd.Series:
+    """Даты в формате выгрузки: 31.12.2021 16:44:00 или 31.12.2021"""
+    iso = pd.Series(np.datetime_as_string(values, unit="s"), dtype="str")
+    date = iso.str.slice(8, 10) + "." + iso.str.slice(5, 7) + "." + iso.str.slice(0, 4)
+    return date + " " + iso.str.slice(11, 19) if with_time else date
+
+
+def generate_operations(
+    rows: int,
+    seed: int = 0,
+    start: str = DEFAULT_START,
+    end: str = DEFAULT_END,
+) -> pd.DataFrame:
+    """Синтетическая выгрузка операций в формате operations.xlsx (те же столбцы, строки с датами в виде текста).
+    Категории, MCC, карты, валюты и суммы распределены так же, как в настоящей выгрузке.
+    Операции равномерно распределены между start и end и отсортированы от новых к старым.
+    При одинаковых rows и seed результат один и тот же"""
+    rng = np.random.default_rng(seed)
+
+    seconds = np.sort(rng.integers(_seconds(start), _seconds(end) + 1, size=rows))[::-1]
+    operation_dates = seconds.astype("datetime64[s]")
+    delays = rng.choice(PAYMENT_DELAY_DAYS[0], size=rows, p=PAYMENT_DELAY_DAYS[1]).astype("timedelta64[D]")
+    payment_dates = operation_dates.astype("datetime64[D]") + delays
+
+    category_codes = rng.choice(len(CATEGORIES), size=rows, p=_weights(CATEGORIES, 1))
+    medians = np.array([row[3] for row in CATEGORIES])[category_codes]
+    amounts = np.round(rng.lognormal(np.log(medians), 0.9), 2)
+    income = rng.random(rows) < np.array([row[4] for row in CATEGORIES])[category_codes]
+    payment = np.where(income, amounts, -amounts)
+
+    failed = rng.random(rows) < FAILED_SHARE
+    with_cashback = ~income & ~failed & (rng.random(rows) < np.array([row[5] for row in CATEGORIES])[category_codes])
+    cashback = np.where(with_cashback, np.maximum(1.0, np.floor(amounts * 0.01)), np.nan)
+    bonuses = np.where(income | failed, 0, np.floor(amounts * 0.02)).astype("int64")
+    rounding = np.where(~income & (rng.random(rows) < ROUNDING_SHARE), np.ceil(amounts / 10) * 10 - amounts, 0.0)
+
+    currency_codes = rng.choice(len(CURRENCIES), size=rows, p=_weights(CURRENCIES, 1))
+    rates = np.array([row[2] for row in CURRENCIES])[currency_codes]
+    currencies = np.array([row[0] for row in CURRENCIES], dtype=object)[currency_codes]
+
+    descriptions = np.empty(rows, dtype=object)
+    for code, row in enumerate(CATEGORIES):
+        positions = np.flatnonzero(category_codes == code)
+        descriptions[positions] = np.array(row[6], dtype=object)[rng.integers(0, len(row[6]), size=len(positions))]
+
+    cards = np.array([card for card, _ in CARDS], dtype=object)
+    card_weights = np.array([weight for _, weight in CARDS])
+
+    df = pd.DataFrame(
+        {
+            "Дата операции": _format_dates(operation_dates, with_time=True),
+            "Дата платежа": _format_dates(payment_dates, with_time=False),
+            "Номер карты": cards[rng.choice(len(cards), size=rows, p=card_weights / card_weights.sum())],
+            "Статус": np.where(failed, "FAILED", "OK"),
+            "Сумма операции": np.round(payment / rates, 2),
+            "Валюта операции": currencies,
+            "Сумма платежа": payment,
+            "Валюта платежа": np.where(currencies == "CNY", "CNY", "RUB"),
+            "Кэшбэк": cashback,
+            "Категория": np.array([row[0] for row in CATEGORIES], dtype=object)[category_codes],
+            "MCC": np.array([np.nan if row[2] is None else row[2] for row in CATEGORIES])[category_codes],
+            "Описание": descriptions,
+            "Бонусы (включая кэшбэк)": bonuses,
+            "Округление на инвесткопилку": np.round(rounding).astype("int64"),
+            "Сумма операции с округлением": np.round(amounts + rounding, 2),
+        }
+    )
+    return df[EXPORT_COLUMNS]
+
+
+def iter_generated(
+    rows: int,
+    seed: int = 0,
+    chunk_rows: int = GENERATE_CHUNK_ROWS,
+    start: str = DEFAULT_START,
+    end: str = DEFAULT_END,
+) -> Iterator[pd.DataFrame]:
+    """Синтетическая выгрузка порциями не больше chunk_rows строк.
+    Порции покрывают соседние интервалы дат от новых к старым, поэтому вместе они тоже отсортированы"""
+    chunks = max(1, -(-rows // chunk_rows))
+    bounds = np.linspace(_seconds(start), _seconds(end) + 1, chunks + 1).astype("int64")
+    for number in range(chunks):
+        lo, hi = bounds[chunks - number - 1], bounds[chunks - number] - 1
+        yield generate_operations(
+            min(chunk_rows, rows - number * chunk_rows),
+            seed=seed + number,
+            start=str(pd.Timestamp(lo, unit="s")),
+            end=str(pd.Timestamp(hi, unit="s")),
+        )
+
+
+def write_xlsx(path: Union[str, Path], rows: int, seed: int = 0) -> Path:
+    """Записывает синтетическую выгрузку в XLSX-файл (потоковая запись openpyxl, без хранения листа в памяти)"""
+    from openpyxl import Workbook
+
+    if rows > XLSX_MAX_ROWS:
+        raise ValueError(f"XLSX-лист вмещает не больше {XLSX_MAX_ROWS} строк, запрошено {rows}")
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Отчет по операциям")
+    sheet.append(EXPORT_COLUMNS)
+    for chunk in iter_generated(rows, seed):
+        # Пустые ячейки (NaN и None) записываются как пустые
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+    logger.info("Синтетическая выгрузка из %s строк записана в %s", rows, path)
+    return path
+
+
+def write_parquet(path: Union[str, Path], rows: int, seed: int = 0) -> Path:
+    """Записывает синтетическую выгрузку в Parquet-файл порциями: подходит и для десятков миллионов строк"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer: Optional[pq.ParquetWriter] = None
+    try:
+        for chunk in iter_generated(rows, seed):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    logger.info("Синтетическая выгрузка из %s строк записана в %s", rows, path)
+    return path
+
+
+def write_synthetic(path: Union[str, Path], rows: int, seed: int = 0) -> Path:
+    """Записывает синтетическую выгрузку в XLSX или Parquet в зависимости от расширения файла"""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".xlsx":
+        return write_xlsx(path, rows, seed)
+    if suffix == ".parquet":
+        return write_parquet(path, rows, seed)
+    raise ValueError(f"Неизвестный формат синтетической выгрузки: {suffix}. Доступны: .xlsx, .parquet")
+
+
+def load_synthetic(path: Union[str, Path]) -> pd.DataFrame:
+    """Читает синтетическую выгрузку из Parquet и приводит её к виду, который возвращает read_operations"""
+    return _prepare_operations(pd.read_parquet(path))
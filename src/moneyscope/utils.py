@@ -1,162 +1,837 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import itertools
 import json
 import os
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
-
-import pandas as pd
-import requests
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
 
+from moneyscope.config import get_config
+from moneyscope.cube import AggregateCube, whole_months
+from moneyscope.currency import RateTable, get_rate_table, normalize_currency
+from moneyscope.lazy import lazy_import
 from moneyscope.logger_config import logger
+from moneyscope.metrics import instrument
+from moneyscope.quotes import get_quote_cache
+
+# Тяжёлые библиотеки импортируются при первом использовании, а не при импорте модуля
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+    pa = lazy_import("pyarrow")
+    pq = lazy_import("pyarrow.parquet")
+
+# Пути к operations.xlsx и к файлу пользовательских настроек
+xlsx_path = get_config().data_path
+user_settings_path = get_config().user_settings_path
+
+# Версия формата кэша: при изменении схемы данных старые кэши перестают подходить
+CACHE_VERSION = 2
+CACHE_METADATA_KEY = b"moneyscope_cache"
+
+REQUIRED_COLUMNS = {
+    "Дата операции",
+    "Дата платежа",
+    "Сумма платежа",
+    "Категория",
+    "Описание",
+    "Кэшбэк",
+    "Сумма операции",
+    "Номер карты",
+}
+
+# Числовые столбцы: при потоковом чтении пустые ячейки приходят как None и приводятся к NaN
+NUMERIC_COLUMNS = (
+    "Сумма операции",
+    "Сумма платежа",
+    "Кэшбэк",
+    "MCC",
+    "Бонусы (включая кэшбэк)",
+    "Округление на инвесткопилку",
+    "Сумма операции с округлением",
+)
+
+# Компактная схема типов, применяемая при загрузке: текстовые столбцы с небольшим числом
+# различных значений хранятся как категории, целочисленные — как nullable-целые
+OPERATIONS_SCHEMA = {
+    "Номер карты": "category",
+    "Статус": "category",
+    "Валюта операции": "category",
+    "Валюта платежа": "category",
+    "Категория": "category",
+    "Описание": "category",
+    "MCC": "Int16",
+    "Бонусы (включая кэшбэк)": "Int32",
+    "Округление на инвесткопилку": "Int32",
+}
+
+# Денежные столбцы, которые можно хранить в целых копейках
+MONEY_COLUMNS = ("Сумма операции", "Сумма платежа", "Кэшбэк", "Сумма операции с округлением")
+
+
+def _cache_path(path: Path) -> Path:
+    """Путь к колоночному кэшу, который хранится рядом с исходным файлом"""
+    return path.with_name(path.name + ".cache.parquet")
+
+
+def _file_hash(path: Path) -> str:
+    """Считает SHA-256 содержимого файла, читая его блоками"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_fingerprint(path: Path) -> Dict[str, Any]:
+    """Размер и время изменения файла — быстрый ключ кэша без чтения содержимого"""
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_atomic(path: Path, write: Callable[[Path], Any]) -> None:
+    """Атомарно записывает файл: write пишет во временный файл рядом с path, затем он переименовывается в path.
+    Читатели видят либо прежний, либо полностью записанный файл; при ошибке временный файл удаляется"""
+    tmp_file = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp_file)
+        os.replace(tmp_file, path)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """Атомарно записывает текст в файл в кодировке UTF-8"""
+    write_atomic(path, lambda tmp_file: tmp_file.write_text(text, encoding="utf-8"))
+
+
+def _load_cached_operations(path: Path) -> Optional[pd.DataFrame]:
+    """Читает операции из кэша, если он соответствует исходному файлу.
+    Если размер и время изменения совпадают, файл не перечитывается.
+    Если отличаются, сравнивается хеш содержимого. Иначе возвращает None"""
+    cache_file = _cache_path(path)
+    if not path.is_file() or not cache_file.is_file():
+        return None
 
-# Читаем переменную с путём к operations.xlsx и загружаем путь
-load_dotenv()
-xlsx_path = Path(str(os.getenv("DATA_PATH")))
-user_settings_path = Path(str(os.getenv("USER_SETTINGS_PATH")))
-fmp_api_url = os.getenv("FMP_API_URL")
-fmp_api_key = os.getenv("FMP_API_KEY")
-
-
-def read_operations() -> pd.DataFrame:
-    """Функция для чтения списка операций из XLSX-файла с основными проверками"""
-    required_columns = {
-        "Дата операции",
-        "Дата платежа",
-        "Сумма платежа",
-        "Категория",
-        "Описание",
-        "Кэшбэк",
-        "Сумма операции",
-        "Номер карты",
-    }
     try:
-        # Попытка прочитать Excel-файл
-        df = pd.read_excel(xlsx_path, parse_dates=False)
-        logger.info(f"Файл {xlsx_path} успешно прочитан")
+        metadata = pq.read_schema(cache_file).metadata or {}
+        key = json.loads(metadata.get(CACHE_METADATA_KEY, b"{}"))
+        if key.get("version") != CACHE_VERSION:
+            return None
+
+        fingerprint = _file_fingerprint(path)
+        if key.get("size") != fingerprint["size"]:
+            return None
+        if key.get("mtime_ns") != fingerprint["mtime_ns"] and key.get("sha256") != _file_hash(path):
+            return None
+
+        df = pd.read_parquet(cache_file)
+        if not REQUIRED_COLUMNS.issubset(df.columns):
+            return None
+
+        logger.info("Операции загружены из кэша %s", cache_file)
+        return df
+    except Exception as e:
+        logger.warning("Не удалось прочитать кэш %s: %s", cache_file, e)
+        return None
 
-        # Проверяем наличие необходимых столбцов
-        if not required_columns.issubset(df.columns):
-            missing_columns = required_columns - set(df.columns)
-            raise ValueError(f"Отсутствуют обязательные столбцы: {', '.join(missing_columns)}")
 
-        # Преобразуем столбцы "Дата операции" и "Дата платежа" в datetime
-        df["Дата операции"] = pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S", errors="coerce")
-        df["Дата платежа"] = pd.to_datetime(df["Дата платежа"], format="%d.%m.%Y", errors="coerce")
+def _save_cached_operations(path: Path, df: pd.DataFrame) -> None:
+    """Сохраняет операции в колоночный кэш (Parquet) рядом с исходным файлом.
+    Ключ кэша (размер, время изменения, хеш) хранится в метаданных самого файла,
+    а запись атомарна: сначала во временный файл, затем переименование"""
+    if not path.is_file():
+        return None
+
+    cache_file = _cache_path(path)
+    try:
+        key = {"version": CACHE_VERSION, **_file_fingerprint(path), "sha256": _file_hash(path)}
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = {**(table.schema.metadata or {}), CACHE_METADATA_KEY: json.dumps(key).encode()}
+        table = table.replace_schema_metadata(metadata)
+        write_atomic(cache_file, lambda tmp_file: pq.write_table(table, tmp_file))
+        logger.info("Кэш операций сохранён в %s", cache_file)
+    except Exception as e:
+        logger.warning("Не удалось сохранить кэш %s: %s", cache_file, e)
+    return None
+
+
+def apply_operations_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит столбцы операций к компактной схеме OPERATIONS_SCHEMA.
+    Отсутствующие в DataFrame столбцы пропускаются"""
+    dtypes = {column: dtype for column, dtype in OPERATIONS_SCHEMA.items() if column in df.columns}
+    return df.astype(dtypes)
+
+
+def to_kopecks(df: pd.DataFrame) -> pd.DataFrame:
+    """Возвращает копию операций, в которой денежные столбцы хранятся в целых копейках (Int64)"""
+    df = df.copy()
+    for column in MONEY_COLUMNS:
+        if column in df.columns:
+            df[column] = (df[column] * 100).round().astype("Int64")
+    return df
+
+
+def memory_usage_report(df: pd.DataFrame) -> dict:
+    """Отчёт о потреблении памяти DataFrame: тип и размер каждого столбца в байтах и общий размер"""
+    usage = df.memory_usage(deep=True, index=True)
+    columns = {column: {"dtype": str(df[column].dtype), "bytes": int(usage[column])} for column in df.columns}
+    return {"columns": columns, "total_bytes": int(usage.sum())}
+
+
+def _prepare_operations(df: pd.DataFrame) -> pd.DataFrame:
+    """Проверяет наличие обязательных столбцов, преобразует даты в формат datetime
+    и приводит остальные столбцы к компактной схеме"""
+    if not REQUIRED_COLUMNS.issubset(df.columns):
+        missing_columns = REQUIRED_COLUMNS - set(df.columns)
+        raise ValueError(f"Отсутствуют обязательные столбцы: {', '.join(missing_columns)}")
+
+    df["Дата операции"] = pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S", errors="coerce")
+    df["Дата платежа"] = pd.to_datetime(df["Дата платежа"], format="%d.%m.%Y", errors="coerce")
+    return apply_operations_schema(df)
+
+
+@instrument()
+def read_operations(
+    path: Optional[Path] = None, use_cache: bool = True, money_as_kopecks: bool = False, raise_errors: bool = False
+) -> pd.DataFrame:
+    """Функция для чтения списка операций из XLSX-файла с основными проверками.
+    По умолчанию читается файл из переменной DATA_PATH.
+    Столбцы приводятся к компактной схеме OPERATIONS_SCHEMA, а при money_as_kopecks=True
+    денежные суммы возвращаются в целых копейках. Суммы остаются в исходных валютах:
+    пересчёт в валюту отчётов — отдельный шаг in_reporting_currency.
+    Результат кэшируется в Parquet-файле рядом с исходным, поэтому XLSX разбирается
+    только при первом чтении или после его изменения.
+    При ошибке чтения возвращается пустой DataFrame, а при raise_errors=True ошибка пробрасывается"""
+    path = path or xlsx_path
+    if use_cache:
+        cached = _load_cached_operations(path)
+        if cached is not None:
+            return to_kopecks(cached) if money_as_kopecks else cached
+
+    try:
+        # Попытка прочитать Excel-файл
+        df = pd.read_excel(path, parse_dates=False)
+        logger.info("Файл %s успешно прочитан", path)
+
+        # Проверяем наличие необходимых столбцов и преобразуем даты в datetime
+        df = _prepare_operations(df)
         logger.info("Даты успешно преобразованы в формат datetime")
 
     except ValueError as ve:
         # Логгируем ошибку отсутствия столбцов
-        logger.error(f"Ошибка структуры файла {xlsx_path}: {str(ve)}")
+        logger.error("Ошибка структуры файла %s: %s", path, ve)
+        if raise_errors:
+            raise
         return pd.DataFrame()  # Возвращаем пустой DataFrame при ошибке структуры
 
     except Exception as e:
         # Логгируем любую ошибку, которая произошла
-        logger.error(f"Ошибка при обработке файла {xlsx_path}: {str(e)}")
+        logger.error("Ошибка при обработке файла %s: %s", path, e)
+        if raise_errors:
+            raise
         return pd.DataFrame()  # Возвращаем пустой DataFrame при любой ошибке
 
-    return df
+    if use_cache:
+        _save_cached_operations(path, df)
+
+    return to_kopecks(df) if money_as_kopecks else df
+
+
+def sort_operations(df: pd.DataFrame) -> pd.DataFrame:
+    """Сортирует операции по дате операции (строки без даты оказываются в конце)"""
+    if df.empty or "Дата операции" not in df.columns or df["Дата операции"].is_monotonic_increasing:
+        return df
+    # Уже отсортированные операции со строками без даты в конце не копируются
+    dates = df["Дата операции"]
+    dated = int(dates.notna().sum())
+    if dates.iloc[:dated].is_monotonic_increasing and dates.iloc[dated:].isna().all():
+        return df
+    return df.sort_values("Дата операции", kind="stable", na_position="last", ignore_index=True)
+
+
+def _as_datetime64(value: Any) -> np.datetime64:
+    return pd.Timestamp(value).to_datetime64()
+
+
+class OperationsIndex:
+    """Индекс по отсортированным по дате операциям.
+    Выборка по диапазону дат выполняется двоичным поиском за O(log N + k),
+    а для выборки по категории хранятся отсортированные позиции и даты строк каждой категории,
+    поэтому выборка по категории и датам тоже стоит O(log N + k)"""
+
+    def __init__(self, operations: pd.DataFrame, category_positions: Optional[Dict[Any, np.ndarray]] = None) -> None:
+        dates = operations["Дата операции"]
+        # Строки без даты лежат в конце и в поиск не попадают
+        self._dates = dates.to_numpy()[: int(dates.notna().sum())]
+        if category_positions is None:
+            category_positions = {
+                category: np.asarray(positions)
+                for category, positions in operations.groupby("Категория", observed=True, sort=False).indices.items()
+            }
+        self._category_positions = category_positions
+        # Позиции строк категории с датой (срез, без копии) и их даты: запросы выполняют только двоичный поиск
+        self._category_dates: Dict[Any, Tuple[np.ndarray, np.ndarray]] = {}
+        for category, positions in category_positions.items():
+            dated = positions[: int(np.searchsorted(positions, len(self._dates)))]
+            self._category_dates[category] = (dated, self._dates[dated])
+
+    @property
+    def category_positions(self) -> Dict[Any, np.ndarray]:
+        """Отсортированные позиции строк каждой категории"""
+        return self._category_positions
+
+    def date_range(self, start: Any, end: Any) -> slice:
+        """Позиции строк с датой операции в интервале [start, end]"""
+        lo = int(np.searchsorted(self._dates, _as_datetime64(start), side="left"))
+        hi = int(np.searchsorted(self._dates, _as_datetime64(end), side="right"))
+        return slice(lo, max(lo, hi))
+
+    def date_ranges(self, starts: Any, ends: Any) -> tuple:
+        """Границы [lo, hi) сразу для многих интервалов [start, end] одним векторным поиском"""
+        starts = pd.DatetimeIndex(starts).to_numpy()
+        ends = pd.DatetimeIndex(ends).to_numpy()
+        lo = np.searchsorted(self._dates, starts, side="left")
+        hi = np.maximum(lo, np.searchsorted(self._dates, ends, side="right"))
+        return lo, hi
+
+    def category_range(self, category: Any, start: Any, end: Any) -> np.ndarray:
+        """Позиции строк заданной категории с датой операции в интервале [start, end]"""
+        found = self._category_dates.get(category)
+        if found is None:
+            return np.array([], dtype=np.intp)
+        # Позиции возрастают, значит и даты по ним отсортированы
+        positions, category_dates = found
+        lo = np.searchsorted(category_dates, _as_datetime64(start), side="left")
+        hi = np.searchsorted(category_dates, _as_datetime64(end), side="right")
+        return positions[lo:hi]
+
+
+_snapshot_uids = itertools.count(1)
+
+
+class OperationsSnapshot:
+    """Неизменяемый снимок загруженных операций, отсортированных по дате операции,
+    с индексом дат и кубом агрегатов по месяцам, категориям и картам.
+    Свойство operations каждый раз возвращает поверхностную копию, поэтому добавление
+    или замена столбцов у полученного DataFrame не затрагивает сам снимок.
+    Куб и позиции строк категорий можно передать готовыми, если они посчитаны для тех же
+    отсортированных операций (например, опубликованы загрузчиком в общую память).
+    currency — валюта, в которую пересчитаны суммы (None — исходные валюты выгрузки),
+    rates_revision — номер изменения таблицы курсов, по которой они пересчитаны"""
+
+    def __init__(
+        self,
+        operations: pd.DataFrame,
+        version: int,
+        mtime_ns: Optional[int],
+        cube: Optional[AggregateCube] = None,
+        category_positions: Optional[Dict[Any, np.ndarray]] = None,
+        currency: Optional[str] = None,
+        rates_revision: Optional[int] = None,
+    ) -> None:
+        self._operations = sort_operations(operations)
+        # Уникальный в пределах процесса номер снимка: снимок не меняется, поэтому номер однозначно задаёт данные
+        self.uid = next(_snapshot_uids)
+        self.version = version
+        self.mtime_ns = mtime_ns
+        self.loaded_at = time.time()
+        self.currency = currency
+        self.rates_revision = rates_revision
+        self.index = None if self._operations.empty else OperationsIndex(self._operations, category_positions)
+        self.cube = cube if cube is not None else AggregateCube(self._operations)
+        self._converted: Dict[Tuple[str, int], OperationsSnapshot] = {}
+
+    def with_rows(self, rows: pd.DataFrame) -> "OperationsSnapshot":
+        """Новый снимок с добавленными операциями; куб агрегатов дополняется только новыми строками"""
+        # Категории старых и новых строк различаются, поэтому схему после объединения применяем заново
+        operations = apply_operations_schema(pd.concat([self._operations, rows], ignore_index=True))
+        return OperationsSnapshot(operations, self.version + 1, self.mtime_ns, self.cube.copy().update(rows))
+
+    def in_currency(self, currency: str, table: Optional[RateTable] = None) -> "OperationsSnapshot":
+        """Снимок с суммами, пересчитанными в currency по курсу на дату операции.
+        Пересчитанный снимок запоминается: пока таблица курсов не меняется, повторные вызовы возвращают его.
+        Если пересчитывать нечего (все суммы уже в currency), возвращается сам снимок"""
+        table = table if table is not None else get_rate_table()
+        converted = self._converted.get((currency, id(table)))
+        if converted is not None and converted.rates_revision == table.revision:
+            return converted
+        operations = normalize_currency(self._operations, currency, table)
+        if operations is self._operations:
+            return self
+        # Номер изменения берётся после пересчёта: он мог догрузить курсы
+        converted = OperationsSnapshot(
+            operations, self.version, self.mtime_ns, currency=currency, rates_revision=table.revision
+        )
+        self._converted[(currency, id(table))] = converted
+        return converted
+
+    @property
+    def operations(self) -> pd.DataFrame:
+        return self._operations.copy(deep=False)
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def select(self, start: Any, end: Any, category: Optional[str] = None) -> pd.DataFrame:
+        """Операции с датой в интервале [start, end], при необходимости только заданной категории"""
+        if self.index is None:
+            return self._operations.iloc[0:0]
+        if category is None:
+            return self._operations.iloc[self.index.date_range(start, end)]
+        return self._operations.iloc[self.index.category_range(category, start, end)]
+
+
+class OperationsStore:
+    """Хранилище операций в памяти процесса.
+    Загружает файл один раз и отдаёт снимки. Не чаще чем раз в check_interval секунд сверяет
+    время изменения файла и, если файл изменился, загружает новый снимок в фоновом потоке.
+    Пока новый снимок загружается, читатели получают старый; замена снимка атомарна.
+    Если файл не читается (например, ещё дописывается), старый снимок остаётся до успешного чтения"""
+
+    def __init__(self, path: Optional[Path] = None, check_interval: float = 1.0) -> None:
+        self._path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[OperationsSnapshot] = None
+        self._lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._last_check = 0.0
+
+    @property
+    def path(self) -> Path:
+        return self._path or xlsx_path
+
+    def _mtime_ns(self) -> Optional[int]:
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> OperationsSnapshot:
+        """Загружает операции и собирает из них новый снимок. Ошибка чтения пробрасывается"""
+        mtime_ns = self._mtime_ns()
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        snapshot = OperationsSnapshot(read_operations(self.path, raise_errors=True), version, mtime_ns)
+        logger.info("Загружен снимок операций версии %s: %s строк", version, len(snapshot))
+        return snapshot
+
+    def snapshot(self) -> OperationsSnapshot:
+        """Возвращает текущий снимок. Первый вызов загружает данные синхронно"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                return self._current()
+
+        self._check_for_changes(snapshot)
+        return snapshot
+
+    def _current(self) -> OperationsSnapshot:
+        """Текущий снимок; при первом обращении загружает его. Вызывается под self._lock"""
+        if self._snapshot is None:
+            try:
+                self._snapshot = self._load()
+            except Exception as e:
+                logger.error("Ошибка при загрузке операций: %s", e)
+                # Пустой снимок без времени изменения: файл перечитается при следующей проверке
+                self._snapshot = OperationsSnapshot(pd.DataFrame(), 1, None)
+        return self._snapshot
+
+    def _check_for_changes(self, snapshot: OperationsSnapshot) -> None:
+        """Запускает фоновую перезагрузку, если файл изменился с момента загрузки снимка"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return None
+        self._last_check = now
+
+        if self._mtime_ns() == snapshot.mtime_ns:
+            return None
+
+        with self._lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return None
+            self._reload_thread = threading.Thread(target=self._reload_in_background, daemon=True)
+            self._reload_thread.start()
+        return None
+
+    def _reload_in_background(self) -> None:
+        previous = self._snapshot
+        try:
+            snapshot = self._load()
+            # Снимок подменяется под блокировкой, чтобы не разойтись с одновременным append
+            with self._lock:
+                self._snapshot = snapshot
+        except Exception as e:
+            version = previous.version if previous else None
+            logger.error("Ошибка при перезагрузке операций, остаётся снимок версии %s: %s", version, e)
+
+    def reload(self) -> OperationsSnapshot:
+        """Синхронно перечитывает файл и подменяет снимок. При ошибке чтения снимок не меняется"""
+        with self._lock:
+            self._snapshot = self._load()
+            return self._snapshot
+
+    def append(self, rows: pd.DataFrame) -> OperationsSnapshot:
+        """Добавляет новые операции к текущему снимку без перечитывания файла.
+        Снимок читается и подменяется под одной блокировкой, поэтому одновременные добавления не теряют строк"""
+        with self._lock:
+            self._snapshot = self._current().with_rows(rows)
+            return self._snapshot
+
+
+_operations_store: Optional[OperationsStore] = None
+_operations_store_lock = threading.Lock()
+
+
+def get_operations_store() -> OperationsStore:
+    """Возвращает общее для процесса хранилище операций (создаётся при первом обращении).
+    Если задана переменная SHARED_OPERATIONS_DIR, хранилище подключается к операциям,
+    опубликованным загрузчиком в общую память, а не читает файл само"""
+    global _operations_store
+    with _operations_store_lock:
+        if _operations_store is None:
+            shared_dir = get_config().shared_operations_dir
+            if shared_dir:
+                from moneyscope.shared import SharedOperationsStore
+
+                _operations_store = SharedOperationsStore(shared_dir)
+            else:
+                _operations_store = OperationsStore()
+        return _operations_store
+
+
+def in_reporting_currency(source: Any, currency: Optional[str] = None) -> Any:
+    """Операции для отчётов в валюте currency (по умолчанию из переменной REPORTING_CURRENCY).
+    Хранилище отдаёт свой текущий снимок; снимок и DataFrame пересчитываются, прочие данные
+    (итераторы порций, списки) и данные без валюты отчётов возвращаются как есть.
+    Файл, кэш и хранилище операций держат исходные суммы: пересчёт включается только этим шагом"""
+    currency = currency or get_config().reporting_currency
+    if isinstance(source, OperationsStore):
+        source = source.snapshot()
+    if not currency:
+        return source
+    if isinstance(source, OperationsSnapshot):
+        return source.in_currency(currency)
+    if isinstance(source, pd.DataFrame):
+        return normalize_currency(source, currency)
+    return source
+
+
+def resolve_operations(source: Any) -> Any:
+    """Если передано хранилище или снимок, возвращает DataFrame текущего снимка.
+    Остальные значения (DataFrame, список словарей, итератор порций) возвращаются без изменений"""
+    if isinstance(source, OperationsStore):
+        source = source.snapshot()
+    if isinstance(source, OperationsSnapshot):
+        return source.operations
+    return source
+
+
+@instrument()
+def select_operations(source: Any, start: Any, end: Any, category: Optional[str] = None) -> pd.DataFrame:
+    """Выбирает операции с датой в интервале [start, end] и, если задано, заданной категории.
+    Для хранилища и снимка используется индекс, для отсортированного по дате DataFrame —
+    двоичный поиск, для остальных DataFrame — булева маска"""
+    if isinstance(source, OperationsStore):
+        source = source.snapshot()
+    if isinstance(source, OperationsSnapshot):
+        return source.select(start, end, category)
+
+    dates = source["Дата операции"]
+    if dates.is_monotonic_increasing:
+        values = dates.to_numpy()
+        lo = np.searchsorted(values, _as_datetime64(start), side="left")
+        hi = np.searchsorted(values, _as_datetime64(end), side="right")
+        selected: pd.DataFrame = source.iloc[lo:hi]
+    else:
+        selected = source[(dates >= start) & (dates <= end)]
+
+    if category is not None:
+        selected = selected[selected["Категория"] == category]
+    return selected
+
+
+@instrument()
+def card_data_for_period(source: Any, start: Any, end: Any, selected: Optional[pd.DataFrame] = None) -> list:
+    """Сводные данные по картам за интервал [start, end].
+    Если передан снимок (или хранилище) и интервал состоит из целых месяцев, ответ берётся
+    из куба агрегатов; иначе агрегируются строки интервала через aggregate_card_data.
+    Уже выбранные строки интервала можно передать в selected, чтобы не выбирать их повторно"""
+    if isinstance(source, OperationsStore):
+        source = source.snapshot()
+    if isinstance(source, OperationsSnapshot):
+        months = whole_months(start, end)
+        if months is not None:
+            return source.cube.card_totals(months)
+    return aggregate_card_data(select_operations(source, start, end) if selected is None else selected)
+
+
+def _chunk_from_rows(rows: list, columns: list) -> pd.DataFrame:
+    """Собирает порцию строк XLSX в DataFrame, приводит числовые столбцы и даты"""
+    chunk = pd.DataFrame(rows, columns=columns)
+    for column in NUMERIC_COLUMNS:
+        if column in chunk.columns:
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+    return _prepare_operations(chunk)
+
+
+def iter_operations(chunk_size: int = 10_000, path: Optional[Path] = None) -> Iterator[pd.DataFrame]:
+    """Потоковое чтение операций из XLSX-файла порциями по chunk_size строк.
+    Файл открывается в режиме read-only, поэтому в памяти одновременно находится
+    только одна порция. Каждая порция проверяется и приводится так же, как в read_operations.
+    При ошибке структуры файла итерация прекращается с записью в лог"""
+    if chunk_size <= 0:
+        raise ValueError("Размер порции должен быть положительным")
+
+    path = path or xlsx_path
+
+    try:
+        import openpyxl
 
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        logger.error("Ошибка при открытии файла %s: %s", path, e)
+        return
 
-def get_top_transactions(transactions: pd.DataFrame, number: int = 5) -> list:
-    """Функция возвращает топ-5 транзакций по модулю суммы платежа"""
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            logger.warning("Файл %s пуст", path)
+            return
+
+        columns = [str(column) for column in header]
+        missing_columns = REQUIRED_COLUMNS - set(columns)
+        if missing_columns:
+            logger.error("Ошибка структуры файла %s: отсутствуют столбцы %s", path, ", ".join(missing_columns))
+            return
+
+        batch = []
+        for row in rows:
+            # Пропускаем полностью пустые строки в конце листа
+            if all(value is None for value in row):
+                continue
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield _chunk_from_rows(batch, columns)
+                batch = []
+
+        if batch:
+            yield _chunk_from_rows(batch, columns)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(data: Union[pd.DataFrame, Iterable[pd.DataFrame]]) -> Iterator[pd.DataFrame]:
+    """Позволяет одинаково обрабатывать целый DataFrame и итератор порций из iter_operations"""
+    if isinstance(data, pd.DataFrame):
+        yield data
+    else:
+        yield from data
+
+
+def aggregate_card_data_windows(operations: pd.DataFrame, lo: np.ndarray, hi: np.ndarray) -> list:
+    """Сводные данные по картам (как в aggregate_card_data) сразу для многих окон строк [lo, hi)
+    отсортированного по дате DataFrame. Суммы по каждой карте накапливаются одним проходом,
+    а сумма окна вычисляется разностью накопленных сумм и, как в aggregate_card_data, округляется до копеек.
+    Возвращает список результатов по окнам"""
+    card = operations["Номер карты"]
+    amount = operations["Сумма операции"].to_numpy(dtype="float64", na_value=np.nan)
+    cashback = np.nan_to_num(operations["Кэшбэк"].to_numpy(dtype="float64", na_value=np.nan))
+    is_spending = card.notna().to_numpy() & (amount < 0)
+
+    codes, cards = pd.factorize(card.astype("object").str[-4:].where(is_spending), sort=True)
+
+    totals = []
+    for code in range(len(cards)):
+        mask = codes == code
+        # Накопленные суммы с ведущим нулём: сумма по окну [lo, hi) = cum[hi] - cum[lo]
+        spent = np.concatenate([[0.0], np.cumsum(np.where(mask, -amount, 0.0))])
+        card_cashback = np.concatenate([[0.0], np.cumsum(np.where(mask, cashback, 0.0))])
+        count = np.concatenate([[0], np.cumsum(mask)])
+        totals.append(
+            (
+                cards[code],
+                (spent[hi] - spent[lo]).round(2),
+                (card_cashback[hi] - card_cashback[lo]).round(2),
+                count[hi] - count[lo],
+            )
+        )
+
+    result = []
+    for window in range(len(lo)):
+        result.append(
+            [
+                {
+                    "last_digits": last_digits,
+                    "total_spent": float(spent[window]),
+                    "cashback": float(card_cashback[window]),
+                }
+                for last_digits, spent, card_cashback, count in totals
+                if count[window] > 0
+            ]
+        )
+    return result
+
+
+def _top_sort_keys(transactions: pd.DataFrame) -> tuple:
+    """Ключи упорядочивания для топа: модуль суммы платежа (NaN — в конец) и дата операции.
+    При равных суммах выше оказывается более поздняя операция"""
+    abs_amount = np.abs(transactions["Сумма платежа"].to_numpy(dtype="float64", na_value=np.nan))
+    abs_amount = np.nan_to_num(abs_amount, nan=-1.0)
+    dates = transactions["Дата операции"].to_numpy(dtype="datetime64[ns]").view("int64")
+    return abs_amount, dates
+
+
+def _transaction_records(top_transactions: pd.DataFrame) -> list:
+    """Формирует список словарей топа с векторным форматированием дат"""
+    dates = top_transactions["Дата операции"].dt.strftime("%d.%m.%Y").tolist()
+    return [
+        {"date": date, "amount": amount, "category": category, "description": description}
+        for date, amount, category, description in zip(
+            dates,
+            top_transactions["Сумма платежа"].tolist(),
+            top_transactions["Категория"].tolist(),
+            top_transactions["Описание"].tolist(),
+        )
+    ]
+
+
+@instrument()
+def get_top_transactions(
+    transactions: pd.DataFrame, number: int = 5, group_by: Optional[str] = None
+) -> Union[list, dict]:
+    """Функция возвращает топ-5 транзакций по модулю суммы платежа.
+    Топ выбирается частичной сортировкой (argpartition) без копирования DataFrame.
+    Если задан group_by (например, "Категория" или "Номер карты"), за один проход
+    возвращается словарь с топом транзакций для каждого значения этого столбца"""
 
     # Проверяем, что DataFrame не пуст
-    if transactions.empty:
-        return []
+    if transactions.empty or number <= 0:
+        return {} if group_by else []
 
-    # Создаём копию объекта DataFrame
-    transactions = transactions.copy()
+    abs_amount, dates = _top_sort_keys(transactions)
 
-    # Преобразуем столбец 'Сумма платежа' в абсолютные значения
-    transactions.loc[:, "abs_amount"] = transactions["Сумма платежа"].abs()
+    if group_by:
+        return _top_transactions_by_group(transactions, number, group_by, abs_amount, dates)
 
-    # Сортируем по абсолютной сумме и выбираем топ-5 транзакций
-    top_transactions = transactions.sort_values(by="abs_amount", ascending=False).head(number)
+    # Частичный отбор: все строки с модулем суммы не меньше n-го по величине (с учётом равных)
+    if number < len(transactions):
+        threshold = np.partition(abs_amount, len(abs_amount) - number)[len(abs_amount) - number]
+        candidates = np.flatnonzero(abs_amount >= threshold)
+    else:
+        candidates = np.arange(len(transactions))
 
-    # Формируем список словарей с необходимыми данными
-    result = top_transactions.apply(
-        lambda row: {
-            "date": row["Дата операции"].strftime("%d.%m.%Y"),
-            "amount": row["Сумма платежа"],
-            "category": row["Категория"],
-            "description": row["Описание"],
-        },
-        axis=1,
-    ).tolist()
+    # Сортируем только кандидатов: по модулю суммы, затем по дате, затем по исходному порядку
+    order = np.lexsort((candidates, -dates[candidates], -abs_amount[candidates]))
+    positions = candidates[order][:number]
 
+    return _transaction_records(transactions.iloc[positions])
+
+
+def _top_transactions_by_group(
+    transactions: pd.DataFrame, number: int, group_by: str, abs_amount: np.ndarray, dates: np.ndarray
+) -> dict:
+    """Топ транзакций внутри каждой группы за одну сортировку всех строк"""
+    codes, groups = pd.factorize(transactions[group_by], sort=True)
+    positions = np.arange(len(transactions))
+
+    # Одна сортировка: по группе, затем по модулю суммы, дате и исходному порядку
+    order = np.lexsort((positions, -dates, -abs_amount, codes))
+    sorted_codes = codes[order]
+
+    # Номер строки внутри своей группы; строки без значения группы (код -1) отбрасываем
+    group_starts = np.searchsorted(sorted_codes, sorted_codes, side="left")
+    rank = np.arange(len(order)) - group_starts
+    selected = order[(rank < number) & (sorted_codes >= 0)]
+
+    records = _transaction_records(transactions.iloc[selected])
+    group_names = groups.tolist()
+    result: Dict[Any, list] = {group: [] for group in group_names}
+    for code, record in zip(codes[selected].tolist(), records):
+        result[group_names[code]].append(record)
     return result
 
 
+# Последние прочитанные настройки: путь, (время изменения, размер) файла и сам словарь
+_user_settings_cache: Optional[Tuple[Path, Tuple[int, int], Dict]] = None
+_user_settings_lock = threading.Lock()
+
+
+def _settings_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    """Время изменения и размер файла настроек или None, если их не удалось получить"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
 def load_user_settings() -> Dict:
-    """Читает настройки из JSON файла и возвращает словарь"""
+    """Читает настройки из JSON файла и возвращает словарь.
+    Прочитанные настройки кэшируются, пока не изменится время изменения или размер файла"""
+    global _user_settings_cache
+    path = user_settings_path
+    stamp = _settings_stamp(path)
+    with _user_settings_lock:
+        cached = _user_settings_cache
+    if stamp is not None and cached is not None and cached[0] == path and cached[1] == stamp:
+        return copy.deepcopy(cached[2])
+
     try:
-        with open(user_settings_path, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             settings = json.load(f)
         if isinstance(settings, dict):
             logger.info("Настройки успешно загружены")
+            if stamp is not None:
+                with _user_settings_lock:
+                    _user_settings_cache = (path, stamp, copy.deepcopy(settings))
             return settings
         else:
             logger.error("Загруженные данные не являются словарем")
             return {}
     except Exception as e:
-        logger.error(f"Ошибка при загрузке пользовательских настроек: {str(e)}")
+        logger.error("Ошибка при загрузке пользовательских настроек: %s", e)
         return {}
 
 
+@instrument()
 def get_currency_rates() -> list:
-    """Получает курсы валют по отношению к рублю через API financialmodelingprep.com"""
+    """Получает курсы валют по отношению к рублю через API financialmodelingprep.com.
+    Курсы берутся из общего кэша котировок, промахи запрашиваются одним мультисимвольным запросом"""
     # Загружаем список валют из настроек
     currencies = load_user_settings().get("user_currencies")
     if not currencies:
         return []
 
-    rates = []
-
-    # Шаг 2: Запрашиваем курсы валют для каждой пары
-    for currency in currencies:
-        pair = currency + "RUB"
-        url = f"{fmp_api_url}{pair}?apikey={fmp_api_key}"
-
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-
-            if data:
-                rate = {"currency": currency, "rate": data[0]["price"]}  # Берём цену из ответа
-                rates.append(rate)
-        except requests.RequestException:
-            continue
-
-    return rates
+    prices = get_quote_cache().get([currency + "RUB" for currency in currencies])
+    return [
+        {"currency": currency, "rate": prices[currency + "RUB"]}
+        for currency in currencies
+        if currency + "RUB" in prices
+    ]
 
 
+@instrument()
 def get_stock_prices() -> list:
-    """Получает стоимость акций через API financialmodelingprep.com"""
+    """Получает стоимость акций через API financialmodelingprep.com.
+    Цены берутся из общего кэша котировок, промахи запрашиваются одним мультисимвольным запросом"""
     # Загружаем список символов акций из настроек
     stock_symbols = load_user_settings().get("user_stocks")
     if not stock_symbols:
         return []
 
-    prices = []
-
-    # Шаг 2: Запрашиваем курсы валют для каждой пары
-    for stock in stock_symbols:
-        url = f"{fmp_api_url}{stock}?apikey={fmp_api_key}"
-
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-
-            if data:
-                price = {"stock": stock, "price": data[0]["price"]}  # Берём цену из ответа
-                prices.append(price)
-        except requests.RequestException:
-            continue
-
-    return prices
+    prices = get_quote_cache().get(stock_symbols)
+    return [{"stock": stock, "price": prices[stock]} for stock in stock_symbols if stock in prices]
 
 
 def get_greeting() -> str:
@@ -175,28 +850,34 @@ def get_greeting() -> str:
     return greeting
 
 
-def aggregate_card_data(df: pd.DataFrame) -> list:
+@instrument()
+def aggregate_card_data(df: Union[pd.DataFrame, Iterable[pd.DataFrame]]) -> list:
     """Получаем агрегированные (сводные) данные по картам:
-    последние 4 цифры карты; общая сумма расходов; кешбэк."""
-
-    # Убираем строки без номера карты
-    df = df.dropna(subset=["Номер карты"]).copy()
+    последние 4 цифры карты; общая сумма расходов; кешбэк (суммы округляются до копеек).
+    Принимает DataFrame или итератор порций из iter_operations"""
+
+    partials = []
+    for chunk in iter_chunks(df):
+        # Убираем строки без номера карты и оставляем только расходы (минусовые операции)
+        chunk = chunk.dropna(subset=["Номер карты"])
+        chunk = chunk[chunk["Сумма операции"] < 0]
+        if chunk.empty:
+            continue
 
-    # Создаем новый столбец с последними 4 цифрами карты
-    df.loc[:, "last_digits"] = df["Номер карты"].str[-4:]
+        # Группируем порцию по последним 4 цифрам карты
+        last_digits = chunk["Номер карты"].str[-4:].rename("last_digits")
+        partials.append(chunk.groupby(last_digits)[["Сумма операции", "Кэшбэк"]].sum())
 
-    # Оставляем только расходы (минусовые операции)
-    df = df[df["Сумма операции"] < 0]
+    if not partials:
+        return []
 
-    # Группируем по последним 4 цифрам карты и агрегируем данные
-    grouped_df = (
-        df.groupby("last_digits")
-        .agg(
-            total_spent=pd.NamedAgg(column="Сумма операции", aggfunc=lambda x: -x.sum()),
-            cashback=pd.NamedAgg(column="Кэшбэк", aggfunc="sum"),
-        )
-        .reset_index()
-    )
+    # Складываем частичные суммы всех порций
+    totals = pd.concat(partials).groupby(level=0).sum()
+    # Суммы округляются до копеек, как и в aggregate_card_data_windows и в кубе
+    grouped_df = pd.DataFrame(
+        {"total_spent": (-totals["Сумма операции"]).round(2), "cashback": totals["Кэшбэк"].round(2)},
+        index=totals.index,
+    ).reset_index()
 
     # Преобразуем результат в список словарей
     result = grouped_df.to_dict(orient="records")
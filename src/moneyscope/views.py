@@ -1,54 +1,227 @@
+from __future__ import annotations
+
+import functools
 import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Union
 
-from moneyscope.logger_config import logger
+from moneyscope.lazy import lazy_import
+from moneyscope.logger_config import log_payload, logger
 from moneyscope.utils import (
-    aggregate_card_data,
+    OperationsSnapshot,
+    OperationsStore,
+    aggregate_card_data_windows,
+    card_data_for_period,
     get_currency_rates,
     get_greeting,
     get_stock_prices,
     get_top_transactions,
+    in_reporting_currency,
     read_operations,
+    resolve_operations,
+    select_operations,
 )
 
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+# Бюджет времени на сборку Главной страницы в HTTP-сервисе, в секундах
+MAIN_PAGE_DEADLINE = 0.3
+
+# Разделы Главной страницы по операциям считаются параллельно в общем пуле потоков
+_section_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="main_page")
+
+# Курсы и цены акций ждут сеть, поэтому запрашиваются в отдельном пуле и не занимают потоки расчётов
+_quote_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="main_page_quotes")
+
+# Последние полученные курсы валют и цены акций: отдаются, если свежие не успели к сроку
+_last_sections: Dict[str, Any] = {}
+_last_sections_lock = threading.Lock()
+SHARED_SECTIONS = ("currency_rates", "stock_prices")
+
+
+def _remember_section(name: str, future: Future) -> None:
+    """Запоминает результат сетевого раздела, даже если он пришёл после срока"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    with _last_sections_lock:
+        _last_sections[name] = future.result()
+
 
-def get_main_page(time_str: str) -> str:
+def _collect_sections(sections: Dict[str, Callable[[], Any]], deadline: Optional[float]) -> tuple:
+    """Запускает разделы параллельно и ждёт их не дольше deadline секунд.
+    Возвращает значения разделов и список разделов, не успевших к сроку:
+    вместо них подставляются последние известные данные (для курсов и акций) или пустой список"""
+    futures = {
+        name: (_quote_executor if name in SHARED_SECTIONS else _section_executor).submit(section)
+        for name, section in sections.items()
+    }
+    for name in SHARED_SECTIONS:
+        if name in futures:
+            futures[name].add_done_callback(functools.partial(_remember_section, name))
+
+    wait(futures.values(), timeout=deadline)
+
+    values = {}
+    late = []
+    for name, future in futures.items():
+        if future.done():
+            values[name] = future.result()
+            continue
+        late.append(name)
+        with _last_sections_lock:
+            values[name] = _last_sections.get(name, [])
+    return values, late
+
+
+def get_main_page(
+    time_str: str,
+    operations: Optional[Union[pd.DataFrame, OperationsStore, OperationsSnapshot]] = None,
+    deadline: Optional[float] = None,
+) -> str:
     """Функция для подготовки данных для Главной страницы.
     Принимает на вход строку с датой и временем в формате YYYY-MM-DD HH:MM:SS
+    и, необязательно, операции: DataFrame, хранилище операций или его снимок.
+    Если операции не переданы, они читаются из файла и пересчитываются в валюту отчётов (REPORTING_CURRENCY).
+    Разделы страницы собираются параллельно; если задан deadline, то за время не больше deadline секунд
+    после загрузки операций (по умолчанию без ограничения, HTTP-сервис передаёт MAIN_PAGE_DEADLINE).
+    Разделы, не успевшие к сроку, заполняются последними известными данными
+    и перечисляются в ключе "partial_sections".
     Возвращает JSON-ответ с необходимыми данными"""
-    operations = read_operations()
+    if operations is None:
+        loaded: pd.DataFrame = in_reporting_currency(read_operations())
+        operations = loaded
+    elif isinstance(operations, OperationsStore):
+        operations = operations.snapshot()
+
+    # Загрузка операций в бюджет времени не входит
+    started = time.perf_counter()
     try:
-        logger.info(f"Операции после чтения: {operations.head()}")  # Логируем первые строки для проверки
+        # Логируем первые строки для проверки
+        # Сами операции пишутся только в выборочный отладочный канал, в основной лог — их число
+        logger.info("Операции после чтения: %s строк", len(operations))
+        log_payload("Операции после чтения", resolve_operations(operations))
         date_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
         start_of_month = datetime(date_time.year, date_time.month, 1)
 
-        if operations.empty:
+        if len(operations) == 0:
             logger.warning("DataFrame пустой. Операции не найдены.")
             return json.dumps({"error": "Нет операций для обработки"}, ensure_ascii=False, indent=4)
 
-        operations_for_period = operations[
-            (operations["Дата операции"] >= start_of_month) & (operations["Дата операции"] <= date_time)
-        ]
+        # У снимка выборка идёт по индексу дат, у DataFrame — двоичным поиском или маской
+        operations_for_period = select_operations(operations, start_of_month, date_time)
 
-        logger.info(f"Операции за указанный период: {operations_for_period}")  # Логируем после фильтрации
+        logger.info("Операции за указанный период: %s строк", len(operations_for_period))  # Логируем после фильтрации
+        log_payload("Операции за указанный период", operations_for_period)
 
         if operations_for_period.empty:
             logger.warning("Операции за указанный период не найдены.")
             return json.dumps({"error": "Нет операций за указанный период"}, ensure_ascii=False, indent=4)
 
-        result = {
-            "greeting": get_greeting(),
-            "cards": aggregate_card_data(operations_for_period),
-            "top_transactions": get_top_transactions(operations_for_period),
-            "currency_rates": get_currency_rates(),
-            "stock_prices": get_stock_prices(),
-        }
+        snapshot = operations
+        sections, late = _collect_sections(
+            {
+                "cards": lambda: card_data_for_period(snapshot, start_of_month, date_time, operations_for_period),
+                "top_transactions": lambda: get_top_transactions(operations_for_period),
+                "currency_rates": get_currency_rates,
+                "stock_prices": get_stock_prices,
+            },
+            None if deadline is None else max(0.0, deadline - (time.perf_counter() - started)),
+        )
+
+        result = {"greeting": get_greeting(), **sections}
+        if late:
+            logger.warning("Разделы %s не успели к сроку, отданы последние известные данные", ", ".join(late))
+            result["partial_sections"] = late
 
         logger.info("Данные для главной страницы успешно сформированы")
         return json.dumps(result, ensure_ascii=False, indent=4)
 
     except Exception as e:
-        logger.error(f"Ошибка в функции get_main_page: {str(e)}")
+        logger.error("Ошибка в функции get_main_page: %s", e)
         return json.dumps(
             {"error": "Не удалось сформировать данные для главной страницы"}, ensure_ascii=False, indent=4
         )
+
+
+def get_main_pages(
+    time_strs: Iterable[str], operations: Optional[Union[pd.DataFrame, OperationsStore, OperationsSnapshot]] = None
+) -> Dict[str, str]:
+    """Пакетная подготовка данных Главной страницы для многих дат.
+    Операции загружаются один раз, границы всех периодов «с начала месяца до даты» находятся
+    одним векторным поиском по отсортированным датам, а сводка по картам считается одним проходом
+    по накопленным суммам. Курсы валют и цены акций запрашиваются один раз для всех дат.
+    Возвращает словарь: строка даты -> JSON-ответ, такой же, как у get_main_page"""
+    time_strs = list(time_strs)
+    error_json = json.dumps(
+        {"error": "Не удалось сформировать данные для главной страницы"}, ensure_ascii=False, indent=4
+    )
+
+    if operations is None:
+        operations = in_reporting_currency(read_operations())
+
+    try:
+        # Снимок сортирует операции и строит индекс дат один раз на весь пакет
+        if isinstance(operations, OperationsStore):
+            snapshot = operations.snapshot()
+        elif isinstance(operations, OperationsSnapshot):
+            snapshot = operations
+        else:
+            snapshot = OperationsSnapshot(operations, version=0, mtime_ns=None)
+
+        if len(snapshot) == 0 or snapshot.index is None:
+            logger.warning("DataFrame пустой. Операции не найдены.")
+            no_data = json.dumps({"error": "Нет операций для обработки"}, ensure_ascii=False, indent=4)
+            return {time_str: no_data for time_str in time_strs}
+
+        # Разбираем даты; некорректные сразу получают ответ с ошибкой
+        results: Dict[str, str] = {}
+        moments = {}
+        for time_str in time_strs:
+            try:
+                moments[time_str] = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+            except ValueError as e:
+                logger.error("Некорректная дата %s: %s", time_str, e)
+                results[time_str] = error_json
+
+        ordered = sorted(moments, key=moments.__getitem__)
+        ends = [moments[time_str] for time_str in ordered]
+        starts = [datetime(end.year, end.month, 1) for end in ends]
+        lo, hi = snapshot.index.date_ranges(starts, ends)
+        cards = aggregate_card_data_windows(snapshot.operations, lo, hi) if ordered else []
+
+        # Общие для всех дат данные запрашиваются один раз
+        shared = (
+            {"greeting": get_greeting(), "currency_rates": get_currency_rates(), "stock_prices": get_stock_prices()}
+            if ordered
+            else {}
+        )
+
+        operations_df = snapshot.operations
+        for position, time_str in enumerate(ordered):
+            if lo[position] == hi[position]:
+                results[time_str] = json.dumps(
+                    {"error": "Нет операций за указанный период"}, ensure_ascii=False, indent=4
+                )
+                continue
+
+            result = {
+                "greeting": shared["greeting"],
+                "cards": cards[position],
+                "top_transactions": get_top_transactions(operations_df.iloc[lo[position] : hi[position]]),
+                "currency_rates": shared["currency_rates"],
+                "stock_prices": shared["stock_prices"],
+            }
+            results[time_str] = json.dumps(result, ensure_ascii=False, indent=4)
+
+        logger.info("Данные для главной страницы сформированы для %s дат", len(ordered))
+        return {time_str: results[time_str] for time_str in time_strs}
+
+    except Exception as e:
+        logger.error("Ошибка в функции get_main_pages: %s", e)
+        return {time_str: error_json for time_str in time_strs}
@@ -1,6 +1,20 @@
+from pathlib import Path
+
 import pandas as pd
 import pytest
 
+import moneyscope.memo
+import moneyscope.quotes
+import moneyscope.utils
+
+
+# Каждый тест начинает с пустыми общими кэшами котировок, пользовательских настроек и отчётов
+@pytest.fixture(autouse=True)
+def reset_shared_caches(monkeypatch: pytest.MonkeyPatch) -> None:
+    moneyscope.memo.clear_memo()
+    monkeypatch.setattr(moneyscope.quotes, "_quote_cache", None)
+    monkeypatch.setattr(moneyscope.utils, "_user_settings_cache", None)
+
 
 # Фикстура для создания DataFrame с операциями
 @pytest.fixture
@@ -62,3 +76,15 @@ def empty_operations_data_list() -> list:
 def empty_transactions_data() -> pd.DataFrame:
     # Создаем пустой DataFrame с необходимыми столбцами
     return pd.DataFrame(columns=["Дата операции", "Категория", "Сумма операции", "Сумма платежа", "Описание"])
+
+
+# Фикстура с XLSX-файлом операций во временной папке
+@pytest.fixture
+def operations_xlsx(tmp_path: Path, operations_data: pd.DataFrame) -> Path:
+    df = operations_data.copy()
+    df["Дата операции"] = df["Дата операции"].dt.strftime("%d.%m.%Y %H:%M:%S")
+    df["Дата платежа"] = df["Дата платежа"].dt.strftime("%d.%m.%Y")
+
+    path = tmp_path / "operations.xlsx"
+    df.to_excel(path, index=False)
+    return path
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict
+
+from moneyscope.batch import load_manifest, load_progress, run_batch, run_job
+from moneyscope.synthetic import write_synthetic
+
+TIME_STR = "2021-12-31 16:44:00"
+
+
+def _user(tmp_path: Path, name: str, rows: int = 200) -> Dict[str, str]:
+    user_dir = tmp_path / name
+    write_synthetic(user_dir / "operations.xlsx", rows, seed=len(name))
+    (user_dir / "user_settings.json").write_text('{"user_currencies": [], "user_stocks": []}', encoding="utf-8")
+    return {"operations": f"{name}/operations.xlsx", "settings": f"{name}/user_settings.json", "output": f"out/{name}"}
+
+
+def test_load_manifest_csv(tmp_path: Path) -> None:
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("id,operations,settings,output\nu1,a.xlsx,a.json,out/a\n,b.xlsx,b.json,out/b\n")
+
+    jobs = load_manifest(manifest)
+
+    assert [job["id"] for job in jobs] == ["u1", str(tmp_path / "out" / "b")]
+    assert jobs[0]["operations"] == str(tmp_path / "a.xlsx")
+
+
+def test_run_batch_writes_reports_and_resumes(tmp_path: Path) -> None:
+    entries = [
+        _user(tmp_path, "anna"),
+        _user(tmp_path, "boris"),
+        {**_user(tmp_path, "vera"), "operations": "nope.xlsx"},
+    ]
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(entries), encoding="utf-8")
+
+    summary = run_batch(manifest, TIME_STR, workers=2)
+
+    assert summary["processed"] == 3 and summary["succeeded"] == 2 and summary["failed"] == 1
+    assert summary["failures"][0]["id"] == str(tmp_path / "out" / "vera")
+    for name in ("anna", "boris"):
+        output = tmp_path / "out" / name
+        assert "cards" in json.loads((output / "main_page.json").read_text(encoding="utf-8"))
+        assert json.loads((output / "cashback.json").read_text(encoding="utf-8"))
+        assert json.loads((output / "spending_by_category_cube.json").read_text(encoding="utf-8"))
+
+    # Повторный запуск пропускает выполненные задания и повторяет только неудачное
+    again = run_batch(manifest, TIME_STR, workers=2)
+    progress = load_progress(Path(str(manifest) + ".progress.jsonl"))
+
+    assert again["skipped"] == 2 and again["processed"] == 1
+    assert {Path(job_id).name: record["status"] for job_id, record in progress.items()} == {
+        "anna": "ok",
+        "boris": "ok",
+        "vera": "failed",
+    }
+
+
+def test_run_job_writes_results(tmp_path: Path) -> None:
+    entry = _user(tmp_path, "gleb")
+    job = {field: str(tmp_path / value) for field, value in entry.items()}
+    job["id"] = "gleb"
+
+    record = run_job(job, TIME_STR)
+
+    assert record["status"] == "ok" and record["rows"] == 200
+    # Рядом с выгрузкой не остаётся кэша
+    assert list((tmp_path / "gleb").glob("*.cache.parquet")) == []
+    assert "cards" in json.loads((tmp_path / "out" / "gleb" / "main_page.json").read_text(encoding="utf-8"))
+
+
+def test_run_batch_stops_hung_job(tmp_path: Path) -> None:
+    # Файл операций — канал без писателя: чтение зависает, как на недоступном сетевом диске
+    os.mkfifo(tmp_path / "hung.xlsx")
+    entries = [{**_user(tmp_path, "dina"), "operations": "hung.xlsx"}, _user(tmp_path, "egor")]
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(entries), encoding="utf-8")
+
+    started = time.perf_counter()
+    summary = run_batch(manifest, TIME_STR, workers=1, timeout=5)
+
+    assert time.perf_counter() - started < 30
+    assert summary["timed_out"] == 1 and summary["succeeded"] == 1
+    progress = load_progress(Path(str(manifest) + ".progress.jsonl"))
+    assert {Path(job_id).name: record["status"] for job_id, record in progress.items()} == {
+        "dina": "timeout",
+        "egor": "ok",
+    }
+    # Задание после зависшего выполнено новым процессом-обработчиком
+    assert (tmp_path / "out" / "egor" / "main_page.json").is_file()
+    assert not (tmp_path / "out" / "dina" / "main_page.json").exists()
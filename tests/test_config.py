@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from moneyscope.config import Config
+from moneyscope.lazy import lazy_import
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+
+def test_config_reads_environment(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("DATA_PATH", str(tmp_path / "operations.xlsx"))
+    monkeypatch.setenv("QUOTE_CACHE_TTL", "15")
+    monkeypatch.delenv("QUOTE_CACHE_PATH", raising=False)
+
+    config = Config()
+
+    assert config.data_path == tmp_path / "operations.xlsx"
+    assert config.quote_cache_ttl == 15.0
+    assert config.quote_cache_path is None
+
+
+def test_lazy_import_loads_module_on_first_use() -> None:
+    module = lazy_import("json")
+
+    assert "не загружен" in repr(module)
+    assert module.loads("[1]") == [1]
+    assert "не загружен" not in repr(module)
+
+
+def test_import_does_not_load_heavy_modules(tmp_path: Path) -> None:
+    # Импорт пакета не тянет pandas, requests и openpyxl и не создаёт папку логов
+    log_dir = tmp_path / "logs"
+    probe = (
+        "import sys, moneyscope.main; "
+        "print(','.join(m for m in ('pandas', 'numpy', 'pyarrow', 'openpyxl', 'requests') if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR), LOG_FILES_DIR=str(log_dir))
+    output = subprocess.run([sys.executable, "-c", probe], env=env, check=True, capture_output=True, text=True)
+
+    assert output.stdout.strip() == ""
+    assert not log_dir.exists()
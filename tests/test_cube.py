@@ -0,0 +1,40 @@
+import pandas as pd
+
+from moneyscope.cube import AggregateCube, whole_months
+from moneyscope.utils import aggregate_card_data
+
+DECEMBER = [pd.Period("2021-12", freq="M")]
+
+
+def test_card_totals_match_aggregate_card_data(operations_data: pd.DataFrame) -> None:
+    cube = AggregateCube(operations_data)
+
+    assert cube.card_totals(DECEMBER) == aggregate_card_data(operations_data)
+    assert cube.card_totals([pd.Period("2021-11", freq="M")]) == []
+
+
+def test_cashback_by_category(operations_data: pd.DataFrame) -> None:
+    cube = AggregateCube(operations_data)
+
+    assert cube.cashback_by_category(DECEMBER).to_dict() == {"Ж/д билеты": 140.0}
+    assert cube.cashback_count(DECEMBER) == 2
+
+
+def test_incremental_update_matches_full_build(operations_data: pd.DataFrame) -> None:
+    cube = AggregateCube(operations_data.iloc[:2])
+    cube.update(operations_data.iloc[2:])
+
+    full = AggregateCube(operations_data)
+    assert cube.card_totals(DECEMBER) == full.card_totals(DECEMBER)
+    assert cube.data["count"].sum() == 5
+
+
+def test_whole_months() -> None:
+    months = whole_months(pd.Timestamp("2021-11-01"), pd.Timestamp("2021-12-31 23:59:59"))
+    assert months is not None
+    assert list(months) == [
+        pd.Period("2021-11", freq="M"),
+        pd.Period("2021-12", freq="M"),
+    ]
+    assert whole_months(pd.Timestamp("2021-12-01"), pd.Timestamp("2021-12-30 19:07:35")) is None
+    assert whole_months(pd.Timestamp("2021-12-02"), pd.Timestamp("2021-12-31 23:59:59")) is None
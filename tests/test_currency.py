@@ -0,0 +1,195 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+import moneyscope.currency
+from moneyscope.config import get_config
+from moneyscope.currency import RateHistoryClient, RateTable, normalize_currency
+from moneyscope.memo import data_fingerprint
+from moneyscope.utils import OperationsSnapshot, in_reporting_currency
+
+# Дневные курсы к рублю; 25 и 26 декабря 2021 — выходные
+HISTORY = {
+    "USDRUB": {"2021-12-23": 73.0, "2021-12-24": 73.5, "2021-12-27": 74.0, "2021-12-28": 74.5},
+    "EURRUB": {"2021-12-23": 82.5, "2021-12-24": 83.0, "2021-12-27": 83.5, "2021-12-28": 84.0},
+}
+
+
+class HistoryServer(ThreadingHTTPServer):
+    """Локальная замена API исторических котировок: отвечает как endpoint historical-price-full/<символы>"""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), HistoryHandler)
+        self.requests: list = []
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v3/historical-price-full/"
+
+
+class HistoryHandler(BaseHTTPRequestHandler):
+    server: HistoryServer
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        symbols = url.path.rsplit("/", 1)[-1].split(",")
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((symbols, params["from"], params["to"]))
+
+        items = [
+            {
+                "symbol": symbol,
+                "historical": [
+                    {"date": day, "close": rate}
+                    for day, rate in sorted(HISTORY.get(symbol, {}).items(), reverse=True)
+                    if params["from"] <= day <= params["to"]
+                ],
+            }
+            for symbol in symbols
+        ]
+        body = json.dumps(items[0] if len(items) == 1 else {"historicalStockList": items})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def history_server() -> Iterator[HistoryServer]:
+    server = HistoryServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _operations(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(
+        rows, columns=["Дата операции", "Сумма операции", "Валюта операции", "Сумма платежа", "Валюта платежа"]
+    )
+    df["Дата операции"] = pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S")
+    df["Кэшбэк"] = None
+    return df
+
+
+@pytest.fixture
+def foreign_operations() -> pd.DataFrame:
+    return _operations(
+        [
+            ["24.12.2021 10:00:00", -100.0, "RUB", -100.0, "RUB"],
+            ["25.12.2021 12:00:00", -10.0, "USD", -735.0, "RUB"],
+            ["25.12.2021 13:00:00", -5.0, "EUR", -5.0, "EUR"],
+        ]
+    )
+
+
+def test_normalize_uses_rate_as_of_operation_date(
+    history_server: HistoryServer, foreign_operations: pd.DataFrame
+) -> None:
+    table = RateTable(client=RateHistoryClient(base_url=history_server.base_url))
+
+    normalized = normalize_currency(foreign_operations, table=table)
+
+    # Операции субботы пересчитаны по курсу пятницы, все валюты запрошены одним запросом
+    assert normalized["Сумма операции"].tolist() == [-100.0, -735.0, -415.0]
+    assert normalized["Сумма платежа"].tolist() == [-100.0, -735.0, -415.0]
+    assert set(normalized["Валюта операции"]) == set(normalized["Валюта платежа"]) == {"RUB"}
+    assert foreign_operations["Сумма операции"].tolist() == [-100.0, -10.0, -5.0]
+    assert history_server.requests == [(["EURRUB", "USDRUB"], "2021-12-18", "2021-12-25")]
+    assert normalize_currency(normalized, table=table) is normalized
+
+
+def test_only_missing_dates_are_fetched(
+    history_server: HistoryServer, foreign_operations: pd.DataFrame, tmp_path: Path
+) -> None:
+    path = tmp_path / "rates.parquet"
+    table = RateTable(path, RateHistoryClient(base_url=history_server.base_url))
+    normalize_currency(foreign_operations, table=table)
+    normalize_currency(foreign_operations, table=table)
+    later = _operations([["28.12.2021 09:00:00", -10.0, "USD", -745.0, "RUB"]])
+
+    assert normalize_currency(later, table=table)["Сумма операции"].tolist() == [-745.0]
+    assert history_server.requests[1:] == [(["USDRUB"], "2021-12-26", "2021-12-28")]
+    assert table.coverage["USD"] == (pd.Timestamp("2021-12-18"), pd.Timestamp("2021-12-28"))
+
+    # Без сети пересчёт работает по сохранённой таблице
+    offline = RateTable(path, RateHistoryClient(base_url="http://127.0.0.1:9/", timeout=0.5))
+    assert normalize_currency(later, table=offline)["Сумма операции"].tolist() == [-745.0]
+    assert len(history_server.requests) == 2
+
+
+def test_rows_without_rate_keep_their_currency(foreign_operations: pd.DataFrame) -> None:
+    table = RateTable(client=RateHistoryClient(base_url="http://127.0.0.1:9/", timeout=0.5))
+
+    normalized = normalize_currency(foreign_operations, table=table)
+
+    assert normalized["Сумма операции"].tolist() == [-100.0, -10.0, -5.0]
+    assert normalized["Валюта операции"].tolist() == ["RUB", "USD", "EUR"]
+    assert table.coverage == {}
+
+
+def test_normalize_to_foreign_reporting_currency(
+    history_server: HistoryServer, foreign_operations: pd.DataFrame
+) -> None:
+    table = RateTable(client=RateHistoryClient(base_url=history_server.base_url))
+
+    normalized = normalize_currency(foreign_operations, "USD", table=table)
+
+    assert normalized["Сумма операции"].tolist() == pytest.approx([-100.0 / 73.5, -10.0, -415.0 / 73.5])
+    assert set(normalized["Валюта операции"]) == {"USD"}
+
+
+def test_snapshot_in_currency_is_cached_until_rates_change(
+    history_server: HistoryServer, operations_data: pd.DataFrame
+) -> None:
+    operations = operations_data.copy()
+    operations.loc[operations["Описание"] == "Mouse Tail", ["Валюта операции", "Валюта платежа"]] = "USD"
+    snapshot = OperationsSnapshot(operations, version=1, mtime_ns=None)
+    table = RateTable(client=RateHistoryClient(base_url=history_server.base_url))
+
+    converted = snapshot.in_currency("RUB", table)
+
+    # Операция 29.12 в долларах пересчитана по последнему известному курсу (28.12), исходный снимок не изменился
+    assert converted.select("2021-12-29 16:00:00", "2021-12-29 17:00:00")["Сумма операции"].tolist() == [-8940.0]
+    assert snapshot.select("2021-12-29 16:00:00", "2021-12-29 17:00:00")["Сумма операции"].tolist() == [-120.0]
+    assert snapshot.in_currency("RUB", table) is converted
+    assert converted.in_currency("RUB", table) is converted
+    assert (converted.currency, converted.rates_revision) == ("RUB", table.revision)
+    assert data_fingerprint(converted) != data_fingerprint(snapshot)
+    assert len(history_server.requests) == 1
+
+    # После загрузки новых курсов снимок пересчитывается заново
+    table.add(
+        pd.DataFrame({"date": [pd.Timestamp("2021-12-29")], "currency": ["USD"], "rate": [75.0]}),
+        ["USD"],
+        pd.Timestamp("2021-12-29"),
+        pd.Timestamp("2021-12-29"),
+    )
+    reconverted = snapshot.in_currency("RUB", table)
+    assert reconverted is not converted
+    assert reconverted.select("2021-12-29 16:00:00", "2021-12-29 17:00:00")["Сумма операции"].tolist() == [-9000.0]
+
+
+def test_in_reporting_currency_is_opt_in(
+    history_server: HistoryServer, foreign_operations: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    assert in_reporting_currency(foreign_operations) is foreign_operations
+
+    table = RateTable(client=RateHistoryClient(base_url=history_server.base_url))
+    monkeypatch.setattr(moneyscope.currency, "_rate_table", table)
+    monkeypatch.setattr(get_config(), "reporting_currency", "RUB")
+
+    assert in_reporting_currency(foreign_operations)["Сумма операции"].tolist() == [-100.0, -735.0, -415.0]
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import moneyscope.currency
+from moneyscope.config import get_config
+from moneyscope.currency import RateTable
+from moneyscope.ingest import ingest_operations, load_store, transaction_keys
+
+
+def write_export(path: Path, df: pd.DataFrame) -> Path:
+    # Сохраняем выгрузку в том же формате, что и у банка
+    df = df.copy()
+    df["Дата операции"] = df["Дата операции"].dt.strftime("%d.%m.%Y %H:%M:%S")
+    df["Дата платежа"] = df["Дата платежа"].dt.strftime("%d.%m.%Y")
+    df.to_excel(path, index=False)
+    return path
+
+
+def test_transaction_keys_distinguish_repeated_operations(operations_data: pd.DataFrame) -> None:
+    # Две одинаковые операции в одной выгрузке должны получить разные ключи
+    doubled = pd.concat([operations_data.iloc[[1]], operations_data.iloc[[1]]])
+
+    keys = transaction_keys(doubled)
+
+    assert keys[0] != keys[1]
+    assert (transaction_keys(operations_data) == transaction_keys(operations_data.copy())).all()
+
+
+def test_ingest_operations_appends_only_new_rows(tmp_path: Path, operations_data: pd.DataFrame) -> None:
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    store = tmp_path / "store"
+
+    # Первая выгрузка — три строки, вторая пересекается с ней и добавляет ещё две
+    write_export(exports / "day1.xlsx", operations_data.iloc[:3])
+    first = ingest_operations(exports, store)
+    write_export(exports / "day2.xlsx", operations_data.iloc[1:])
+    second = ingest_operations(exports, store)
+
+    assert first == {"files_parsed": 1, "files_skipped": 0, "rows_added": 3}
+    assert second == {"files_parsed": 1, "files_skipped": 1, "rows_added": 2}
+
+    result = load_store(store)
+    assert len(result) == 5
+    assert "_key" not in result.columns
+    assert str(result["Дата операции"].dtype).startswith("datetime64")
+
+
+def test_ingest_operations_skips_unchanged_files(tmp_path: Path, operations_data: pd.DataFrame) -> None:
+    export = write_export(tmp_path / "day1.xlsx", operations_data)
+    store = tmp_path / "store"
+    ingest_operations([export], store)
+
+    result = ingest_operations([export], store)
+
+    assert result == {"files_parsed": 0, "files_skipped": 1, "rows_added": 0}
+    assert len(load_store(store)) == 5
+
+
+def test_ingest_operations_keeps_original_amounts(
+    tmp_path: Path, operations_data: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Валюта отчётов задана и курс известен, но загрузка хранит исходные суммы: ключи операций не меняются
+    table = RateTable()
+    table.add(
+        pd.DataFrame({"date": [pd.Timestamp("2021-12-28")], "currency": ["USD"], "rate": [74.5]}),
+        ["USD"],
+        pd.Timestamp("2021-12-01"),
+        pd.Timestamp("2021-12-31"),
+    )
+    monkeypatch.setattr(moneyscope.currency, "_rate_table", table)
+    monkeypatch.setattr(get_config(), "reporting_currency", "USD")
+    export = write_export(tmp_path / "day1.xlsx", operations_data)
+    store = tmp_path / "store"
+    ingest_operations([export], store)
+
+    # Та же выгрузка под новым именем: строки совпадают с уже загруженными по ключам
+    write_export(tmp_path / "day2.xlsx", operations_data)
+    result = ingest_operations([tmp_path / "day2.xlsx"], store)
+
+    assert result["rows_added"] == 0
+    assert load_store(store)["Сумма операции"].tolist() == operations_data["Сумма операции"].tolist()
+
+
+def test_load_store_empty(tmp_path: Path) -> None:
+    assert load_store(tmp_path / "missing").empty
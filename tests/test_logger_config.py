@@ -0,0 +1,81 @@
+import logging
+import threading
+from logging.handlers import QueueHandler
+from typing import Any, Iterator
+
+import pandas as pd
+import pytest
+
+from moneyscope import logger_config
+from moneyscope.logger_config import PayloadLogger, PayloadPreview, flush_logs, logger
+
+
+class CountingMessage:
+    def __init__(self) -> None:
+        self.formatted = 0
+
+    def __str__(self) -> str:
+        self.formatted += 1
+        return "сообщение"
+
+
+@pytest.fixture
+def payload_logger() -> Iterator[PayloadLogger]:
+    channel = PayloadLogger("main_logger.payload.test", sample_rate=1.0, max_per_second=1.0)
+    channel.logger.setLevel(logging.DEBUG)
+    yield channel
+    channel.logger.setLevel(logging.NOTSET)
+
+
+def test_file_is_written_by_background_thread(mocker: Any) -> None:
+    emit = mocker.patch.object(logger_config.rotating_handler, "emit")
+    emit.side_effect = lambda record: threads.append(threading.current_thread())
+    threads: list = []
+
+    logger.info("Проверка записи в фоне")
+    flush_logs()
+
+    # Файловый обработчик подключён не к логгеру, а к фоновому потоку очереди
+    assert any(isinstance(handler, QueueHandler) for handler in logger.handlers)
+    assert logger_config.rotating_handler not in logger.handlers
+    assert threads and threading.current_thread() not in threads
+
+
+def test_disabled_messages_are_not_formatted(mocker: Any) -> None:
+    mocker.patch.object(logger_config.rotating_handler, "emit")
+    message = CountingMessage()
+
+    # Уровень DEBUG отключён, поэтому аргументы сообщения даже не преобразуются в строку
+    logger.debug("Отладка: %s", message)
+    flush_logs()
+
+    assert message.formatted == 0
+
+
+def test_payload_channel_is_off_by_default() -> None:
+    class Exploding:
+        def __getattr__(self, name: str) -> Any:
+            raise AssertionError("объект не должен описываться")
+
+    logger_config.log_payload("Операции", Exploding())
+
+
+def test_payload_channel_is_rate_limited(payload_logger: PayloadLogger, mocker: Any) -> None:
+    emit = mocker.patch.object(logger_config.rotating_handler, "emit")
+    df = pd.DataFrame({"value": range(10_000)})
+
+    payload_logger.log("Операции", df)
+    payload_logger.log("Операции", df)
+    flush_logs()
+
+    assert emit.call_count == 1
+    assert payload_logger.dropped == 1
+    assert "(10000, 1)" in emit.call_args[0][0].getMessage()
+
+
+def test_payload_preview_size_does_not_depend_on_data() -> None:
+    small = str(PayloadPreview(pd.DataFrame({"value": range(10)})))
+    large = str(PayloadPreview(pd.DataFrame({"value": range(1_000_000)})))
+
+    assert len(large) - len(small) < 10
+    assert str(PayloadPreview(list(range(1000)), rows=3)) == "list из 1000 элементов: [0, 1, 2]"
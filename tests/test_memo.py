@@ -0,0 +1,118 @@
+import json
+from typing import Any
+
+import pandas as pd
+
+from moneyscope.memo import data_fingerprint, memo_stats, memoize
+from moneyscope.reports import spending_by_category, spending_by_category_cube
+from moneyscope.services import top_3_cashback_categories
+from moneyscope.utils import OperationsSnapshot, iter_chunks
+
+
+def test_data_fingerprint(operations_data: pd.DataFrame) -> None:
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+    assert data_fingerprint(snapshot) == data_fingerprint(snapshot)
+    assert data_fingerprint(snapshot.with_rows(operations_data.head(1))) != data_fingerprint(snapshot)
+    # Содержимое DataFrame и списков не хешируется: такие вызовы не кэшируются
+    assert data_fingerprint(operations_data) is None
+    assert data_fingerprint(operations_data.to_dict("records")) is None
+    assert data_fingerprint(iter_chunks(operations_data)) is None
+
+
+def test_spending_by_category_is_memoized(operations_data: pd.DataFrame) -> None:
+    info: Any = getattr(spending_by_category, "cache_info")
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+    first = spending_by_category(snapshot, "Ж/д билеты", "30.12.2021")
+    # Изменение полученного отчёта не портит кэш
+    first["Сумма операции"] = 0.0
+    second = spending_by_category(snapshot, "Ж/д билеты", "30.12.2021")
+    second["Сумма операции"] = 1.0
+    third = spending_by_category(snapshot, "Ж/д билеты", "30.12.2021")
+
+    assert third["Сумма операции"].tolist() == [-1411.4, -1411.4]
+    assert info()["hits"] == 2
+    assert info()["misses"] == 1
+    assert 0 < info()["bytes"] < snapshot.operations.memory_usage(deep=True).sum()
+
+
+def test_memo_key_ignores_argument_style(operations_data: pd.DataFrame) -> None:
+    info: Any = getattr(spending_by_category, "cache_info")
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+    positional = spending_by_category(snapshot, "Ж/д билеты", "30.12.2021")
+    named = spending_by_category(transactions=snapshot, category="Ж/д билеты", date_string="30.12.2021")
+    mixed = spending_by_category(snapshot, date_string="30.12.2021", category="Ж/д билеты")
+    cube = spending_by_category_cube(transactions=snapshot, end_dates=["30.12.2021"], categories=["Ж/д билеты"])
+
+    assert named.equals(positional) and mixed.equals(positional)
+    assert info()["misses"] == 1 and info()["hits"] == 2
+    assert cube.equals(spending_by_category_cube(snapshot, ["30.12.2021"], ["Ж/д билеты"], False))
+    assert getattr(spending_by_category_cube, "cache_info")()["hits"] == 1
+
+
+def test_memo_invalidated_when_operations_change(operations_data: pd.DataFrame) -> None:
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+    extra = operations_data.head(1).copy()
+    extra["Дата операции"] = pd.Timestamp("2021-12-15 12:00:00")
+    extra["Кэшбэк"] = 500.0
+
+    before = json.loads(top_3_cashback_categories(snapshot, 2021, 12))
+    after = json.loads(top_3_cashback_categories(snapshot.with_rows(extra), 2021, 12))
+
+    assert before == {"Ж/д билеты": 140.0}
+    assert after == {"Пополнения": 500.0, "Ж/д билеты": 140.0}
+    assert getattr(top_3_cashback_categories, "cache_info")()["misses"] == 2
+
+
+def test_memo_skips_unrepeatable_calls(operations_data: pd.DataFrame) -> None:
+    info: Any = getattr(spending_by_category, "cache_info")
+    spending_by_category(iter_chunks(operations_data), "Ж/д билеты", "30.12.2021")
+    spending_by_category(operations_data, "Ж/д билеты", "30.12.2021")
+    spending_by_category(OperationsSnapshot(operations_data, version=1, mtime_ns=None), "Ж/д билеты")
+
+    assert info()["skipped"] == 3
+    assert info()["size"] == 0
+
+
+def test_memo_lru_eviction(operations_data: pd.DataFrame) -> None:
+    calls = []
+
+    @memoize(maxsize=2)
+    def total(data: OperationsSnapshot, column: str) -> float:
+        calls.append(column)
+        return float(data.operations[column].sum())
+
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+    for column in ["Сумма операции", "Кэшбэк", "Сумма операции", "Бонусы (включая кэшбэк)", "Кэшбэк"]:
+        total(snapshot, column)
+
+    # "Кэшбэк" вытеснен при добавлении "Бонусы (включая кэшбэк)", поэтому считается заново
+    assert calls == ["Сумма операции", "Кэшбэк", "Бонусы (включая кэшбэк)", "Кэшбэк"]
+    stats = memo_stats()[total.__qualname__]
+    assert {key: stats[key] for key in ("hits", "misses", "skipped", "size", "maxsize")} == {
+        "hits": 1,
+        "misses": 4,
+        "skipped": 0,
+        "size": 2,
+        "maxsize": 2,
+    }
+
+
+def test_memo_bounded_by_bytes(operations_data: pd.DataFrame) -> None:
+    snapshot = OperationsSnapshot(pd.concat([operations_data] * 20, ignore_index=True), version=1, mtime_ns=None)
+    maxbytes = 2 * int(snapshot.operations.head(5).memory_usage(deep=True).sum())
+
+    @memoize(maxbytes=maxbytes)
+    def rows(data: OperationsSnapshot, count: int) -> pd.DataFrame:
+        return data.operations.head(count)
+
+    info: Any = getattr(rows, "cache_info")
+    for count in [1, 2, 3, 4, 5]:
+        rows(snapshot, count)
+    rows(snapshot, 100)
+
+    # Старые результаты вытесняются по объёму, а результат больше всего кэша не сохраняется
+    assert info()["bytes"] <= maxbytes
+    assert 0 < info()["size"] < 5
+    assert rows(snapshot, 5)["Описание"].tolist() == snapshot.operations["Описание"].head(5).tolist()
+    assert info()["hits"] == 1
@@ -0,0 +1,76 @@
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import pytest
+
+from moneyscope.metrics import enable_metrics, get_stats, instrument, prometheus_text, reset_stats, write_prometheus
+from moneyscope.reports import spending_by_category
+from moneyscope.utils import aggregate_card_data
+
+
+@pytest.fixture
+def metrics() -> Iterator[None]:
+    reset_stats()
+    enable_metrics(True, trace_memory=False)
+    yield
+    enable_metrics(False, trace_memory=False)
+    reset_stats()
+
+
+def test_disabled_metrics_record_nothing(operations_data: pd.DataFrame) -> None:
+    reset_stats()
+    enable_metrics(False)
+    aggregate_card_data(operations_data)
+
+    assert get_stats() == {}
+
+
+def test_stages_record_calls_and_rows(metrics: None, operations_data: pd.DataFrame) -> None:
+    aggregate_card_data(operations_data)
+    spending_by_category(operations_data, "Ж/д билеты", "30.12.2021")
+    stats = get_stats()
+
+    assert stats["aggregate_card_data"]["calls"] == 1
+    assert stats["aggregate_card_data"]["rows_in_total"] == 5
+    assert stats["aggregate_card_data"]["rows_out_total"] == 3
+    assert stats["spending_by_category"]["rows_out_total"] == 2
+    assert stats["select_operations"]["calls"] == 1
+    assert stats["spending_by_category"]["seconds_total"] >= stats["select_operations"]["seconds_total"]
+
+
+def test_stage_errors_and_nested_memory(metrics: None) -> None:
+    @instrument("inner")
+    def inner() -> list:
+        return [bytearray(1_000_000)]
+
+    @instrument("outer")
+    def outer() -> int:
+        return len(inner())
+
+    @instrument("failing")
+    def failing() -> None:
+        raise ValueError("ошибка")
+
+    enable_metrics(True, trace_memory=True)
+    outer()
+    with pytest.raises(ValueError):
+        failing()
+    stats = get_stats()
+
+    assert stats["inner"]["peak_memory_bytes_max"] >= 1_000_000
+    assert stats["outer"]["peak_memory_bytes_max"] >= stats["inner"]["peak_memory_bytes_max"]
+    assert stats["failing"] == {**stats["failing"], "calls": 1, "errors": 1}
+
+
+def test_prometheus_export(metrics: None, operations_data: pd.DataFrame, tmp_path: Path) -> None:
+    aggregate_card_data(operations_data)
+    text = prometheus_text()
+    path = write_prometheus(tmp_path / "metrics" / "moneyscope.prom")
+
+    assert "# TYPE moneyscope_stage_duration_seconds histogram" in text
+    assert 'moneyscope_stage_duration_seconds_bucket{stage="aggregate_card_data",le="+Inf"} 1' in text
+    assert 'moneyscope_stage_duration_seconds_count{stage="aggregate_card_data"} 1' in text
+    assert 'moneyscope_stage_rows_in_total{stage="aggregate_card_data"} 5' in text
+    assert path is not None and path.read_text(encoding="utf-8") == text
+    assert list(path.parent.iterdir()) == [path]
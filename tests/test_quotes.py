@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator
+from unittest.mock import patch
+from urllib.parse import urlparse
+
+import pytest
+
+from moneyscope.quotes import QuoteCache, QuoteClient
+from moneyscope.utils import get_currency_rates, get_stock_prices
+
+PRICES = {"USDRUB": 75.0, "EURRUB": 82.5, "AAPL": 150.0, "AMZN": 3200.0, "GOOGL": 2800.0, "MSFT": 300.0, "TSLA": 700.0}
+
+
+class QuoteServer(ThreadingHTTPServer):
+    """Локальная замена API котировок: отвечает как endpoint quote/<символы через запятую>"""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), QuoteHandler)
+        self.requests: list = []
+        self.slow_symbols: set = set()
+        self.reject_batches = False
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v3/quote/"
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    server: QuoteServer
+
+    def do_GET(self) -> None:
+        symbols = urlparse(self.path).path.rsplit("/", 1)[-1].split(",")
+        self.server.requests.append(symbols)
+
+        if self.server.reject_batches and len(symbols) > 1:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.server.slow_symbols.intersection(symbols):
+            time.sleep(1)
+
+        body = json.dumps([{"symbol": symbol, "price": PRICES[symbol]} for symbol in symbols if symbol in PRICES])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def quote_server() -> Iterator[QuoteServer]:
+    server = QuoteServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def quote_client(quote_server: QuoteServer) -> Iterator[QuoteClient]:
+    client = QuoteClient(base_url=quote_server.base_url, api_key="test", timeout=0.3)
+    yield client
+    client.close()
+
+
+def test_fetch_uses_one_round_trip(quote_server: QuoteServer, quote_client: QuoteClient) -> None:
+    result = quote_client.fetch(list(PRICES))
+
+    assert result == PRICES
+    assert len(quote_server.requests) == 1
+
+
+def test_fetch_splits_into_batches(quote_server: QuoteServer) -> None:
+    client = QuoteClient(base_url=quote_server.base_url, api_key="test", batch_size=4)
+    try:
+        assert client.fetch(list(PRICES)) == PRICES
+    finally:
+        client.close()
+
+    assert sorted(len(symbols) for symbols in quote_server.requests) == [3, 4]
+
+
+def test_fetch_falls_back_to_single_symbols(quote_server: QuoteServer, quote_client: QuoteClient) -> None:
+    quote_server.reject_batches = True
+
+    assert quote_client.fetch(["AAPL", "MSFT"]) == {"AAPL": 150.0, "MSFT": 300.0}
+    assert len(quote_server.requests) == 3
+
+
+def test_fetch_skips_unknown_symbols(quote_server: QuoteServer, quote_client: QuoteClient) -> None:
+    assert quote_client.fetch(["AAPL", "UNKNOWN"]) == {"AAPL": 150.0}
+
+
+def test_fetch_timeout_does_not_stall_other_symbols(quote_server: QuoteServer, quote_client: QuoteClient) -> None:
+    quote_server.slow_symbols = {"TSLA"}
+    symbols = ["AAPL", "MSFT", "TSLA", "USDRUB"]
+
+    started = time.perf_counter()
+    result = quote_client.fetch(symbols)
+    elapsed = time.perf_counter() - started
+
+    # Пачка целиком упирается в таймаут, затем символы дозапрашиваются параллельно
+    assert result == {"AAPL": 150.0, "MSFT": 300.0, "USDRUB": 75.0}
+    assert elapsed < 0.9
+
+
+def test_get_quotes_via_local_server(quote_server: QuoteServer, quote_client: QuoteClient) -> None:
+    settings = {"user_currencies": ["USD", "EUR"], "user_stocks": ["AAPL", "AMZN", "GOOGL", "MSFT", "TSLA"]}
+    with patch("moneyscope.utils.load_user_settings", return_value=settings), patch(
+        "moneyscope.utils.get_quote_cache", return_value=QuoteCache(quote_client)
+    ):
+        rates = get_currency_rates()
+        stocks = get_stock_prices()
+
+    assert rates == [{"currency": "USD", "rate": 75.0}, {"currency": "EUR", "rate": 82.5}]
+    assert [stock["stock"] for stock in stocks] == settings["user_stocks"]
+    assert len(quote_server.requests) == 2
+
+
+def test_cache_serves_fresh_quotes(quote_server: QuoteServer, quote_client: QuoteClient) -> None:
+    cache = QuoteCache(quote_client, ttl=60)
+
+    assert cache.get(["AAPL", "MSFT"]) == {"AAPL": 150.0, "MSFT": 300.0}
+    assert cache.get(["MSFT", "AAPL"]) == {"MSFT": 300.0, "AAPL": 150.0}
+    assert len(quote_server.requests) == 1
+
+
+def test_cache_serves_stale_and_refreshes_in_background(quote_server: QuoteServer) -> None:
+    client = QuoteClient(base_url=quote_server.base_url, api_key="test", timeout=2)
+    cache = QuoteCache(client, ttl=0)
+    cache.get(["AAPL"])
+    PRICES["AAPL"] = 155.0
+    quote_server.slow_symbols = {"AAPL"}
+
+    try:
+        # Устаревшая цена отдаётся сразу, не дожидаясь медленного ответа API
+        started = time.perf_counter()
+        assert cache.get(["AAPL"]) == {"AAPL": 150.0}
+        assert time.perf_counter() - started < 0.5
+
+        cache.wait()
+    finally:
+        PRICES["AAPL"] = 150.0
+        client.close()
+    assert len(quote_server.requests) == 2
+    assert cache._entries["AAPL"][0] == 155.0
+
+
+def test_cache_collapses_concurrent_misses(quote_server: QuoteServer) -> None:
+    quote_server.slow_symbols = {"TSLA"}
+    client = QuoteClient(base_url=quote_server.base_url, api_key="test", timeout=2)
+    cache = QuoteCache(client)
+    results: list = []
+    try:
+        threads = [threading.Thread(target=lambda: results.append(cache.get(["TSLA"]))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        client.close()
+
+    assert results == [{"TSLA": 700.0}] * 5
+    assert len(quote_server.requests) == 1
+
+
+def test_cache_persists_to_disk(quote_server: QuoteServer, quote_client: QuoteClient, tmp_path: Path) -> None:
+    cache_file = tmp_path / "quotes.json"
+    QuoteCache(quote_client, path=cache_file).get(["AAPL", "USDRUB"])
+
+    # Новый экземпляр (как после перезапуска процесса) отвечает из файла без запросов к API
+    restarted = QuoteCache(quote_client, path=cache_file)
+    assert restarted.get(["USDRUB", "AAPL"]) == {"USDRUB": 75.0, "AAPL": 150.0}
+    assert len(quote_server.requests) == 1
+
+
+def test_cache_ignores_broken_file(quote_server: QuoteServer, quote_client: QuoteClient, tmp_path: Path) -> None:
+    cache_file = tmp_path / "quotes.json"
+    cache_file.write_text("not json", encoding="utf-8")
+
+    assert QuoteCache(quote_client, path=cache_file).get(["AAPL"]) == {"AAPL": 150.0}
@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from moneyscope.report_writer import ReportWriter, report_format, write_report
+
+
+@pytest.fixture
+def report() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "category": ["Фастфуд", "Ж/д билеты", "Канцтовары"],
+            "end_date": pd.to_datetime(["2021-12-29", "2021-12-30", "2021-12-31"]),
+            "total_amount": [-120.0, -2822.8, -349.0],
+        }
+    )
+
+
+def test_report_format() -> None:
+    assert report_format("report.json") == "json"
+    assert report_format("report.jsonl") == "ndjson"
+    assert report_format("report.parquet") == "parquet"
+    assert report_format("report.json", "csv") == "csv"
+    with pytest.raises(ValueError):
+        report_format("report.json", "xml")
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson", "csv", "parquet"])
+def test_write_report_formats(report: pd.DataFrame, tmp_path: Path, fmt: str, mocker: Any) -> None:
+    # Маленькие порции, чтобы проверить запись по частям
+    mocker.patch("moneyscope.report_writer.WRITE_CHUNK_ROWS", 2)
+    path = tmp_path / "reports" / f"report.{fmt}"
+
+    write_report(report, path, fmt)
+
+    if fmt == "json":
+        result = pd.DataFrame(json.loads(path.read_text(encoding="utf-8")))
+    elif fmt == "ndjson":
+        result = pd.read_json(path, lines=True)
+    elif fmt == "csv":
+        result = pd.read_csv(path)
+    else:
+        result = pd.read_parquet(path)
+
+    assert result["category"].tolist() == report["category"].tolist()
+    assert result["total_amount"].tolist() == report["total_amount"].tolist()
+    assert pd.to_datetime(result["end_date"]).tolist() == report["end_date"].tolist()
+    # Временных файлов после атомарной записи не остаётся
+    assert [file.name for file in path.parent.iterdir()] == [path.name]
+
+
+def test_write_empty_json_report(tmp_path: Path) -> None:
+    path = tmp_path / "empty.json"
+    write_report(pd.DataFrame(columns=["category"]), path, "json")
+
+    assert json.loads(path.read_text(encoding="utf-8")) == []
+
+
+def test_report_writer_flush_and_close(report: pd.DataFrame, tmp_path: Path) -> None:
+    writer = ReportWriter()
+    writer.submit(report, tmp_path / "first.ndjson", "ndjson")
+    # Изменение отчёта после постановки в очередь не попадает в файл
+    report.loc[0, "total_amount"] = 0.0
+    writer.flush()
+
+    assert (
+        json.loads((tmp_path / "first.ndjson").read_text(encoding="utf-8").splitlines()[0])["total_amount"] == -120.0
+    )
+
+    writer.submit(report, tmp_path / "second.csv", "csv")
+    writer.close()
+    assert (tmp_path / "second.csv").exists()
+
+
+def test_report_writer_logs_errors(report: pd.DataFrame, tmp_path: Path) -> None:
+    blocker = tmp_path / "file"
+    blocker.write_text("", encoding="utf-8")
+    writer = ReportWriter()
+
+    # Папку отчётов нельзя создать: на её месте файл. Ошибка не роняет поток записи
+    writer.submit(report, blocker / "report.json", "json")
+    writer.submit(report, tmp_path / "report.json", "json")
+    writer.close()
+
+    assert writer.errors == 1
+    assert (tmp_path / "report.json").exists()
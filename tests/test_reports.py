@@ -1,6 +1,12 @@
+import time
+from pathlib import Path
+from typing import Any
+
 import pandas as pd
 
-from moneyscope.reports import spending_by_category
+import moneyscope.report_writer
+from moneyscope.reports import flush_reports, save_report_to_file, spending_by_category, spending_by_category_cube
+from moneyscope.utils import OperationsSnapshot
 
 
 def test_spending_by_category_with_data(operations_data: pd.DataFrame) -> None:
@@ -46,3 +52,84 @@ def test_spending_by_category_with_empty_data(empty_operations_data: pd.DataFram
 
     # Проверяем, что результат — это пустой DataFrame
     assert result.empty
+
+
+def test_spending_by_category_from_chunks(operations_data: pd.DataFrame) -> None:
+    # Тест с итератором порций вместо целого DataFrame
+    chunks = iter([operations_data.iloc[:3], operations_data.iloc[3:]])
+
+    result = spending_by_category(chunks, "Ж/д билеты", "30.12.2021")
+
+    assert len(result) == 2
+    assert (result["Категория"] == "Ж/д билеты").all()
+
+
+def test_spending_by_category_from_snapshot(operations_data: pd.DataFrame) -> None:
+    # Тест со снимком: выборка идёт по индексу категории и дат
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+    result = spending_by_category(snapshot, "Ж/д билеты", "30.12.2021")
+
+    assert result["Сумма операции"].tolist() == [-1411.4, -1411.4]
+    assert result["Дата операции"].is_monotonic_increasing
+
+
+def test_spending_by_category_cube_matches_single_reports(operations_data: pd.DataFrame) -> None:
+    end_dates = ["29.12.2021", "30.12.2021", "01.01.2021"]
+
+    cube = spending_by_category_cube(operations_data, end_dates)
+
+    # Таблица полная: каждая категория на каждую дату
+    assert len(cube) == operations_data["Категория"].nunique() * len(end_dates)
+    for row in cube.itertuples():
+        single = spending_by_category(operations_data, row.category, row.end_date.strftime("%d.%m.%Y"))
+        assert row.operations_count == len(single)
+        assert row.total_amount == round(single["Сумма операции"].sum(), 2)
+
+
+def test_spending_by_category_cube_with_slices(operations_data: pd.DataFrame) -> None:
+    cube, slices = spending_by_category_cube(
+        operations_data, ["30.12.2021"], categories=["Ж/д билеты", "Одежда"], return_slices=True
+    )
+
+    assert cube["total_amount"].tolist() == [-2822.8, 0.0]
+    assert cube["operations_count"].tolist() == [2, 0]
+    assert len(slices[("Ж/д билеты", pd.Timestamp("2021-12-30"))]) == 2
+    assert slices[("Одежда", pd.Timestamp("2021-12-30"))].empty
+
+
+def test_spending_by_category_cube_with_empty_data(empty_operations_data: pd.DataFrame) -> None:
+    assert spending_by_category_cube(empty_operations_data, ["30.12.2021"]).empty
+
+
+def test_save_report_to_file_writes_in_background(operations_data: pd.DataFrame, tmp_path: Path, mocker: Any) -> None:
+    mocker.patch("moneyscope.reports.report_files_dir", tmp_path)
+    write_report = moneyscope.report_writer.write_report
+
+    def slow_write_report(*args: Any) -> None:
+        time.sleep(0.3)
+        write_report(*args)
+
+    mocker.patch("moneyscope.report_writer.write_report", side_effect=slow_write_report)
+
+    # Вызов возвращает отчёт, не дожидаясь записи файла
+    started = time.perf_counter()
+    result = spending_by_category(operations_data, "Ж/д билеты", "30.12.2021")
+    assert time.perf_counter() - started < 0.3
+
+    flush_reports()
+    saved = pd.read_json(tmp_path / "spending_by_category.json")
+    assert saved["Сумма операции"].tolist() == result["Сумма операции"].tolist()
+
+
+def test_save_report_to_file_format_by_extension(tmp_path: Path, mocker: Any) -> None:
+    mocker.patch("moneyscope.reports.report_files_dir", tmp_path)
+
+    @save_report_to_file("totals.parquet")
+    def totals() -> pd.DataFrame:
+        return pd.DataFrame({"category": ["Фастфуд"], "total_amount": [-120.0]})
+
+    expected = totals()
+    flush_reports()
+
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "totals.parquet"), expected)
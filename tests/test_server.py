@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from typing import Any, List, Tuple
+
+import pandas as pd
+
+from moneyscope.server import MoneyScopeService, ServiceClient
+from moneyscope.utils import OperationsSnapshot
+from moneyscope.views import MAIN_PAGE_DEADLINE
+
+
+def _snapshot(operations_data: pd.DataFrame) -> OperationsSnapshot:
+    return OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+
+def test_endpoints_over_http(operations_data: pd.DataFrame) -> None:
+    async def scenario() -> List[Tuple[int, Any]]:
+        async with ServiceClient(MoneyScopeService(_snapshot(operations_data))) as client:
+            return [
+                await client.get("/cashback?year=2021&month=12"),
+                await client.get("/spending?category=Ж/д билеты&date=30.12.2021"),
+                await client.get("/main?time=2021-12-30 18:00:00"),
+                await client.get("/health"),
+            ]
+
+    cashback, spending, main_page, health = asyncio.run(scenario())
+
+    assert cashback == (200, {"Ж/д билеты": 140.0})
+    assert spending[0] == 200
+    assert [row["Сумма операции"] for row in spending[1]] == [-1411.4, -1411.4]
+    assert main_page[0] == 200
+    assert [card["last_digits"] for card in main_page[1]["cards"]] == ["4556", "5091", "7197"]
+    assert health == (200, {"version": 1, "rows": 5, "requests": 4, "computed": 3, "coalesced": 0})
+
+
+def test_bad_requests(operations_data: pd.DataFrame) -> None:
+    async def scenario() -> List[Tuple[int, str]]:
+        service = MoneyScopeService(_snapshot(operations_data))
+        try:
+            return [
+                await service.dispatch("GET", "/cashback?year=2021&month=13"),
+                await service.dispatch("GET", "/spending?date=30.12.2021"),
+                await service.dispatch("GET", "/main?time=30.12.2021"),
+                await service.dispatch("GET", "/unknown"),
+                await service.dispatch("POST", "/main"),
+            ]
+        finally:
+            await service.close()
+
+    assert [status for status, _ in asyncio.run(scenario())] == [400, 400, 400, 404, 405]
+
+
+def test_identical_concurrent_requests_are_coalesced(operations_data: pd.DataFrame, mocker: Any) -> None:
+    calls = []
+    threads = set()
+
+    def slow_top_3(data: Any, year: int, month: int) -> str:
+        calls.append((year, month))
+        threads.add(threading.current_thread().name)
+        time.sleep(0.2)
+        return f'{{"month": {month}}}'
+
+    mocker.patch("moneyscope.server.top_3_cashback_categories", slow_top_3)
+
+    async def scenario() -> Tuple[list, MoneyScopeService]:
+        service = MoneyScopeService(_snapshot(operations_data))
+        try:
+            same = [service.dispatch("GET", "/cashback?year=2021&month=12") for _ in range(5)]
+            other = service.dispatch("GET", "/cashback?year=2021&month=11")
+            return await asyncio.gather(*same, other), service
+        finally:
+            await service.close()
+
+    responses, service = asyncio.run(scenario())
+
+    assert responses == [(200, '{"month": 12}')] * 5 + [(200, '{"month": 11}')]
+    assert sorted(calls) == [(2021, 11), (2021, 12)]
+    assert service.coalesced == 4
+    # Расчёт выполняется в пуле потоков, а не в цикле событий
+    assert all(name.startswith("moneyscope_server") for name in threads)
+
+
+def test_main_page_uses_service_deadline(operations_data: pd.DataFrame, mocker: Any) -> None:
+    main_page = mocker.patch("moneyscope.server.get_main_page", return_value="{}")
+    service = MoneyScopeService(_snapshot(operations_data))
+
+    status, _ = asyncio.run(service.dispatch("GET", "/main?time=2021-12-30 18:00:00"))
+    asyncio.run(service.close())
+
+    assert status == 200
+    main_page.assert_called_once_with("2021-12-30 18:00:00", service.operations, deadline=MAIN_PAGE_DEADLINE)
@@ -1,6 +1,10 @@
 import json
 
+import pandas as pd
+import pyarrow as pa
+
 from moneyscope.services import top_3_cashback_categories
+from moneyscope.utils import OperationsSnapshot
 
 
 def test_top_3_cashback_categories_with_data(operations_data_list: list) -> None:
@@ -42,3 +46,50 @@ def test_top_3_cashback_categories_with_empty_data(empty_operations_data_list: l
     # Проверяем, что в результате ошибка
     assert "error" in parsed_result
     assert parsed_result["error"] == "Нет данных для анализа кешбэка"
+
+
+def test_top_3_cashback_categories_from_chunks(operations_data_list: list) -> None:
+    # Тест с итератором порций, в которых даты уже преобразованы
+    df = pd.DataFrame(operations_data_list)
+    df["Дата операции"] = pd.to_datetime(df["Дата операции"])
+    chunks = iter([df.iloc[:2], df.iloc[2:]])
+
+    parsed_result = json.loads(top_3_cashback_categories(chunks, 2021, 12))
+
+    assert parsed_result == {"Супермаркеты": 55, "Аптеки": 15}
+
+
+def test_top_3_cashback_categories_from_snapshot(operations_data: pd.DataFrame) -> None:
+    # Тест со снимком хранилища операций
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+    parsed_result = json.loads(top_3_cashback_categories(snapshot, 2021, 12))
+
+    assert parsed_result == {"Ж/д билеты": 140.0}
+
+
+def test_top_3_cashback_categories_from_dataframe_without_changes(operations_data_list: list) -> None:
+    # DataFrame со строковыми датами не должен изменяться
+    df = pd.DataFrame(operations_data_list)
+    original = df.copy()
+
+    parsed_result = json.loads(top_3_cashback_categories(df, 2021, 12))
+
+    assert parsed_result == {"Супермаркеты": 55, "Аптеки": 15}
+    pd.testing.assert_frame_equal(df, original)
+
+
+def test_top_3_cashback_categories_from_arrow_table(operations_data: pd.DataFrame) -> None:
+    table = pa.Table.from_pandas(operations_data)
+
+    parsed_result = json.loads(top_3_cashback_categories(table, 2021, 12))
+
+    assert parsed_result == {"Ж/д билеты": 140.0}
+
+
+def test_top_3_cashback_categories_from_dict_of_arrays(operations_data: pd.DataFrame) -> None:
+    columns = {column: operations_data[column].to_numpy() for column in operations_data.columns}
+
+    parsed_result = json.loads(top_3_cashback_categories(columns, 2021, 12))
+
+    assert parsed_result == {"Ж/д билеты": 140.0}
@@ -0,0 +1,101 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from moneyscope.services import top_3_cashback_categories
+from moneyscope.shared import (
+    SharedOperationsStore,
+    attach_operations,
+    attach_snapshot,
+    current_generation,
+    publish_operations,
+)
+from moneyscope.utils import OperationsSnapshot, apply_operations_schema
+
+
+def _is_mapped(array: Any) -> bool:
+    """Массив ссылается на файл, отображённый в память"""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def _worker(directory: str) -> Tuple[int, bool, str]:
+    store = SharedOperationsStore(directory)
+    snapshot = store.snapshot()
+    mapped = _is_mapped(snapshot.operations["Сумма операции"].to_numpy())
+    return snapshot.version, mapped, top_3_cashback_categories(snapshot, 2021, 12)
+
+
+def test_publish_and_attach_without_copying(operations_data: pd.DataFrame, tmp_path: Path) -> None:
+    operations = operations_data.copy()
+    operations.loc[len(operations)] = operations.iloc[0]
+    operations.loc[len(operations) - 1, "Дата операции"] = pd.NaT
+    snapshot = OperationsSnapshot(apply_operations_schema(operations), version=1, mtime_ns=None)
+
+    generation = publish_operations(snapshot, tmp_path)
+    attached_generation, attached = attach_operations(tmp_path)
+
+    assert generation == attached_generation == current_generation(tmp_path) == 1
+    pd.testing.assert_frame_equal(attached, snapshot.operations)
+    assert _is_mapped(attached["Дата операции"].to_numpy())
+    assert _is_mapped(attached["Категория"].array.codes)
+    assert _is_mapped(attached["MCC"].array._data)
+    assert not attached["Сумма операции"].to_numpy().flags.writeable
+    # Снимок из общих буферов не пересортировывает уже упорядоченные операции
+    assert _is_mapped(OperationsSnapshot(attached, version=1, mtime_ns=None).operations["Кэшбэк"].to_numpy())
+
+    # Позиции строк категорий и куб агрегатов берутся из загрузчика, а не считаются заново
+    shared = attach_snapshot(tmp_path)
+    assert shared.index is not None and snapshot.index is not None
+    positions = shared.index.category_positions
+    assert positions.keys() == snapshot.index.category_positions.keys()
+    assert all(_is_mapped(rows) for rows in positions.values())
+    pd.testing.assert_frame_equal(shared.cube.data, snapshot.cube.data)
+    pd.testing.assert_frame_equal(
+        shared.select("2021-12-29", "2021-12-29 23:59:59", "Ж/д билеты"),
+        snapshot.select("2021-12-29", "2021-12-29 23:59:59", "Ж/д билеты"),
+    )
+
+
+def test_worker_process_attaches_to_published_operations(operations_data: pd.DataFrame, tmp_path: Path) -> None:
+    snapshot = OperationsSnapshot(apply_operations_schema(operations_data), version=1, mtime_ns=None)
+    publish_operations(snapshot, tmp_path)
+
+    with ProcessPoolExecutor(1, multiprocessing.get_context("spawn")) as pool:
+        version, mapped, cashback = pool.submit(_worker, str(tmp_path)).result()
+
+    assert version == 1
+    assert mapped
+    assert cashback == top_3_cashback_categories(snapshot, 2021, 12)
+
+
+def test_store_switches_to_new_generation(operations_data: pd.DataFrame, tmp_path: Path) -> None:
+    operations = apply_operations_schema(operations_data)
+    publish_operations(operations.iloc[:3], tmp_path)
+    store = SharedOperationsStore(tmp_path, check_interval=0)
+    first = store.snapshot()
+
+    publish_operations(operations, tmp_path)
+    assert store.snapshot() is first
+    assert store._reload_thread is not None
+    store._reload_thread.join()
+    second = store.snapshot()
+
+    assert (first.version, len(first)) == (1, 3)
+    assert (second.version, len(second)) == (2, 5)
+    # Старые поколения удаляются, предыдущее остаётся для процессов, которые ещё не переключились
+    publish_operations(operations, tmp_path)
+    assert sorted(path.name for path in tmp_path.glob("operations.*")) == [
+        "operations.2.bin",
+        "operations.2.json",
+        "operations.3.bin",
+        "operations.3.json",
+    ]
+    assert len(first.operations) == 3
@@ -0,0 +1,177 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from moneyscope.currency import RateTable
+from moneyscope.server import MoneyScopeService
+from moneyscope.services import top_3_cashback_categories
+from moneyscope.stream import LiveAggregates, frame_to_events, parse_operation, serve_stream
+from moneyscope.synthetic import generate_operations
+from moneyscope.utils import OperationsSnapshot, _prepare_operations, aggregate_card_data, get_top_transactions
+from moneyscope.views import get_main_page
+
+
+@pytest.fixture
+def december() -> pd.DataFrame:
+    operations = _prepare_operations(generate_operations(600, seed=3, start="2021-11-01 00:00:00"))
+    return operations.iloc[::-1].reset_index(drop=True)
+
+
+def _month(operations: pd.DataFrame, year: int, month: int) -> pd.DataFrame:
+    dates = operations["Дата операции"]
+    selected: pd.DataFrame = operations[(dates.dt.year == year) & (dates.dt.month == month)]
+    return selected
+
+
+def test_parse_operation_validates_events(operations_data: pd.DataFrame) -> None:
+    event = frame_to_events(operations_data.head(1))[0]
+    operation = parse_operation(json.dumps(event, ensure_ascii=False))
+
+    assert operation["Дата операции"] == pd.Timestamp("2021-12-30 17:50:17")
+    assert operation["Кэшбэк"] is None
+    with pytest.raises(ValueError, match="Номер карты"):
+        parse_operation({key: value for key, value in event.items() if key != "Номер карты"})
+    with pytest.raises(ValueError, match="дата"):
+        parse_operation({**event, "Дата операции": "2021-12-30"})
+    with pytest.raises(ValueError, match="числом"):
+        parse_operation({**event, "Сумма операции": "много"})
+    with pytest.raises(ValueError, match="JSON"):
+        parse_operation("{не json")
+
+
+def test_streamed_aggregates_match_batch_functions(december: pd.DataFrame) -> None:
+    live = LiveAggregates()
+    accepted = live.add_many(frame_to_events(december) + ["", '{"broken": true}'])
+    month = _month(december, 2021, 12)
+    expected_cards = sorted(aggregate_card_data(month), key=lambda card: card["last_digits"])
+    expected_cashback = OperationsSnapshot(december, version=1, mtime_ns=None).cube.cashback_by_category(
+        [pd.Period("2021-12", freq="M")]
+    )
+
+    assert accepted == 600
+    assert live.stats() == {"accepted": 600, "rejected": 1}
+    assert [card["last_digits"] for card in live.card_totals(2021, 12)] == [
+        card["last_digits"] for card in expected_cards
+    ]
+    for card, expected in zip(live.card_totals(2021, 12), expected_cards):
+        assert card["total_spent"] == pytest.approx(expected["total_spent"])
+        assert card["cashback"] == pytest.approx(expected["cashback"])
+    assert live.top_transactions(2021, 12) == get_top_transactions(month)
+    assert live.cashback_by_category(2021, 12) == pytest.approx(expected_cashback.round(2).to_dict())
+
+
+def test_seeded_aggregates_follow_new_operations(december: pd.DataFrame) -> None:
+    snapshot = OperationsSnapshot(december.iloc[:500], version=1, mtime_ns=None)
+    live = LiveAggregates(snapshot)
+    live.add_many(frame_to_events(december.iloc[500:]))
+    page = json.loads(live.main_page("2021-12-31 23:59:59", deadline=None))
+    expected = json.loads(
+        get_main_page("2021-12-31 23:59:59", OperationsSnapshot(december, version=1, mtime_ns=None), deadline=None)
+    )
+
+    assert page["top_transactions"] == expected["top_transactions"]
+    assert [card["last_digits"] for card in page["cards"]] == [card["last_digits"] for card in expected["cards"]]
+    assert [card["total_spent"] for card in page["cards"]] == pytest.approx(
+        [card["total_spent"] for card in expected["cards"]]
+    )
+    assert json.loads(live.top_3_cashback(2021, 12)) == pytest.approx(
+        json.loads(top_3_cashback_categories(OperationsSnapshot(december, version=1, mtime_ns=None), 2021, 12))
+    )
+
+
+@pytest.mark.parametrize("seeded", [True, False])
+@pytest.mark.parametrize("time_str", ["2021-11-20 08:00:00", "2021-12-05 12:00:00", "2021-12-31 23:59:59"])
+def test_live_main_page_matches_get_main_page(december: pd.DataFrame, seeded: bool, time_str: str) -> None:
+    live = LiveAggregates(OperationsSnapshot(december.iloc[:500], version=1, mtime_ns=None) if seeded else None)
+    live.add_many(frame_to_events(december.iloc[500:] if seeded else december))
+    page = json.loads(live.main_page(time_str, deadline=None))
+    expected = json.loads(
+        get_main_page(time_str, OperationsSnapshot(december, version=1, mtime_ns=None), deadline=None)
+    )
+
+    assert page["top_transactions"] == expected["top_transactions"]
+    assert [card["last_digits"] for card in page["cards"]] == [card["last_digits"] for card in expected["cards"]]
+    assert [card["total_spent"] for card in page["cards"]] == pytest.approx(
+        [card["total_spent"] for card in expected["cards"]]
+    )
+    # Операции позже time_str на страницу не попадают
+    end = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S").date()
+    assert all(datetime.strptime(item["date"], "%d.%m.%Y").date() <= end for item in page["top_transactions"])
+
+
+def _rate_table(operations: pd.DataFrame) -> RateTable:
+    """Таблица курсов к рублю на каждый день операций, без обращения к API"""
+    dates = operations["Дата операции"]
+    days = pd.date_range(dates.min().normalize() - pd.Timedelta(days=10), dates.max().normalize())
+    base = {"USD": 75.0, "EUR": 85.0, "CNY": 11.5, "TRY": 5.5}
+    rates = pd.DataFrame(
+        [
+            (day, currency, rate * (1 + 0.001 * number))
+            for currency, rate in base.items()
+            for number, day in enumerate(days)
+        ],
+        columns=["date", "currency", "rate"],
+    )
+    rates["date"] = rates["date"].astype("datetime64[ns]")
+    table = RateTable()
+    table.add(rates, list(base), days[0], days[-1])
+    return table
+
+
+@pytest.mark.parametrize("time_str", ["2021-12-05 12:00:00", "2021-12-31 23:59:59"])
+def test_live_aggregates_report_in_reporting_currency(december: pd.DataFrame, time_str: str) -> None:
+    table = _rate_table(december)
+    live = LiveAggregates(
+        OperationsSnapshot(december.iloc[:500], version=1, mtime_ns=None), currency="USD", table=table
+    )
+    live.add_many(frame_to_events(december.iloc[500:]))
+    converted = OperationsSnapshot(december, version=1, mtime_ns=None).in_currency("USD", table)
+    page = json.loads(live.main_page(time_str, deadline=None))
+    expected = json.loads(get_main_page(time_str, converted, deadline=None))
+    original = json.loads(get_main_page(time_str, OperationsSnapshot(december, version=1, mtime_ns=None)))
+
+    # Живые агрегаты округляют суммы до копеек
+    assert [card["total_spent"] for card in page["cards"]] == pytest.approx(
+        [card["total_spent"] for card in expected["cards"]], abs=0.01
+    )
+    assert [item["amount"] for item in page["top_transactions"]] == pytest.approx(
+        [item["amount"] for item in expected["top_transactions"]], abs=0.01
+    )
+    assert page["cards"][0]["total_spent"] != pytest.approx(original["cards"][0]["total_spent"])
+    assert json.loads(live.top_3_cashback(2021, 12)) == pytest.approx(
+        json.loads(top_3_cashback_categories(converted, 2021, 12)), abs=0.01
+    )
+
+
+def test_socket_ingestion_and_live_service(december: pd.DataFrame) -> None:
+    live = LiveAggregates()
+    lines = [json.dumps(event, ensure_ascii=False) + "\n" for event in frame_to_events(december)]
+
+    async def scenario() -> Any:
+        server = await serve_stream(live, port=0)
+        host, port = server.sockets[0].getsockname()[:2]
+        _, writer = await asyncio.open_connection(host, port)
+        writer.write("".join(lines).encode("utf-8"))
+        await writer.drain()
+        writer.close()
+        for _ in range(100):
+            if live.accepted == len(lines):
+                break
+            await asyncio.sleep(0.02)
+        server.close()
+
+        service = MoneyScopeService(OperationsSnapshot(pd.DataFrame(), version=0, mtime_ns=None), live=live)
+        try:
+            return await service.dispatch("GET", "/cashback?year=2021&month=12")
+        finally:
+            await service.close()
+
+    status, body = asyncio.run(scenario())
+
+    assert live.accepted == 600
+    assert status == 200
+    assert json.loads(body) == json.loads(live.top_3_cashback(2021, 12))
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from moneyscope.synthetic import EXPORT_COLUMNS, generate_operations, iter_generated, load_synthetic, write_synthetic
+from moneyscope.utils import read_operations
+
+
+def test_generate_operations_matches_export_format() -> None:
+    df = generate_operations(2000, seed=1)
+    dates = pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S")
+
+    assert list(df.columns) == EXPORT_COLUMNS
+    assert len(df) == 2000
+    assert dates.is_monotonic_decreasing
+    assert dates.min() >= pd.Timestamp("2018-01-01") and dates.max() <= pd.Timestamp("2021-12-31 23:59:59")
+    assert df["Категория"].value_counts().index[0] == "Супермаркеты"
+    assert set(df["Валюта операции"]) <= {"RUB", "TRY", "EUR", "CNY", "USD"}
+    # Кэшбэк начисляется только за успешные расходы
+    assert (df.loc[df["Кэшбэк"].notna(), "Сумма платежа"] < 0).all()
+    pd.testing.assert_frame_equal(df, generate_operations(2000, seed=1))
+
+
+def test_iter_generated_chunks_stay_sorted() -> None:
+    chunks = list(iter_generated(25, chunk_rows=10))
+    dates = pd.to_datetime(pd.concat(chunks)["Дата операции"], format="%d.%m.%Y %H:%M:%S")
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert dates.is_monotonic_decreasing
+
+
+def test_write_synthetic_xlsx_and_parquet_read_the_same(tmp_path: Path) -> None:
+    xlsx = write_synthetic(tmp_path / "operations.xlsx", 300, seed=2)
+    parquet = write_synthetic(tmp_path / "operations.parquet", 300, seed=2)
+
+    from_xlsx = read_operations(xlsx, use_cache=False)
+    from_parquet = load_synthetic(parquet)
+
+    assert len(from_xlsx) == 300
+    pd.testing.assert_frame_equal(from_xlsx, from_parquet, check_categorical=False)
+
+    with pytest.raises(ValueError):
+        write_synthetic(tmp_path / "operations.csv", 10)
@@ -1,14 +1,31 @@
+import builtins
+import os
+import threading
+import time
+from pathlib import Path
 from unittest.mock import mock_open, patch
+from zipfile import BadZipFile
 from typing import Any
 
+import numpy as np
 import pandas as pd
+import pytest
 
 from moneyscope.utils import (
+    OperationsSnapshot,
+    OperationsStore,
+    aggregate_card_data,
+    apply_operations_schema,
     get_currency_rates,
     get_stock_prices,
     get_top_transactions,
+    iter_operations,
     load_user_settings,
+    memory_usage_report,
     read_operations,
+    select_operations,
+    write_atomic,
+    write_text_atomic,
 )
 
 
@@ -19,8 +36,37 @@ def test_read_operations(operations_data: pd.DataFrame, mocker: Any) -> None:
 
     result = read_operations()
 
-    # Проверяем, что данные были корректно загружены
-    pd.testing.assert_frame_equal(result.reset_index(drop=True), operations_data)
+    # Проверяем, что данные были корректно загружены и приведены к компактной схеме
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), apply_operations_schema(operations_data))
+
+
+def test_read_operations_compact_schema(operations_data: pd.DataFrame, mocker: Any) -> None:
+    mocker.patch("pandas.read_excel", return_value=operations_data.copy())
+
+    result = read_operations()
+
+    assert isinstance(result["Категория"].dtype, pd.CategoricalDtype)
+    assert isinstance(result["Номер карты"].dtype, pd.CategoricalDtype)
+    assert str(result["MCC"].dtype) == "Int16"
+    assert pd.isna(result["MCC"].iloc[0])
+    assert str(result["Бонусы (включая кэшбэк)"].dtype) == "Int32"
+
+
+def test_read_operations_money_as_kopecks(operations_data: pd.DataFrame, mocker: Any) -> None:
+    mocker.patch("pandas.read_excel", return_value=operations_data.copy())
+
+    result = read_operations(money_as_kopecks=True)
+
+    assert str(result["Сумма операции"].dtype) == "Int64"
+    assert result["Сумма операции"].tolist() == [17400000, -34900, -141140, -141140, -12000]
+
+
+def test_memory_usage_report(operations_data: pd.DataFrame) -> None:
+    report = memory_usage_report(operations_data)
+
+    assert set(report["columns"]) == set(operations_data.columns)
+    assert report["columns"]["Сумма операции"]["dtype"] == "float64"
+    assert report["total_bytes"] >= sum(column["bytes"] for column in report["columns"].values())
 
 
 def test_read_operations_missing_columns(mocker: Any) -> None:
@@ -38,6 +84,224 @@ def test_read_operations_missing_columns(mocker: Any) -> None:
     assert result.empty
 
 
+def test_read_operations_creates_and_uses_cache(operations_xlsx: Path, mocker: Any) -> None:
+    mocker.patch("moneyscope.utils.xlsx_path", operations_xlsx)
+
+    # Первое чтение разбирает XLSX и создаёт кэш рядом с файлом
+    first = read_operations()
+    assert (operations_xlsx.parent / "operations.xlsx.cache.parquet").is_file()
+
+    # Второе чтение не должно обращаться к XLSX
+    read_excel = mocker.patch("pandas.read_excel", side_effect=AssertionError("XLSX не должен читаться"))
+    second = read_operations()
+
+    read_excel.assert_not_called()
+    pd.testing.assert_frame_equal(second, first)
+    assert str(second["Дата операции"].dtype).startswith("datetime64")
+
+
+def test_read_operations_cache_invalidated_on_change(
+    operations_xlsx: Path, operations_data: pd.DataFrame, mocker: Any
+) -> None:
+    mocker.patch("moneyscope.utils.xlsx_path", operations_xlsx)
+    read_operations()
+
+    # Перезаписываем файл с меньшим числом строк — кэш должен устареть
+    df = operations_data.head(2).copy()
+    df["Дата операции"] = df["Дата операции"].dt.strftime("%d.%m.%Y %H:%M:%S")
+    df["Дата платежа"] = df["Дата платежа"].dt.strftime("%d.%m.%Y")
+    df.to_excel(operations_xlsx, index=False)
+
+    result = read_operations()
+    assert len(result) == 2
+
+
+def test_iter_operations_yields_converted_chunks(operations_xlsx: Path, mocker: Any) -> None:
+    mocker.patch("moneyscope.utils.xlsx_path", operations_xlsx)
+
+    chunks = list(iter_operations(chunk_size=2))
+
+    # 5 строк порциями по 2 — три порции, даты уже преобразованы
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert all(str(chunk["Дата операции"].dtype).startswith("datetime64") for chunk in chunks)
+    assert pd.isna(chunks[0]["Кэшбэк"].iloc[0])
+
+
+def test_iter_operations_missing_columns(tmp_path: Path, mocker: Any) -> None:
+    path = tmp_path / "broken.xlsx"
+    pd.DataFrame({"Дата операции": ["30.12.2021 17:50:17"], "Категория": ["Супермаркеты"]}).to_excel(path, index=False)
+    mocker.patch("moneyscope.utils.xlsx_path", path)
+
+    assert list(iter_operations()) == []
+
+
+def test_aggregate_card_data_from_chunks(operations_xlsx: Path, operations_data: pd.DataFrame, mocker: Any) -> None:
+    mocker.patch("moneyscope.utils.xlsx_path", operations_xlsx)
+
+    # Агрегация по порциям совпадает с агрегацией по целому DataFrame
+    assert aggregate_card_data(iter_operations(chunk_size=2)) == aggregate_card_data(operations_data)
+
+
+def test_operations_store_loads_once(operations_xlsx: Path, mocker: Any) -> None:
+    read_mock = mocker.patch("moneyscope.utils.read_operations", wraps=read_operations)
+    store = OperationsStore(operations_xlsx, check_interval=60)
+
+    first = store.snapshot()
+    second = store.snapshot()
+
+    assert first is second
+    assert read_mock.call_count == 1
+    assert len(first.operations) == 5
+
+
+def test_operations_store_snapshot_is_isolated(operations_xlsx: Path) -> None:
+    snapshot = OperationsStore(operations_xlsx).snapshot()
+
+    # Изменение полученного DataFrame не затрагивает снимок
+    operations = snapshot.operations
+    operations["new_column"] = 1
+
+    assert "new_column" not in snapshot.operations.columns
+
+
+def test_operations_store_reloads_changed_file(operations_xlsx: Path, operations_data: pd.DataFrame) -> None:
+    store = OperationsStore(operations_xlsx, check_interval=0)
+    old_snapshot = store.snapshot()
+
+    df = operations_data.head(2).copy()
+    df["Дата операции"] = df["Дата операции"].dt.strftime("%d.%m.%Y %H:%M:%S")
+    df["Дата платежа"] = df["Дата платежа"].dt.strftime("%d.%m.%Y")
+    df.to_excel(operations_xlsx, index=False)
+    assert old_snapshot.mtime_ns is not None
+    os.utime(operations_xlsx, ns=(old_snapshot.mtime_ns + 10**9, old_snapshot.mtime_ns + 10**9))
+
+    # Пока новый снимок грузится в фоне, читатели получают старый
+    assert store.snapshot() is old_snapshot
+
+    deadline = time.monotonic() + 10
+    while store.snapshot().version == old_snapshot.version and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    new_snapshot = store.snapshot()
+    assert new_snapshot.version == old_snapshot.version + 1
+    assert len(new_snapshot) == 2
+    assert len(old_snapshot) == 5
+
+
+def test_operations_store_keeps_snapshot_when_file_is_broken(operations_xlsx: Path) -> None:
+    store = OperationsStore(operations_xlsx, check_interval=0)
+    old_snapshot = store.snapshot()
+    assert old_snapshot.mtime_ns is not None
+
+    # Файл ещё дописывается: XLSX обрезан на середине
+    data = operations_xlsx.read_bytes()
+    operations_xlsx.write_bytes(data[: len(data) // 2])
+    os.utime(operations_xlsx, ns=(old_snapshot.mtime_ns + 10**9, old_snapshot.mtime_ns + 10**9))
+
+    with pytest.raises(BadZipFile):
+        store.reload()
+    assert store.snapshot() is old_snapshot
+    assert store._reload_thread is not None
+    store._reload_thread.join()
+    assert store.snapshot() is old_snapshot
+    assert len(old_snapshot) == 5
+
+    # Когда файл дописан, следующая проверка загружает новый снимок
+    operations_xlsx.write_bytes(data)
+    os.utime(operations_xlsx, ns=(old_snapshot.mtime_ns + 2 * 10**9, old_snapshot.mtime_ns + 2 * 10**9))
+    assert store.reload().version == old_snapshot.version + 1
+
+
+def test_operations_store_starts_empty_when_file_is_missing(tmp_path: Path) -> None:
+    store = OperationsStore(tmp_path / "operations.xlsx", check_interval=0)
+
+    assert store.snapshot().operations.empty
+
+
+def test_snapshot_is_sorted_and_selects_by_index(operations_data: pd.DataFrame) -> None:
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+    start, end = pd.Timestamp("2021-12-29 22:00:00"), pd.Timestamp("2021-12-30 14:48:25")
+
+    assert snapshot.operations["Дата операции"].is_monotonic_increasing
+
+    # Выборка по индексу совпадает с выборкой булевой маской, граница включается
+    result = snapshot.select(start, end)
+    assert result["Дата операции"].tolist() == sorted(
+        operations_data.loc[
+            (operations_data["Дата операции"] >= start) & (operations_data["Дата операции"] <= end), "Дата операции"
+        ]
+    )
+    assert len(result) == 3
+
+
+def test_snapshot_selects_category_range(operations_data: pd.DataFrame) -> None:
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+    result = snapshot.select(pd.Timestamp("2021-12-29 22:30:00"), pd.Timestamp("2021-12-31"), "Ж/д билеты")
+
+    assert result["Описание"].tolist() == ["РЖД"]
+    assert snapshot.select(pd.Timestamp("2021-12-01"), pd.Timestamp("2021-12-31"), "Одежда").empty
+
+
+def test_category_range_skips_rows_without_date(operations_data: pd.DataFrame) -> None:
+    undated = operations_data.head(2).copy()
+    undated["Дата операции"] = pd.NaT
+    snapshot = OperationsSnapshot(pd.concat([operations_data, undated], ignore_index=True), version=1, mtime_ns=None)
+    start, end = pd.Timestamp("2021-12-01"), pd.Timestamp("2021-12-31 23:59:59")
+    assert snapshot.index is not None
+
+    for category in operations_data["Категория"].unique():
+        positions = snapshot.index.category_range(category, start, end)
+        selected = snapshot.operations.iloc[positions]
+        assert selected["Дата операции"].notna().all()
+        assert len(selected) == (operations_data["Категория"] == category).sum()
+
+
+def test_select_operations_sorted_and_unsorted_frames(operations_data: pd.DataFrame) -> None:
+    start, end = pd.Timestamp("2021-12-29"), pd.Timestamp("2021-12-29 23:59:59")
+    sorted_data = operations_data.sort_values("Дата операции", ignore_index=True)
+
+    # Для отсортированного DataFrame используется двоичный поиск, для неотсортированного — маска
+    assert len(select_operations(sorted_data, start, end)) == 3
+    assert len(select_operations(operations_data, start, end)) == 3
+    assert len(select_operations(operations_data, start, end, "Фастфуд")) == 1
+
+
+def test_operations_store_append_updates_cube(operations_xlsx: Path, operations_data: pd.DataFrame) -> None:
+    store = OperationsStore(operations_xlsx, check_interval=60)
+    old_snapshot = store.snapshot()
+
+    new_snapshot = store.append(operations_data.iloc[[1]])
+
+    assert len(new_snapshot) == 6
+    assert new_snapshot.cube.data["count"].sum() == 6
+    assert old_snapshot.cube.data["count"].sum() == 5
+
+
+def test_operations_store_concurrent_appends_keep_all_rows(
+    operations_xlsx: Path, operations_data: pd.DataFrame
+) -> None:
+    store = OperationsStore(operations_xlsx, check_interval=60)
+    start = store.snapshot().version
+    barrier = threading.Barrier(8)
+
+    def append_rows() -> None:
+        barrier.wait()
+        for _ in range(5):
+            store.append(operations_data.iloc[[1, 2]])
+
+    threads = [threading.Thread(target=append_rows) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = store.snapshot()
+    assert len(snapshot) == 5 + 8 * 5 * 2
+    assert snapshot.cube.data["count"].sum() == len(snapshot)
+    assert snapshot.version == start + 8 * 5
+
+
 # Тест для функции get_top_transactions с данными
 def test_get_top_transactions_with_data(operations_data: pd.DataFrame) -> None:
     # Получаем результат
@@ -65,6 +329,40 @@ def test_get_top_transactions_with_data(operations_data: pd.DataFrame) -> None:
         assert res["description"] == expected["description"]
 
 
+def test_get_top_transactions_matches_full_sort() -> None:
+    # Частичный отбор даёт тот же результат, что и полная сортировка
+    rng = np.random.default_rng(0)
+    transactions = pd.DataFrame(
+        {
+            "Дата операции": pd.date_range("2021-01-01", periods=1000, freq="h"),
+            "Сумма платежа": rng.normal(0, 1000, 1000).round(2),
+            "Категория": rng.choice(["Супермаркеты", "Фастфуд", "Переводы"], 1000),
+            "Описание": "Магазин",
+        }
+    )
+
+    result = get_top_transactions(transactions, 10)
+
+    expected = transactions["Сумма платежа"].abs().sort_values(ascending=False).head(10)
+    assert [record["amount"] for record in result] == transactions.loc[expected.index, "Сумма платежа"].tolist()
+
+
+def test_get_top_transactions_by_group(operations_data: pd.DataFrame) -> None:
+    result = get_top_transactions(operations_data, 1, group_by="Номер карты")
+
+    assert isinstance(result, dict)
+    assert list(result) == ["*4556", "*5091", "*7197"]
+    assert result["*4556"] == [
+        {
+            "date": "30.12.2021",
+            "amount": 174000.0,
+            "category": "Пополнения",
+            "description": "Пополнение через Газпромбанк",
+        }
+    ]
+    assert result["*5091"][0]["amount"] == -120.0
+
+
 # Тест для функции get_top_transactions с пустыми данными
 def test_get_top_transactions_with_empty_data(empty_transactions_data: pd.DataFrame) -> None:
     # Проверяем, что с пустыми данными результат будет пустым
@@ -95,11 +393,27 @@ def test_load_user_settings_invalid_data(mocker: Any) -> None:
     assert result == {}
 
 
+def test_load_user_settings_cached_until_file_changes(tmp_path: Path, mocker: Any) -> None:
+    settings_file = tmp_path / "user_settings.json"
+    settings_file.write_text('{"user_currencies": ["USD"]}', encoding="utf-8")
+    mocker.patch("moneyscope.utils.user_settings_path", settings_file)
+    open_spy = mocker.spy(builtins, "open")
+
+    assert load_user_settings() == {"user_currencies": ["USD"]}
+    assert load_user_settings() == {"user_currencies": ["USD"]}
+    assert open_spy.call_count == 1
+
+    # После изменения файла настройки перечитываются
+    settings_file.write_text('{"user_currencies": ["USD", "EUR"]}', encoding="utf-8")
+    assert load_user_settings() == {"user_currencies": ["USD", "EUR"]}
+    assert open_spy.call_count == 2
+
+
 # Тест для функции get_currency_rates
 def test_get_currency_rates() -> None:
     # Мокаем успешный ответ от API
-    with patch("requests.get") as mock_requests_get, patch(
-            "builtins.open", mock_open(read_data='{"user_currencies": ["USD"], "user_stocks": ["AAPL"]}')
+    with patch("requests.Session.get") as mock_requests_get, patch(
+        "builtins.open", mock_open(read_data='{"user_currencies": ["USD"], "user_stocks": ["AAPL"]}')
     ):
         mock_requests_get.return_value.json.return_value = [{"price": 75.0}]
         mock_requests_get.return_value.status_code = 200
@@ -114,7 +428,9 @@ def test_get_currency_rates() -> None:
 # Тест для функции get_currency_rates без фикстур
 def test_get_currency_rates_no_settings() -> None:
     # Мокаем пустые пользовательские настройки
-    with patch("moneyscope.utils.load_user_settings", return_value={}), patch("requests.get") as mock_requests_get:
+    with patch("moneyscope.utils.load_user_settings", return_value={}), patch(
+        "requests.Session.get"
+    ) as mock_requests_get:
         result = get_currency_rates()
 
         # Проверяем, что результат пуст
@@ -125,8 +441,8 @@ def test_get_currency_rates_no_settings() -> None:
 # Тест для функции get_stock_prices
 def test_get_stock_prices() -> None:
     # Мокаем успешный ответ от API
-    with patch("requests.get") as mock_requests_get, patch(
-            "builtins.open", mock_open(read_data='{"user_currencies": ["USD"], "user_stocks": ["AAPL"]}')
+    with patch("requests.Session.get") as mock_requests_get, patch(
+        "builtins.open", mock_open(read_data='{"user_currencies": ["USD"], "user_stocks": ["AAPL"]}')
     ):
         mock_requests_get.return_value.json.return_value = [{"price": 150.0}]
         mock_requests_get.return_value.status_code = 200
@@ -140,9 +456,26 @@ def test_get_stock_prices() -> None:
 
 def test_get_stock_prices_no_settings() -> None:
     # Мокаем пустые пользовательские настройки и API-запросы
-    with patch("moneyscope.utils.load_user_settings", return_value={}), patch("requests.get") as mock_requests_get:
+    with patch("moneyscope.utils.load_user_settings", return_value={}), patch(
+        "requests.Session.get"
+    ) as mock_requests_get:
         result = get_stock_prices()
 
         # Проверяем, что результат пуст
         assert result == []
         mock_requests_get.assert_not_called()
+
+
+def test_write_atomic_keeps_previous_file_on_error(tmp_path: Path) -> None:
+    path = tmp_path / "data.json"
+    write_text_atomic(path, "старое")
+
+    def broken(tmp_file: Path) -> None:
+        tmp_file.write_text("половина", encoding="utf-8")
+        raise OSError("диск заполнен")
+
+    with pytest.raises(OSError):
+        write_atomic(path, broken)
+
+    assert path.read_text(encoding="utf-8") == "старое"
+    assert list(tmp_path.iterdir()) == [path]
@@ -1,9 +1,16 @@
 import json
+import threading
+import time
+from typing import Any
 from unittest.mock import patch
 
+import pandas as pd
 import pytest
 
-from moneyscope.views import get_main_page
+import moneyscope.views
+from moneyscope.synthetic import generate_operations
+from moneyscope.utils import OperationsSnapshot, _prepare_operations
+from moneyscope.views import get_main_page, get_main_pages
 
 
 @pytest.mark.parametrize(
@@ -54,3 +61,133 @@ def test_get_main_page_with_parametrization(
 
             # Проверяем приветствие
             assert parsed_result["greeting"] == expected_greeting
+
+
+def test_get_main_page_with_snapshot(operations_data: pd.DataFrame) -> None:
+    # Операции передаются снимком хранилища, файл не читается
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+    with patch("moneyscope.views.get_currency_rates", return_value=[]), patch(
+        "moneyscope.views.get_stock_prices", return_value=[]
+    ), patch("moneyscope.views.read_operations") as read_mock:
+        parsed_result = json.loads(get_main_page("2021-12-30 19:07:35", snapshot))
+
+    read_mock.assert_not_called()
+    assert len(parsed_result["cards"]) == 3
+    assert len(parsed_result["top_transactions"]) == 5
+
+
+def test_get_main_page_whole_month_uses_cube(operations_data: pd.DataFrame) -> None:
+    # Для целого месяца сводка по картам берётся из куба, строки не агрегируются
+    snapshot = OperationsSnapshot(operations_data, version=1, mtime_ns=None)
+
+    with patch("moneyscope.views.get_currency_rates", return_value=[]), patch(
+        "moneyscope.views.get_stock_prices", return_value=[]
+    ), patch("moneyscope.utils.aggregate_card_data") as aggregate_mock:
+        parsed_result = json.loads(get_main_page("2021-12-31 23:59:59", snapshot))
+
+    aggregate_mock.assert_not_called()
+    assert [card["last_digits"] for card in parsed_result["cards"]] == ["4556", "5091", "7197"]
+
+
+def test_get_main_pages_matches_get_main_page(operations_data: pd.DataFrame) -> None:
+    time_strs = ["2021-12-30 19:07:35", "2021-12-29 22:30:00", "2021-11-30 10:00:00", "не дата"]
+
+    with patch("moneyscope.views.get_currency_rates", return_value=[]) as rates_mock, patch(
+        "moneyscope.views.get_stock_prices", return_value=[]
+    ), patch("moneyscope.views.get_greeting", return_value="Доброй ночи"):
+        batch = get_main_pages(time_strs, operations_data)
+        single = {time_str: get_main_page(time_str, operations_data) for time_str in time_strs}
+
+    # Курсы запрашиваются один раз на весь пакет плюс по разу на каждый одиночный вызов
+    assert rates_mock.call_count == 1 + 2
+    assert list(batch) == time_strs
+    for time_str in time_strs:
+        assert json.loads(batch[time_str]) == json.loads(single[time_str])
+
+
+@pytest.mark.parametrize("as_snapshot", [False, True])
+def test_get_main_pages_matches_get_main_page_on_large_data(as_snapshot: bool) -> None:
+    # Тысячи сумм с копейками: накопленные суммы пакета и прямые суммы должны округляться одинаково
+    operations = _prepare_operations(generate_operations(5000, seed=7, start="2021-10-01 00:00:00"))
+    source: Any = OperationsSnapshot(operations, version=1, mtime_ns=None) if as_snapshot else operations
+    time_strs = ["2021-10-17 12:00:00", "2021-10-31 23:59:59", "2021-11-30 23:59:59", "2021-12-05 08:30:00"]
+
+    with patch("moneyscope.views.get_currency_rates", return_value=[]), patch(
+        "moneyscope.views.get_stock_prices", return_value=[]
+    ), patch("moneyscope.views.get_greeting", return_value="Доброй ночи"):
+        batch = get_main_pages(time_strs, source)
+        single = {time_str: get_main_page(time_str, source) for time_str in time_strs}
+
+    for time_str in time_strs:
+        assert json.loads(batch[time_str])["cards"]
+        assert json.loads(batch[time_str]) == json.loads(single[time_str])
+
+
+def test_get_main_pages_empty_data(empty_operations_data: pd.DataFrame) -> None:
+    batch = get_main_pages(["2021-12-30 19:07:35"], empty_operations_data)
+
+    assert json.loads(batch["2021-12-30 19:07:35"]) == {"error": "Нет операций для обработки"}
+
+
+def test_get_main_page_deadline_returns_last_known_quotes(
+    operations_data: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Медленные цены акций не задерживают ответ: отдаются последние известные данные с пометкой
+    monkeypatch.setattr(moneyscope.views, "_last_sections", {"stock_prices": [{"stock": "AAPL", "price": 140.0}]})
+
+    def slow_stock_prices() -> Any:
+        time.sleep(0.5)
+        return [{"stock": "AAPL", "price": 150.0}]
+
+    with patch("moneyscope.views.get_currency_rates", return_value=[{"currency": "USD", "rate": 75.0}]), patch(
+        "moneyscope.views.get_stock_prices", side_effect=slow_stock_prices
+    ):
+        started = time.perf_counter()
+        parsed_result = json.loads(get_main_page("2021-12-30 19:07:35", operations_data, deadline=0.1))
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < 0.4
+        assert parsed_result["partial_sections"] == ["stock_prices"]
+        assert parsed_result["stock_prices"] == [{"stock": "AAPL", "price": 140.0}]
+        assert parsed_result["currency_rates"] == [{"currency": "USD", "rate": 75.0}]
+        assert len(parsed_result["cards"]) == 3
+
+        # Опоздавший ответ запоминается и отдаётся при следующем запросе
+        time.sleep(0.6)
+        next_result = json.loads(get_main_page("2021-12-30 19:07:35", operations_data, deadline=0.1))
+
+    assert next_result["stock_prices"] == [{"stock": "AAPL", "price": 150.0}]
+
+
+def test_get_main_page_without_deadline_waits_for_all_sections(
+    operations_data: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(moneyscope.views, "_last_sections", {})
+
+    def slow_currency_rates() -> Any:
+        time.sleep(0.2)
+        return [{"currency": "USD", "rate": 75.0}]
+
+    with patch("moneyscope.views.get_currency_rates", side_effect=slow_currency_rates), patch(
+        "moneyscope.views.get_stock_prices", return_value=[]
+    ):
+        # По умолчанию срока нет: ответ дожидается всех разделов
+        parsed_result = json.loads(get_main_page("2021-12-30 19:07:35", operations_data))
+
+    assert "partial_sections" not in parsed_result
+    assert parsed_result["currency_rates"] == [{"currency": "USD", "rate": 75.0}]
+
+
+def test_get_main_page_fetches_quotes_in_separate_pool(operations_data: pd.DataFrame) -> None:
+    def thread_name() -> Any:
+        return [{"currency": threading.current_thread().name, "rate": 75.0}]
+
+    with patch("moneyscope.views.get_currency_rates", side_effect=thread_name), patch(
+        "moneyscope.views.get_stock_prices", return_value=[]
+    ), patch("moneyscope.views.get_top_transactions", side_effect=lambda df: threading.current_thread().name):
+        parsed_result = json.loads(get_main_page("2021-12-30 19:07:35", operations_data))
+
+    assert parsed_result["currency_rates"][0]["currency"].startswith("main_page_quotes")
+    assert parsed_result["top_transactions"].startswith("main_page_")
+    assert not parsed_result["top_transactions"].startswith("main_page_quotes")